@@ -0,0 +1,127 @@
+'''
+Endpoint benchmark against the mock Iress server (pyiress.mock), run in a
+separate process so that it does not share the GIL or the traced memory.
+
+For every endpoint and universe size it reports call count, rows, throughput,
+per-call latency percentiles and the peak Python memory (tracemalloc) of the
+run.
+
+    python benchmarks/bench_endpoints.py --sizes 10,100,500 --latency 0.005 --page-size 1000
+'''
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+# Run from a checkout without installing pyiress
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pyiress import Iress
+
+START, END = pd.Timestamp('2005-01-01'), pd.Timestamp('2020-01-01')
+
+
+def _per_ticker(call):
+    '''Endpoint run as one call per ticker.'''
+    def run(iress, tickers, args):
+        latencies, rows = [], 0
+        for ticker in tickers:
+            t0 = time.perf_counter()
+            rows += len(call(iress, ticker))
+            latencies.append(time.perf_counter() - t0)
+        return latencies, rows
+    return run
+
+
+def _single(call):
+    '''Endpoint run as one call for the whole universe.'''
+    def run(iress, tickers, args):
+        t0 = time.perf_counter()
+        rows = len(call(iress, tickers, args))
+        return [time.perf_counter() - t0], rows
+    return run
+
+
+ENDPOINTS = [
+    ('time_series', _per_ticker(lambda iress, t: iress.time_series(START, END, t, 'ASX'))),
+    ('time_series_intraday', _per_ticker(lambda iress, t: iress.time_series_intraday(
+        t, 'ASX', pd.Timestamp('2019-11-01'), pd.Timestamp('2019-12-31'), interval=1))),
+    ('dividends', _per_ticker(lambda iress, t: iress.dividends(t, 'ASX', START, END))),
+    ('market_cap', _single(lambda iress, tickers, args: iress.MarketCapitalizationHistorical(
+        'XJO', None, None, pd.Timestamp('2019-01-01'), pd.Timestamp('2019-12-31')))),
+    ('get_quotes', _single(lambda iress, tickers, args: iress.get_quotes(tickers=['%s.ASX' % t for t in tickers]))),
+    ('get_many', _single(lambda iress, tickers, args: iress.get_many(
+        START, END, 'time_series', tickers, 'ASX', workers=args.workers))),
+]
+
+
+def _report(name, size, latencies, rows, elapsed, peak):
+    latencies = np.array(latencies) * 1000
+    print('%-22s %6d %6d %9d %10.0f %8.1f %8.1f %8.1f %9.1f' % (
+        name, size, len(latencies), rows, rows / elapsed if elapsed else 0,
+        np.percentile(latencies, 50), np.percentile(latencies, 95), np.percentile(latencies, 99), peak / 2 ** 20))
+
+
+def _start_server(args):
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    process = subprocess.Popen([sys.executable, '-m', 'pyiress.mock', '--port', str(port),
+                                '--latency', str(args.latency), '--page-size', str(args.page_size),
+                                '--fault-rate', str(args.fault_rate)], stdout=subprocess.DEVNULL,
+                               env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+    url = 'http://127.0.0.1:%d/wsdl.aspx?un=user&cp=company&svc=IRESS&svr=&pw=password' % port
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url).read()
+            return process, url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('mock server did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,100', help='comma separated universe sizes')
+    parser.add_argument('--latency', type=float, default=0.0, help='mock server latency per request (s)')
+    parser.add_argument('--page-size', type=int, default=1000, help='mock TimeSeriesGet2 page size')
+    parser.add_argument('--fault-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=8, help='workers for get_many')
+    parser.add_argument('--endpoints', default=','.join(name for name, run in ENDPOINTS))
+    parser.add_argument('--slow-decode', action='store_true', help='decode through zeep objects')
+    args = parser.parse_args()
+
+    selected = args.endpoints.split(',')
+    server, url = _start_server(args)
+    try:
+        iress = Iress('company', 'user', 'password', url=url, wsdl_cache=False,
+                      fast_decode=not args.slow_decode, pool_size=args.workers, sessions=args.workers)
+        print('%-22s %6s %6s %9s %10s %8s %8s %8s %9s' % (
+            'endpoint', 'size', 'calls', 'rows', 'rows/s', 'p50 ms', 'p95 ms', 'p99 ms', 'peak MB'))
+        for size in [int(s) for s in args.sizes.split(',')]:
+            tickers = ['S%04d' % i for i in range(size)]
+            for name, run in ENDPOINTS:
+                if name not in selected:
+                    continue
+                tracemalloc.start()
+                t0 = time.perf_counter()
+                latencies, rows = run(iress, tickers, args)
+                elapsed = time.perf_counter() - t0
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                _report(name, size, latencies, rows, elapsed, peak)
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
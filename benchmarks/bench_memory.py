@@ -0,0 +1,85 @@
+'''
+Memory benchmark of field projection and compact frames against the mock
+Iress server (pyiress.mock).
+
+For every endpoint it runs the same request with all columns, with only
+--fields, with compact=True and with both, and reports the rows, the size of
+the returned frame (memory_usage(deep=True)), the peak Python memory of the
+call (tracemalloc) and the time taken.
+
+    python benchmarks/bench_memory.py --size 200 --fields ClosePrice,TotalVolume
+'''
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+# Run from a checkout without installing pyiress
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_endpoints import _start_server
+from pyiress import Iress
+
+START, END = pd.Timestamp('2005-01-01'), pd.Timestamp('2020-01-01')
+
+ENDPOINTS = [
+    ('get_many', lambda iress, tickers, fields, args: iress.get_many(
+        START, END, 'time_series', tickers, 'ASX', workers=args.workers, fields=fields)),
+    ('get_quotes', lambda iress, tickers, fields, args: iress.get_quotes(
+        tickers=['%s.ASX' % t for t in tickers], fields=fields and ['LastPrice', 'TotalVolume'])),
+    ('market_cap', lambda iress, tickers, fields, args: iress.MarketCapitalizationHistorical(
+        'XJO', None, None, pd.Timestamp('2015-01-01'), pd.Timestamp('2019-12-31'),
+        fields=fields and ['MarketCapitalizationDate', 'SecurityCode', 'MarketWeightEndOfDay'])),
+]
+
+MODES = [('all columns', False, False), ('fields', True, False), ('compact', False, True),
+         ('fields+compact', True, True)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=100, help='universe size')
+    parser.add_argument('--fields', default='ClosePrice,TotalVolume', help='time series fields requested')
+    parser.add_argument('--latency', type=float, default=0.0, help='mock server latency per request (s)')
+    parser.add_argument('--page-size', type=int, default=1000, help='mock TimeSeriesGet2 page size')
+    parser.add_argument('--fault-rate', type=float, default=0.0)
+    parser.add_argument('--workers', type=int, default=8, help='workers for get_many')
+    parser.add_argument('--endpoints', default=','.join(name for name, run in ENDPOINTS))
+    args = parser.parse_args()
+
+    selected = args.endpoints.split(',')
+    fields = args.fields.split(',')
+    tickers = ['S%04d' % i for i in range(args.size)]
+    server, url = _start_server(args)
+    try:
+        clients = dict((compact, Iress('company', 'user', 'password', url=url, wsdl_cache=False, metrics=False,
+                                       compact=compact, pool_size=args.workers, sessions=args.workers))
+                       for compact in (False, True))
+        print('%-12s %-16s %9s %12s %10s %9s %8s' % ('endpoint', 'mode', 'rows', 'frame MB', 'saved', 'peak MB',
+                                                    'seconds'))
+        for name, run in ENDPOINTS:
+            if name not in selected:
+                continue
+            baseline = None
+            for mode, project, compact in MODES:
+                tracemalloc.start()
+                t0 = time.perf_counter()
+                df = run(clients[compact], tickers, fields if project else None, args)
+                elapsed = time.perf_counter() - t0
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                # memory_usage includes the index
+                size = df.memory_usage(deep=True).sum()
+                baseline = size if baseline is None else baseline
+                print('%-12s %-16s %9d %12.2f %9.0f%% %9.1f %8.2f' % (
+                    name, mode, len(df), size / 2 ** 20, 100.0 * (1 - size / baseline), peak / 2 ** 20, elapsed))
+                del df
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
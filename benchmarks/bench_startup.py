@@ -0,0 +1,86 @@
+'''
+Startup benchmark: time to a usable Iress object with a cold and a warm WSDL
+cache.
+
+    python benchmarks/bench_startup.py --company <> --user <> --password <>
+    python benchmarks/bench_startup.py --url <wsdl url> ...
+    python benchmarks/bench_startup.py --mock
+
+Each measurement runs in a fresh interpreter so that the in-process WSDL
+memo does not hide the cost of the on-disk cache.
+'''
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Run from a checkout without installing pyiress
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _child(args):
+    t0 = time.perf_counter()
+    from pyiress import Iress
+    t1 = time.perf_counter()
+    kwargs = {'wsdl_cache': args.cache or False, 'lazy': args.lazy}
+    if args.url:
+        kwargs['url'] = args.url
+    iress = Iress(args.company, args.user, args.password, **kwargs)
+    t2 = time.perf_counter()
+    Iress(args.company, args.user, args.password, **kwargs)
+    t3 = time.perf_counter()
+    print(json.dumps({'import': t1 - t0, 'construct': t2 - t1, 'construct_again': t3 - t2}))
+    return iress
+
+
+def _run(args, cache, lazy=False):
+    cmd = [sys.executable, __file__, '--child', '--company', args.company, '--user', args.user,
+           '--password', args.password]
+    if args.url:
+        cmd += ['--url', args.url]
+    if cache:
+        cmd += ['--cache', cache]
+    if lazy:
+        cmd += ['--lazy']
+    out = subprocess.check_output(cmd, env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+    return json.loads(out.decode().strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--company', default=os.environ.get('IRESS_COMPANY', ''))
+    parser.add_argument('--user', default=os.environ.get('IRESS_USER', ''))
+    parser.add_argument('--password', default=os.environ.get('IRESS_PASSWORD', ''))
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--cache', default=None)
+    parser.add_argument('--lazy', action='store_true')
+    parser.add_argument('--mock', action='store_true', help='run against pyiress.mock.MockIressServer')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args)
+        return
+
+    server = None
+    if args.mock:
+        from pyiress.mock import MockIressServer
+        server = MockIressServer().start()
+        args.url = server.url
+
+    cache = os.path.join(tempfile.mkdtemp(), 'wsdl.sqlite')
+    rows = [('no cache', _run(args, None)),
+            ('cold cache', _run(args, cache)),
+            ('warm cache', _run(args, cache)),
+            ('lazy', _run(args, cache, lazy=True))]
+    print('%-12s %10s %12s %18s' % ('', 'import s', 'construct s', 'same process s'))
+    for name, r in rows:
+        print('%-12s %10.3f %12.3f %18.3f' % (name, r['import'], r['construct'], r['construct_again']))
+    if server is not None:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
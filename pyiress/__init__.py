@@ -1,2 +1,5 @@
 ### Dummy __init__ file
 from .pyiress import *
+from .panel import Panel, PanelBuilder
+from .constituents import IndexConstituents, IndexHistory
+from .adjust import AdjustmentEngine
@@ -0,0 +1,89 @@
+'''
+Command line tools.
+
+    python -m pyiress export --out history --exchange JSE --tickers AGL,BIL --start 2000-01-01 --end 2020-12-31
+    python -m pyiress export --out history --exchange JSE --tickers-file universe.txt --data-types time_series,dividends
+
+Credentials are taken from --company/--user/--password or the IRESS_COMPANY,
+IRESS_USER and IRESS_PASSWORD environment variables.
+'''
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+from .export import EXPORT_DATA_TYPES, export
+from .pyiress import Iress
+
+
+def _tickers(args):
+    tickers = [t.strip() for t in args.tickers.split(',')] if args.tickers else []
+    if args.tickers_file:
+        with open(args.tickers_file) as f:
+            tickers += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return list(dict.fromkeys(t for t in tickers if t))
+
+
+def _export(args):
+    tickers = _tickers(args)
+    if not tickers:
+        sys.exit('no tickers given (--tickers or --tickers-file)')
+    kwargs = {'url': args.url} if args.url else {}
+    iress = Iress(args.company, args.user, args.password, sessions=args.workers, pool_size=args.workers,
+                  rate_limit=args.rate_limit, **kwargs)
+
+    def progress(record):
+        progress.count += 1
+        line = '[%d] %s %s %s' % (progress.count, record['data_type'], record['ticker'], record['status'])
+        if record['status'] == 'done':
+            line += ' %d rows' % record['rows']
+        else:
+            line += ' ' + record['error']
+        print(line, flush=True)
+    progress.count = 0
+
+    summary = export(iress, args.out, tickers, pd.Timestamp(args.start), pd.Timestamp(args.end),
+                     exchange=args.exchange, data_types=args.data_types.split(','), freq=args.freq,
+                     workers=args.workers, writers=args.writers, resume=not args.restart,
+                     progress=None if args.quiet else progress)
+    print('done %d, skipped %d, failed %d, %d rows in %d files, %.1fs' % (
+        summary['done'], summary['skipped'], len(summary['failed']), summary['rows'], summary['files'],
+        summary['elapsed']))
+    return 1 if summary['failed'] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m pyiress', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+
+    p = commands.add_parser('export', help='export history to Parquet files partitioned by exchange and year')
+    p.add_argument('--company', default=os.environ.get('IRESS_COMPANY', ''))
+    p.add_argument('--user', default=os.environ.get('IRESS_USER', ''))
+    p.add_argument('--password', default=os.environ.get('IRESS_PASSWORD', ''))
+    p.add_argument('--url', default=None, help='custom WSDL url')
+    p.add_argument('--out', required=True, help='output directory')
+    p.add_argument('--tickers', default='', help='comma separated tickers')
+    p.add_argument('--tickers-file', default=None, help='file with one ticker per line')
+    p.add_argument('--exchange', default='')
+    p.add_argument('--start', required=True)
+    p.add_argument('--end', default=pd.Timestamp.today().strftime('%Y-%m-%d'))
+    p.add_argument('--data-types', default='time_series', help='comma separated, from %s' % ', '.join(EXPORT_DATA_TYPES))
+    p.add_argument('--freq', default='daily')
+    p.add_argument('--workers', type=int, default=4)
+    p.add_argument('--writers', type=int, default=2)
+    p.add_argument('--rate-limit', type=float, default=None, help='SOAP requests per second')
+    p.add_argument('--restart', action='store_true', help='ignore the manifest and export every ticker again')
+    p.add_argument('--quiet', action='store_true')
+    p.set_defaults(run=_export)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 2
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
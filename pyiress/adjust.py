@@ -0,0 +1,216 @@
+import numpy as np
+import pandas as pd
+
+from .panel import Panel
+
+
+class AdjustmentEngine(object):
+    '''
+    Split-adjusted and dividend-reinvested (total return) series for many
+    tickers at once, from the output of get_many.
+
+        engine = AdjustmentEngine()
+        engine.update(iress.get_many(start, end, 'time_series', tickers, 'JSE'),
+                      iress.get_many(start, end, 'dividends', tickers, 'JSE'))
+        engine.adjusted_close()        # dates x tickers, back-adjusted to the last date
+        engine.total_return()          # dates x tickers, 1.0 on the first price of each ticker
+        ...
+        engine.update(new_days, new_dividends)     # only the new rows are computed
+
+    factor - how AdjustmentFactor is read:
+             'event': the factor of the capital change effective that day
+                      (1.0 or NaN on other days). Prices before the day
+                      times the factor are comparable with prices after it.
+             'cumulative': prices times the factor of their row are
+                           comparable across the whole history.
+    dividend_field - dividend column added back on the ex-dividend date
+                     (DividendAmount or AdjustedDividendAmount)
+
+    Everything is kept in units of a share held since the first date: F is
+    the number of shares it has become (the cumulative product of 1 / event
+    factor) and CD the cumulative dividends paid on them. Returns are ratios of P*F + CD, so each
+    update only needs the last row of F, CD and of the total return index.
+    A capital change after the last update rescales the adjusted prices at
+    read time (one broadcast division by the current F), not by recomputing
+    the history.
+
+    Dividends with an ex date after the last price date are kept for the
+    next update. Rows dated on or before the last update are ignored.
+    '''
+    def __init__(self, factor='event', dividend_field='DividendAmount', price_field='ClosePrice',
+                 factor_field='AdjustmentFactor'):
+        if factor not in ('event', 'cumulative'):
+            raise ValueError("factor must be 'event' or 'cumulative'")
+        self.factor = factor
+        self.dividend_field = dividend_field
+        self.price_field = price_field
+        self.factor_field = factor_field
+        self.tickers = pd.Index([], name='ticker', dtype=object)
+        self.dates = np.empty(0, dtype='datetime64[ns]')
+        # per ticker state after the last row
+        self._F = np.empty(0)          # shares per original share
+        self._CD = np.empty(0)         # cumulative dividends per original share
+        self._V = np.empty(0)          # last valid price per original share
+        self._CDV = np.empty(0)        # CD at the last valid price
+        self._TR = np.empty(0)         # total return index at the last valid price
+        self._A = np.empty(0)          # last cumulative AdjustmentFactor ('cumulative' mode)
+        self._pending = None           # dividends dated after self.dates[-1]
+        # history, appended as row blocks and consolidated on read
+        self._blocks = {'close': [], 'F': [], 'TR': []}
+
+    def update(self, prices, dividends=None):
+        '''
+        Append new days.
+
+        prices - get_many(..., 'time_series') frame indexed on (date, ticker),
+                 or a Panel with price_field (and factor_field if present)
+        dividends - get_many(..., 'dividends') frame indexed on
+                    (ExDividendDate, ticker), or None
+        '''
+        dates, tickers, close, factors = self._wide_prices(prices)
+        self._add_tickers(tickers)
+        if dividends is not None and len(dividends) > 0:
+            dividends = dividends[[self.dividend_field]].dropna()
+            if self._pending is not None:
+                # the rows given for an (ex date, ticker) replace those held for it
+                held = self._pending[~self._pending.index.isin(dividends.index)]
+                dividends = pd.concat([held, dividends])
+            self._pending = dividends
+        if len(self.dates):
+            keep = dates > self.dates[-1]
+            dates, close, factors = dates[keep], close[keep], factors[keep]
+        if len(dates) == 0:
+            return self
+
+        cols = self.tickers.get_indexer(tickers)
+        n, m = len(dates), len(self.tickers)
+        P = np.full((n, m), np.nan)
+        P[:, cols] = close
+        A = np.full((n, m), np.nan)
+        A[:, cols] = factors
+        D = self._wide_dividends(dates, m)
+
+        if self.factor == 'event':
+            r = np.where(np.isnan(A) | (A <= 0), 1.0, A)
+        else:
+            # event factor = previous cumulative factor / this one
+            A = np.where(A > 0, A, np.nan)
+            filled = _ffill(A, self._A)
+            previous = np.vstack([self._A[None, :], filled[:-1]])
+            r = np.where(np.isnan(previous) | np.isnan(filled), 1.0, previous / filled)
+            self._A = filled[-1]
+
+        F = self._F / np.cumprod(r, axis=0)
+        CD = self._CD + np.cumsum(D * F, axis=0)
+        V = P * F
+        valid = ~np.isnan(V)
+
+        # value and cumulative dividends at the last valid row before each row
+        last = np.maximum.accumulate(np.where(valid, np.arange(n)[:, None], -1), axis=0)
+        before = np.empty_like(last)
+        before[0] = -1
+        before[1:] = last[:-1]
+        first = before < 0
+        flat = (np.maximum(before, 0) * m + np.arange(m)).ravel()
+        V_before = np.where(first, self._V, V.ravel().take(flat).reshape(n, m))
+        CD_before = np.where(first, self._CDV, CD.ravel().take(flat).reshape(n, m))
+        R = np.where(valid & ~np.isnan(V_before), (V + CD - CD_before) / V_before, 1.0)
+        TR = np.where(np.isnan(self._TR), 1.0, self._TR) * np.cumprod(R, axis=0)
+        TR[~valid] = np.nan
+
+        has = last[-1] >= 0
+        self._V = np.where(has, V[np.maximum(last[-1], 0), np.arange(m)], self._V)
+        self._CDV = np.where(has, CD[np.maximum(last[-1], 0), np.arange(m)], self._CDV)
+        self._TR = np.where(has, TR[np.maximum(last[-1], 0), np.arange(m)], self._TR)
+        self._F = F[-1]
+        self._CD = CD[-1]
+        self.dates = np.concatenate([self.dates, dates])
+        for name, block in (('close', P), ('F', F), ('TR', TR)):
+            self._blocks[name].append(block)
+        return self
+
+    def _wide_prices(self, prices):
+        if isinstance(prices, Panel):
+            close = prices.values[self.price_field]
+            factors = prices.values[self.factor_field] if self.factor_field in prices else np.full(close.shape, np.nan)
+            return prices.dates.to_numpy(dtype='datetime64[ns]'), list(prices.tickers), close, factors
+        columns = [self.price_field] + ([self.factor_field] if self.factor_field in prices else [])
+        wide = prices[columns].unstack(1).sort_index()
+        close = wide[self.price_field]
+        factors = wide[self.factor_field] if self.factor_field in prices else close * np.nan
+        return (pd.DatetimeIndex(wide.index).to_numpy(dtype='datetime64[ns]'), list(close.columns),
+                close.to_numpy(dtype=np.float64), factors.to_numpy(dtype=np.float64))
+
+    def _add_tickers(self, tickers):
+        tickers = pd.Index(list(dict.fromkeys(tickers)), dtype=object)
+        new = list(tickers[self.tickers.get_indexer(tickers) < 0])
+        if not new:
+            return
+        k = len(new)
+        self.tickers = self.tickers.append(pd.Index(new, dtype=object, name='ticker'))
+        self._F = np.append(self._F, np.ones(k))
+        self._CD = np.append(self._CD, np.zeros(k))
+        self._CDV = np.append(self._CDV, np.zeros(k))
+        self._V = np.append(self._V, np.full(k, np.nan))
+        self._TR = np.append(self._TR, np.full(k, np.nan))
+        self._A = np.append(self._A, np.full(k, np.nan))
+        fill = {'close': np.nan, 'F': 1.0, 'TR': np.nan}
+        for name, blocks in self._blocks.items():
+            for i, block in enumerate(blocks):
+                blocks[i] = np.hstack([block, np.full((len(block), k), fill[name])])
+
+    def _wide_dividends(self, dates, m):
+        '''Dividends on the price dates (an ex date off the calendar counts on the next date).'''
+        D = np.zeros((len(dates), m))
+        if self._pending is None or len(self._pending) == 0:
+            return D
+        ex_dates = pd.DatetimeIndex(self._pending.index.get_level_values(0)).tz_localize(None).to_numpy(
+            dtype='datetime64[ns]')
+        tickers = self.tickers.get_indexer(self._pending.index.get_level_values(1))
+        amounts = self._pending[self.dividend_field].to_numpy(dtype=np.float64)
+        rows = np.searchsorted(dates, ex_dates, 'left')
+        previous = self.dates[-1] if len(self.dates) else None
+        stale = (tickers < 0) if previous is None else (tickers < 0) | (ex_dates <= previous)
+        later = rows >= len(dates)
+        use = ~stale & ~later
+        np.add.at(D, (rows[use], tickers[use]), amounts[use])
+        self._pending = self._pending[~stale & later]
+        return D
+
+    def _history(self, name):
+        blocks = self._blocks[name]
+        if len(blocks) > 1:
+            blocks[:] = [np.vstack(blocks)]
+        return blocks[0] if blocks else np.empty((0, len(self.tickers)))
+
+    def _frame(self, values):
+        return pd.DataFrame(values, index=pd.DatetimeIndex(self.dates, name='date'), columns=self.tickers)
+
+    def close(self):
+        '''Raw prices, dates x tickers.'''
+        return self._frame(self._history('close'))
+
+    def shares(self):
+        '''Shares held on each date per share held on the first date.'''
+        return self._frame(self._history('F'))
+
+    def adjusted_close(self):
+        '''Prices adjusted for capital changes, comparable with the last price.'''
+        return self._frame(self._history('close') * self._history('F') / self._F)
+
+    def total_return(self):
+        '''Dividend reinvested total return index, 1.0 on the first price of each ticker.'''
+        return self._frame(self._history('TR'))
+
+    def total_return_close(self):
+        '''Total return index scaled to end on the last price (dividend and split adjusted prices).'''
+        last_price = self._V / self._F
+        return self._frame(self._history('TR') * (last_price / self._TR))
+
+
+def _ffill(values, initial):
+    '''Forward fill NaNs down the rows of values, starting from the row initial.'''
+    values = np.vstack([initial[None, :], values])
+    rows = np.arange(len(values))[:, None]
+    last = np.maximum.accumulate(np.where(np.isnan(values), 0, rows), axis=0)
+    return values[last, np.arange(values.shape[1])[None, :]][1:]
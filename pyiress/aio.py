@@ -0,0 +1,374 @@
+'''
+asyncio client for the Iress web services, built on zeep's AsyncClient and
+httpx. Every coroutine shares one connection pool and one Iress session, and
+a semaphore bounds the number of SOAP requests in flight.
+
+    import asyncio
+    from pyiress.aio import AsyncIress
+
+    async def main():
+        async with AsyncIress(companyname, username, password, max_concurrency=16) as iress:
+            data = await iress.get_many(start_date, end_date, 'time_series', tickers, 'JSE')
+
+    asyncio.run(main())
+
+Cancelling a coroutine cancels the requests it has in flight. When one of
+the requests a method makes concurrently (intraday windows, quote chunks)
+fails, the others are cancelled and the error raised, unless the client was
+created with raise_on_error=False: then, as for Iress, the data received is
+returned with attrs['partial'].
+'''
+import asyncio
+import time
+import warnings
+
+import httpx
+import zeep
+from lxml import etree
+from zeep.transports import AsyncTransport
+import pandas as pd
+
+from .decode import decode_rows
+from .metrics import REGISTRY, new_record, run_hooks
+from .panel import PanelBuilder
+from .pyiress import (PyIressException, CircuitOpenError, WSDL_URL_GENERIC, WSDL_CACHE_TIMEOUT, MANY_DATE_FIELDS,
+                      QUOTE_KEY_COLUMNS, _columns,
+                      _WsdlCache, _wsdl_document, intraday_window, _split_range, _securitytext,
+                      _time_series_parameters, _page_after, _index_on, _dividend_parameters,
+                      _market_cap_parameters, _intraday_parameters, _intraday_frame, _intraday_result,
+                      _quote_requests, _quote_result, _many_failed, _many_partial, _many_frame, _error_text,
+                      _partial, _pages_frame)
+from .retry import CircuitBreaker, RetryPolicy
+from .session import session_expired
+
+
+class AsyncIress(object):
+    def __init__(self, companyname, username, password, service='IRESS', proxy=None, pool_size=10,
+                 max_concurrency=10, timeout=300, wsdl_cache=True, metrics=True, retry=True, circuit_breaker=None,
+                 compact=False, raise_on_error=True, **kwargs):
+        '''
+        companyname / username / password - credentials for the Iress account.
+        service - only service for desktop version is IRESS.
+        proxy - optional HTTP proxy url used for all requests
+        pool_size - number of keep-alive HTTP connections
+        max_concurrency - maximum number of SOAP requests in flight
+        timeout - seconds allowed for one SOAP request, unless retry sets a
+                  timeout for the operation
+        wsdl_cache - as for Iress. The WSDL is loaded synchronously by
+                     connect() and shared with Iress objects of the process.
+        metrics - as for Iress. The network time of a record includes
+                  building the request envelope and the time waiting for
+                  a free connection; request_bytes is not measured.
+        retry / circuit_breaker - as for Iress, backing off with asyncio.sleep
+        compact - as for Iress
+        raise_on_error - as for Iress: if False, a request that still fails
+                         after its retries gives the data received so far,
+                         with the failure in df.attrs['partial']
+
+        A custom WSDL url could be provided via "url" parameter. The session
+        is started by connect(), or on entering `async with`.
+        '''
+        self.services = [service]
+        self.last_status = None
+        self.registry = REGISTRY if metrics is True else (metrics or None)
+        self.hooks = []
+        self.compact = compact
+        self.raise_on_error = raise_on_error
+        if retry is True:
+            retry = RetryPolicy()
+        self.retry = retry or RetryPolicy(attempts=1)
+        self.circuit_breaker = CircuitBreaker() if circuit_breaker is True else circuit_breaker
+        url = WSDL_URL_GENERIC.format(companyname=companyname, username=username, password=password, service=service)
+        self._url = kwargs.pop('url', url)
+        if wsdl_cache:
+            wsdl_cache = _WsdlCache(path=None if wsdl_cache is True else wsdl_cache, timeout=WSDL_CACHE_TIMEOUT)
+        limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.transport = AsyncTransport(client=httpx.AsyncClient(limits=limits, timeout=timeout, proxy=proxy),
+                                        wsdl_client=httpx.Client(timeout=timeout, proxy=proxy),
+                                        cache=wsdl_cache or None)
+        self._login_details = {'UserName': username,
+                               'CompanyName': companyname,
+                               'Password': password,
+                               'ApplicationID': 'app'}
+        self.max_concurrency = max_concurrency
+        self.client = None
+        self.IRESSSessionKey = None
+        self.UserToken = None
+        self.relogins = 0
+        self.relogin_time = 0.0
+        self._semaphore = None
+        self._login_lock = None
+
+    async def connect(self):
+        '''Load the WSDL and start the Iress session.'''
+        if self.client is None:
+            try:
+                document = _wsdl_document(self._url, self.transport)
+            except Exception:
+                raise PyIressException('Cannot Connect')
+            # Every operation is decoded by decode_rows, never by zeep
+            self.client = zeep.AsyncClient(wsdl=document, transport=self.transport,
+                                           settings=zeep.Settings(raw_response=True))
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._login_lock = asyncio.Lock()
+        if self.IRESSSessionKey is None:
+            async with self._login_lock:
+                if self.IRESSSessionKey is None:
+                    await self._start_session()
+        return self
+
+    async def close(self):
+        await self.transport.aclose()
+        self.transport.wsdl_client.close()
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _start_session(self):
+        async with self._semaphore:
+            response = await self.client.service.IRESSSessionStart(Input={'Parameters': self._login_details})
+        row = self._decode(response, 'IRESSSessionStart').iloc[0]
+        self.IRESSSessionKey, self.UserToken = row.IRESSSessionKey, row.UserToken
+
+    async def _relogin(self, expired_key):
+        async with self._login_lock:
+            # Another coroutine may have logged in again already
+            if self.IRESSSessionKey != expired_key:
+                return
+            start = time.monotonic()
+            await self._start_session()
+            self.relogins += 1
+            self.relogin_time += time.monotonic() - start
+
+    @property
+    def header(self):
+        return {'Header': {'SessionKey': self.IRESSSessionKey}}
+
+    def add_hook(self, hook):
+        '''Call hook(record) after every SOAP call (see pyiress.metrics for the record).'''
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def _decode(self, response, operation, timings=None, columns=None):
+        try:
+            return decode_rows(response.content, operation, timings=timings, columns=columns, compact=self.compact)
+        except etree.XMLSyntaxError:
+            raise zeep.exceptions.TransportError(status_code=response.status_code, content=response.content)
+
+    async def _call(self, operation, parameters, columns=None):
+        '''
+        Run a data operation and return its DataRows as a DataFrame. If the
+        session has expired it is logged in again and the request retried once.
+        Transient failures are retried as set by self.retry.
+        '''
+        if self.IRESSSessionKey is None:
+            await self.connect()
+        record = new_record(operation, parameters)
+        start = time.perf_counter()
+        breaker = self.circuit_breaker
+        try:
+            attempt = 1
+            while True:
+                if breaker is not None and not breaker.allow():
+                    raise CircuitOpenError('Circuit open after repeated failures, retry in %.1fs'
+                                           % breaker.retry_after())
+                try:
+                    df = await self._attempt(operation, parameters, record, columns)
+                except Exception as e:
+                    if not self.retry.retryable(e):
+                        if breaker is not None:
+                            breaker.success()
+                        raise
+                    if breaker is not None:
+                        breaker.failure()
+                    if attempt >= self.retry.attempts:
+                        raise
+                    record['retries'] += 1
+                    await asyncio.sleep(self.retry.delay(attempt))
+                    attempt += 1
+                    continue
+                if breaker is not None:
+                    breaker.success()
+                return df
+        except Exception as e:
+            record['error'] = _error_text(e)
+            raise
+        finally:
+            record['total'] = time.perf_counter() - start
+            self.last_status = record
+            if self.registry is not None:
+                self.registry.observe(record)
+            if self.hooks:
+                run_hooks(self.hooks, record)
+
+    async def _attempt(self, operation, parameters, record, columns=None):
+        key = self.IRESSSessionKey
+        try:
+            return await self._request(operation, dict(parameters, **self.header), record, columns)
+        except zeep.exceptions.Fault as e:
+            if not session_expired(e):
+                raise
+        record['retries'] += 1
+        await self._relogin(key)
+        return await self._request(operation, dict(parameters, **self.header), record, columns)
+
+    async def _request(self, operation, inputs, record, columns=None):
+        service = getattr(self.client.service, operation)
+        async with self._semaphore:
+            start = time.perf_counter()
+            try:
+                response = await asyncio.wait_for(service(Input=inputs), self.retry.timeout(operation))
+            finally:
+                record['network'] += time.perf_counter() - start
+        record['response_bytes'] = len(response.content)
+        df = self._decode(response, operation, timings=record, columns=columns)
+        record['rows'] = len(df)
+        return df
+
+    async def _time_series(self, start_date, end_date, ticker='', exchange='', securitytext='', freq='daily',
+                           fields=None):
+        parameters = _time_series_parameters(start_date, end_date, ticker, exchange, securitytext, freq)
+        df = await self._call('TimeSeriesGet2', parameters, _columns(fields, 'TimeSeriesDate'))
+        return _index_on(df, 'TimeSeriesDate')
+
+    async def time_series(self, start_date, end_date, ticker, exchange='', freq='daily', fields=[]):
+        '''As Iress.time_series. Pages are requested one after the other.'''
+        securitytext = _securitytext(ticker)
+        part_date = pd.Timestamp(start_date)
+        end_date = pd.Timestamp(end_date)
+        data_list = []
+        try:
+            while part_date <= end_date:
+                new_data = await self._time_series(part_date, end_date, ticker=ticker, exchange=exchange,
+                                                   securitytext=securitytext, freq=freq, fields=fields)
+                new_data = _page_after(new_data, part_date)
+                if new_data is None:
+                    break
+                data_list.append(new_data)
+                part_date = new_data.index.max() + pd.DateOffset(1, 'D')
+        except Exception as e:
+            if self.raise_on_error:
+                raise
+            return _pages_frame(data_list, e, start_date, end_date)
+        if len(data_list) == 0:
+            return pd.DataFrame()
+        return pd.concat(data_list)
+
+    async def dividends(self, ticker, exchange, start_date, end_date, freq=None, index_on='ExDividendDate',
+                        fields=None):
+        '''As Iress.dividends.'''
+        parameters = _dividend_parameters(ticker, exchange, start_date, end_date)
+        try:
+            df = await self._call('SecurityDividendGetBySecurity', parameters, _columns(fields, index_on))
+        except Exception as e:
+            if self.raise_on_error:
+                raise
+            return _partial(pd.DataFrame(), e, missing=[(pd.Timestamp(start_date), pd.Timestamp(end_date))])
+        return _index_on(df, index_on)
+
+    async def MarketCapitalizationHistorical(self, indexcode, ticker, exchange, start_date, end_date, fields=None):
+        '''As Iress.MarketCapitalizationHistorical.'''
+        parameters = _market_cap_parameters(indexcode, ticker, exchange, start_date, end_date)
+        try:
+            return await self._call('MarketCapitalizationHistoricalGet', parameters, _columns(fields))
+        except Exception as e:
+            if self.raise_on_error:
+                raise
+            return _partial(pd.DataFrame(), e, missing=[(pd.Timestamp(start_date), pd.Timestamp(end_date))])
+
+    async def time_series_intraday(self, ticker, exchange, start_date, end_date, freq='minutes', interval=60):
+        '''
+        As Iress.time_series_intraday, with all the windows requested
+        concurrently (see _gather).
+        '''
+        windows = _split_range(start_date, end_date, intraday_window(freq, interval))
+        data_list = await _gather([self._time_series_intraday(ticker, exchange, start, end, freq, interval)
+                                   for start, end in windows], return_exceptions=not self.raise_on_error)
+        return _intraday_result(windows, data_list)
+
+    async def _time_series_intraday(self, ticker, exchange, start_date, end_date, freq='minutes', interval=60):
+        parameters = _intraday_parameters(ticker, exchange, start_date, end_date, freq, interval)
+        df = await self._call('TimeSeriesIntraDayGet2', parameters)
+        return _intraday_frame(df)
+
+    async def get_quotes(self, ticker=[], exchange=[], watchlist=False, tickers='', fields=None):
+        '''
+        As Iress.get_quotes, with all the 1000 entry chunks requested
+        concurrently (see _gather).
+        '''
+        requests_list = _quote_requests(ticker, exchange, watchlist, tickers)
+        columns = _columns(fields, *QUOTE_KEY_COLUMNS)
+        data_list = await _gather([self._call('PricingQuoteGet', parameters, columns)
+                                   for parameters in requests_list], return_exceptions=not self.raise_on_error)
+        return _quote_result(requests_list, data_list)
+
+    async def get_many(self, start_date, end_date, data_type, tickers, exchange='', freq='daily',
+                       layout='long', fields=None):
+        '''
+        As Iress.get_many, with every ticker requested concurrently (up to
+        max_concurrency requests in flight). Tickers that fail are listed in
+        attrs['failed'] and last_status.
+        '''
+        if data_type not in MANY_DATE_FIELDS:
+            warnings.warn("Not available for this data type")
+            return
+        if layout not in ('long', 'panel'):
+            raise PyIressException("layout must be 'long' or 'panel'")
+        builder = PanelBuilder(fields) if layout == 'panel' else None
+
+        async def fetch(ticker):
+            if data_type == 'time_series':
+                df = await self.time_series(start_date, end_date, ticker, exchange, freq=freq, fields=fields)
+            else:
+                df = await self.dividends(ticker, exchange, start_date, end_date, fields=fields)
+            if builder is None:
+                return df
+            builder.add(ticker, df)
+            return df.iloc[:0]
+
+        data_list = await asyncio.gather(*[fetch(ticker) for ticker in tickers], return_exceptions=True)
+        results = list(zip(tickers, data_list))
+        if builder is not None:
+            df_data = builder.build(tickers)
+            df_data.attrs['failed'] = _many_failed(results)
+            df_data.attrs['partial'] = _many_partial(results)
+        else:
+            df_data = _many_frame(results, data_type, exchange, self.compact)
+        self.last_status = {'data_type': data_type, 'requested': len(tickers), 'failed': df_data.attrs['failed'],
+                            'partial': df_data.attrs['partial']}
+        return df_data
+
+    def metrics(self):
+        '''
+        Requests in flight, re-logins and the state of the circuit breaker
+        (self.registry is the MetricsRegistry of the calls).
+        '''
+        return {'max_concurrency': self.max_concurrency,
+                'active': self.max_concurrency - self._semaphore._value if self._semaphore else 0,
+                'relogins': self.relogins,
+                'relogin_time_mean': self.relogin_time / self.relogins if self.relogins else None,
+                'circuit': self.circuit_breaker.metrics() if self.circuit_breaker is not None else None}
+
+
+async def _gather(coroutines, return_exceptions=False):
+    '''
+    Run the coroutines as tasks and return their results in order. The
+    first error cancels the other tasks, waits for them to finish and is
+    raised. With return_exceptions, every task runs to the end and the
+    exceptions are returned in place of their results.
+    '''
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    if return_exceptions:
+        return await asyncio.gather(*tasks, return_exceptions=True)
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        # the siblings' own errors are retrieved here rather than lost
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,303 @@
+'''
+Local store of intraday bars in fixed-width binary columns, read through
+numpy.memmap.
+
+    from pyiress.bars import BarStore
+    store = BarStore('bars', freq='minutes', interval=1)
+    store.update_many(iress, tickers, 'ASX', start_date)      # first run fetches, later runs top up
+    store.columns('BHP', 'ASX', '2020-03-02', '2020-03-06')   # {column: memmap slice}
+    store.read('BHP', 'ASX', '2020-03-02')                    # DataFrame as time_series_intraday
+
+Every security has its own folder
+
+    <path>/<freq>-<interval>/<exchange>/<ticker>/<column>.bin
+                                                 _meta.json
+
+holding one little-endian array per column. Bar times are int64 UTC
+nanoseconds, prices float32 (price_dtype), volume and value float64, counts
+int32 and trade numbers int64. Integers Iress leaves empty are stored as
+INT_NULL. A bar takes 56 bytes on disk (72 with float64 prices) and none of
+the process memory until it is read.
+
+The files are only appended to. _meta.json records the number of rows
+written and is replaced after the columns are flushed, so bytes left past
+that count by an interrupted append are ignored and overwritten by the next.
+A top-up requests the bars from the last stored one on, and keeps those past
+its LastTradeNumberOfTheInterval; a bar that has grown since replaces the
+last stored row.
+'''
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .export import partition_exchange
+from .pyiress import PyIressException
+
+META = '_meta.json'
+BAR_TIMEZONE = 'America/New_York'     # time zone time_series_intraday gives its bars
+INT_NULL = -1                          # stored for an empty count or trade number
+
+BAR_COLUMNS = [('OpenPrice', None), ('HighPrice', None), ('LowPrice', None), ('ClosePrice', None),
+               ('TotalVolume', '<f8'), ('TotalValue', '<f8'), ('TradeCount', '<i4'), ('TradingPeriod', '<i4'),
+               ('LastTradeNumberOfTheInterval', '<i8')]
+CURSOR = 'LastTradeNumberOfTheInterval'
+
+
+class _Series(object):
+    '''The files of one security: column dtypes, rows written and the open memmaps.'''
+    def __init__(self, folder, dtypes, rows=0):
+        self.folder = folder
+        self.dtypes = dtypes
+        self.rows = rows
+        self.lock = threading.Lock()
+        self._maps = {}     # column -> memmap of the first self.rows rows
+
+    def column(self, name):
+        if self.rows == 0:
+            return np.empty(0, dtype=self.dtypes[name])
+        mapped = self._maps.get(name)
+        if mapped is None or len(mapped) != self.rows:
+            mapped = self._maps[name] = np.memmap(os.path.join(self.folder, name + '.bin'),
+                                                  dtype=self.dtypes[name], mode='r', shape=(self.rows,))
+        return mapped
+
+
+class BarStore(object):
+    '''
+    Intraday bars of many securities for one freq/interval of
+    TimeSeriesIntraDayGet2, see the module docstring.
+
+    path - root folder of the store
+    freq, interval - as for Iress.time_series_intraday
+    price_dtype - dtype of OpenPrice/HighPrice/LowPrice/ClosePrice ('f4' or
+                  'f8'), fixed when a security is first stored
+    '''
+    def __init__(self, path, freq='minutes', interval=1, price_dtype='f4'):
+        self.path = path
+        self.freq = freq
+        self.interval = interval
+        self.price_dtype = np.dtype(price_dtype).newbyteorder('<').str
+        self.root = os.path.join(path, '%s-%s' % (freq, interval))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _folder(self, ticker, exchange):
+        return os.path.join(self.root, partition_exchange(ticker, exchange), ticker.replace(os.sep, '_'))
+
+    def _get(self, ticker, exchange, create=False):
+        folder = self._folder(ticker, exchange)
+        with self._lock:
+            series = self._series.get(folder)
+            if series is None:
+                meta = os.path.join(folder, META)
+                if os.path.exists(meta):
+                    with open(meta) as f:
+                        meta = json.load(f)
+                    series = _Series(folder, meta['dtypes'], meta['rows'])
+                elif create:
+                    dtypes = dict(time='<i8', **dict((name, dtype or self.price_dtype) for name, dtype in BAR_COLUMNS))
+                    series = _Series(folder, dtypes)
+                else:
+                    return None
+                self._series[folder] = series
+        return series
+
+    def securities(self):
+        '''(ticker, exchange) of the securities stored.'''
+        held = []
+        if os.path.isdir(self.root):
+            for exchange in sorted(os.listdir(self.root)):
+                for ticker in sorted(os.listdir(os.path.join(self.root, exchange))):
+                    if os.path.exists(os.path.join(self.root, exchange, ticker, META)):
+                        held.append((ticker, exchange))
+        return held
+
+    def __len__(self):
+        return len(self.securities())
+
+    def rows(self, ticker, exchange=''):
+        series = self._get(ticker, exchange)
+        return 0 if series is None else series.rows
+
+    def nbytes(self, ticker, exchange=''):
+        series = self._get(ticker, exchange)
+        if series is None:
+            return 0
+        return series.rows * sum(np.dtype(dtype).itemsize for dtype in series.dtypes.values())
+
+    def coverage(self, ticker, exchange=''):
+        '''(first, last) bar time held for the security, or None.'''
+        series = self._get(ticker, exchange)
+        if series is None or series.rows == 0:
+            return None
+        times = series.column('time')
+        return tuple(pd.Timestamp(int(time), unit='ns', tz='UTC').tz_convert(BAR_TIMEZONE)
+                     for time in (times[0], times[-1]))
+
+    def append(self, ticker, exchange, df):
+        '''
+        Append the bars of df (a time_series_intraday frame) after those
+        held. Bars at or before the last one held are skipped, except a
+        newer version of the last bar, which replaces it. Returns the number
+        of rows written.
+        '''
+        if len(df) == 0:
+            return 0
+        series = self._get(ticker, exchange, create=True)
+        with series.lock:
+            times = pd.DatetimeIndex(df.index)
+            if times.tz is None:
+                times = times.tz_localize(BAR_TIMEZONE)
+            times = times.tz_convert('UTC').as_unit('ns').asi8
+            rows = series.rows
+            keep = np.ones(len(times), dtype=bool)
+            if rows:
+                last_time = int(series.column('time')[-1])
+                last_cursor = int(series.column(CURSOR)[-1])
+                keep = times >= last_time
+                if CURSOR in df and last_cursor != INT_NULL:
+                    cursor = df[CURSOR].to_numpy(dtype=np.float64, na_value=np.nan)
+                    keep &= ~(cursor <= last_cursor)
+                else:
+                    keep &= times > last_time
+            # bars must arrive in time order
+            keep &= np.maximum.accumulate(np.where(keep, times, np.iinfo(np.int64).min)) <= times
+            if not keep.any():
+                return 0
+            if rows and times[keep][0] == last_time:
+                rows -= 1
+            columns = {'time': times[keep]}
+            for name, dtype in series.dtypes.items():
+                if name == 'time':
+                    continue
+                if name not in df:
+                    values = np.full(int(keep.sum()), np.nan)
+                else:
+                    values = df[name].to_numpy(dtype=np.float64, na_value=np.nan)[keep]
+                if np.dtype(dtype).kind == 'i':
+                    values = np.where(np.isnan(values), INT_NULL, values)
+                columns[name] = values.astype(dtype)
+            self._write(series, rows, columns)
+            return len(columns['time'])
+
+    def _write(self, series, rows, columns):
+        os.makedirs(series.folder, exist_ok=True)
+        for name, values in columns.items():
+            with open(os.path.join(series.folder, name + '.bin'), 'r+b' if rows else 'wb') as f:
+                f.seek(rows * values.itemsize)
+                f.write(values.tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+        rows += len(columns['time'])
+        meta = os.path.join(series.folder, META)
+        tmp = meta + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'rows': rows, 'dtypes': series.dtypes, 'freq': self.freq, 'interval': self.interval,
+                       'timezone': BAR_TIMEZONE}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, meta)
+        series.rows = rows
+        series._maps = {}
+
+    def _slice(self, series, start_date, end_date):
+        times = series.column('time')
+        first = 0 if start_date is None else int(np.searchsorted(times, _utc(start_date), 'left'))
+        last = len(times) if end_date is None else int(np.searchsorted(times, _utc(end_date, True), 'right'))
+        return first, max(first, last)
+
+    def columns(self, ticker, exchange='', start_date=None, end_date=None, fields=None):
+        '''
+        {column: array} of the bars between start_date and end_date
+        (inclusive, a date alone takes the whole day), as read-only memmap
+        slices. 'time' holds int64 UTC nanoseconds. The last bar held is
+        rewritten when it grows, so a range taking it is returned as copies:
+        a later append does not change arrays already returned.
+        '''
+        return self._columns(ticker, exchange, start_date, end_date, fields, copy_last=True)
+
+    def _columns(self, ticker, exchange, start_date, end_date, fields, copy_last):
+        series = self._get(ticker, exchange)
+        if series is None:
+            return {}
+        with series.lock:
+            first, last = self._slice(series, start_date, end_date)
+            names = ['time'] + [name for name in series.dtypes
+                                if name != 'time' and (fields is None or name in fields)]
+            columns = dict((name, series.column(name)[first:last]) for name in names)
+            if copy_last and last == series.rows:
+                columns = dict((name, np.array(values)) for name, values in columns.items())
+        return columns
+
+    def read(self, ticker, exchange='', start_date=None, end_date=None, fields=None):
+        '''
+        The bars as a DataFrame indexed on TimeSeriesDate (America/New_York),
+        with nullable integer counts. Prices keep the stored dtype.
+        '''
+        # the frame is built from copies of the memmap slices
+        columns = self._columns(ticker, exchange, start_date, end_date, fields, copy_last=False)
+        if not columns:
+            return pd.DataFrame()
+        index = pd.DatetimeIndex(columns.pop('time').astype('datetime64[ns]'), name='TimeSeriesDate')
+        data = {}
+        for name, values in columns.items():
+            if values.dtype.kind == 'i':
+                values = pd.arrays.IntegerArray(np.array(values), values == INT_NULL)
+            data[name] = values
+        return pd.DataFrame(data, index=index.tz_localize('UTC').tz_convert(BAR_TIMEZONE))
+
+    def update(self, iress, ticker, exchange, start_date, end_date=None, workers=1):
+        '''
+        Fetch the bars of the security from Iress and append them: from
+        start_date for a new security, else from the last bar held. end_date
+        defaults to now. Returns the number of rows written. With
+        raise_on_error=False only the complete part of a partial result is
+        stored, and the error is raised after storing it.
+        '''
+        end_date = pd.Timestamp.now(BAR_TIMEZONE).tz_localize(None) if end_date is None else pd.Timestamp(end_date)
+        held = self.coverage(ticker, exchange)
+        # Iress takes wall-clock times of the bars
+        start_date = pd.Timestamp(start_date) if held is None else held[1].tz_localize(None)
+        if start_date > end_date:
+            return 0
+        df = iress.time_series_intraday(ticker, exchange, start_date, end_date, freq=self.freq,
+                                        interval=self.interval, workers=workers)
+        partial = df.attrs.get('partial')
+        if partial:
+            complete_to = partial['complete_to']
+            df = df[df.index.tz_localize(None) < complete_to] if complete_to is not None else df.iloc[:0]
+        rows = self.append(ticker, exchange, df)
+        if partial:
+            raise PyIressException('%s stored up to %s: %s' % (ticker, partial['complete_to'], partial['error']))
+        return rows
+
+    def update_many(self, iress, tickers, exchange, start_date, end_date=None, workers=4):
+        '''
+        update() every ticker, `workers` at a time. Returns {ticker: rows
+        written, or 'Type: message' if it failed}.
+        '''
+        end_date = pd.Timestamp.now(BAR_TIMEZONE).tz_localize(None) if end_date is None else pd.Timestamp(end_date)
+
+        def fetch(ticker):
+            try:
+                return self.update(iress, ticker, exchange, start_date, end_date)
+            except Exception as e:
+                return '%s: %s' % (type(e).__name__, e)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(tickers, executor.map(fetch, tickers)))
+
+
+def _utc(date, day_end=False):
+    '''UTC nanoseconds of date, read in BAR_TIMEZONE if naive. day_end takes the end of a bare date.'''
+    stamp = pd.Timestamp(date)
+    if day_end and stamp == stamp.normalize() and not isinstance(date, pd.Timestamp):
+        stamp = stamp + pd.Timedelta(days=1) - pd.Timedelta(1, 'ns')
+    if stamp.tz is None:
+        stamp = stamp.tz_localize(BAR_TIMEZONE)
+    return stamp.tz_convert('UTC').as_unit('ns').value
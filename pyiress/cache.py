@@ -0,0 +1,302 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .decode import SCHEMAS
+
+TIME_SERIES_COLUMNS = [name for name, kind in SCHEMAS['TimeSeriesGet2'] if name != 'TimeSeriesDate']
+TIME_SERIES_KINDS = dict(SCHEMAS['TimeSeriesGet2'])
+
+_DATE_FORMAT = '%Y-%m-%d'
+
+# Seconds a response stays fresh in a ResponseCache, per operation
+RESPONSE_TTL = {'PricingQuoteGet': 2,
+                'TimeSeriesIntraDayGet2': 60,
+                'TimeSeriesGet2': 24 * 3600,
+                'SecurityDividendGetBySecurity': 24 * 3600,
+                'MarketCapitalizationHistoricalGet': 24 * 3600}
+
+
+class TimeSeriesCache(object):
+    '''
+    Persistent local store of TimeSeriesGet2 history in a SQLite file.
+
+    Rows are keyed by (security, exchange, frequency), where security is the
+    ticker or security text passed to Iress.time_series. For every key the
+    cache remembers the contiguous date range it holds, so a request only
+    goes to Iress for the missing head and tail of that range.
+
+    A top-up re-requests the last cached row. If its AdjustmentFactor (or the
+    factor of any new row) differs from the cached one, a corporate action has
+    restated the history: the key is dropped and the full range refetched.
+    invalidate() drops keys explicitly.
+
+        cache = TimeSeriesCache('iress.sqlite')
+        iress = Iress(companyname, username, password, cache=cache)
+        iress.time_series(start_date, end_date, 'AGL', 'JSE')
+    '''
+    def __init__(self, path='pyiress_cache.sqlite'):
+        self.path = path
+        self._lock = threading.Lock()
+        columns = ''.join(', %s %s' % (c, 'INTEGER' if TIME_SERIES_KINDS[c] in ('i4', 'i8') else 'REAL')
+                          for c in TIME_SERIES_COLUMNS)
+        with self._connect() as con:
+            con.execute('CREATE TABLE IF NOT EXISTS coverage (security TEXT, exchange TEXT, frequency TEXT, '
+                        'date_from TEXT, date_to TEXT, PRIMARY KEY (security, exchange, frequency))')
+            con.execute('CREATE TABLE IF NOT EXISTS time_series (security TEXT, exchange TEXT, frequency TEXT, '
+                        'TimeSeriesDate TEXT%s, PRIMARY KEY (security, exchange, frequency, TimeSeriesDate))'
+                        % columns)
+
+    def _connect(self):
+        # One connection per call keeps the cache usable from get_many worker threads
+        return sqlite3.connect(self.path, timeout=60)
+
+    def coverage(self, security, exchange='', freq='daily'):
+        '''Return (date_from, date_to) held for the key, or None.'''
+        with self._connect() as con:
+            row = con.execute('SELECT date_from, date_to FROM coverage WHERE security=? AND exchange=? AND frequency=?',
+                              (security, exchange, freq)).fetchone()
+        if row is None:
+            return None
+        return pd.Timestamp(row[0]), pd.Timestamp(row[1])
+
+    def missing(self, security, exchange, freq, start_date, end_date):
+        '''Return the [(start, end)] ranges of start_date..end_date not held for the key.'''
+        start_date, end_date = _day(start_date), _day(end_date)
+        held = self.coverage(security, exchange, freq)
+        if held is None or held[0] > end_date or held[1] < start_date:
+            return [(start_date, end_date)]
+        ranges = [(start_date, held[0] - pd.DateOffset(1, 'D')), (held[1] + pd.DateOffset(1, 'D'), end_date)]
+        return [(s, e) for s, e in ranges if s <= e]
+
+    def get(self, security, exchange, freq, start_date, end_date):
+        '''
+        Return the cached rows of the key between start_date and end_date,
+        with the column dtypes of an uncached Iress.time_series.
+        '''
+        query = ('SELECT TimeSeriesDate, %s FROM time_series WHERE security=? AND exchange=? AND frequency=? '
+                 'AND TimeSeriesDate>=? AND TimeSeriesDate<=? ORDER BY TimeSeriesDate' % ', '.join(TIME_SERIES_COLUMNS))
+        with self._connect() as con:
+            df = pd.read_sql_query(query, con, params=(security, exchange, freq,
+                                                       _day(start_date).strftime(_DATE_FORMAT),
+                                                       _day(end_date).strftime(_DATE_FORMAT)))
+        df['TimeSeriesDate'] = pd.to_datetime(df.TimeSeriesDate).astype('datetime64[ns]')
+        # The dtypes decode_rows gives: integers stay int32/int64 unless a value is null
+        for name in TIME_SERIES_COLUMNS:
+            values = df[name].astype(float)
+            kind = TIME_SERIES_KINDS[name]
+            if kind in ('i4', 'i8') and values.notna().all():
+                values = values.astype(np.int32 if kind == 'i4' else np.int64)
+            df[name] = values
+        return df.set_index('TimeSeriesDate')
+
+    def put(self, security, exchange, freq, df, start_date, end_date):
+        '''
+        Store df (as returned by Iress.time_series), fetched for the range
+        [start_date, end_date], for the key. Rows already held in that range
+        are replaced and the coverage is extended to it. Today is never marked
+        as covered, so a partial bar is refetched by the next call.
+        '''
+        start_date, end_date = _day(start_date), _day(end_date)
+        covered_to = min(end_date, pd.Timestamp.today().normalize() - pd.DateOffset(1, 'D'))
+        rows = df.reindex(columns=TIME_SERIES_COLUMNS).astype(float)
+        rows = rows.astype(object).where(rows.notna(), None)
+        dates = pd.to_datetime(df.index).strftime(_DATE_FORMAT)
+        values = [(security, exchange, freq, d) + tuple(r) for d, r in zip(dates, rows.itertuples(index=False))]
+        placeholders = ', '.join(['?'] * (4 + len(TIME_SERIES_COLUMNS)))
+        with self._lock, self._connect() as con:
+            con.execute('DELETE FROM time_series WHERE security=? AND exchange=? AND frequency=? '
+                        'AND TimeSeriesDate>=? AND TimeSeriesDate<=?',
+                        (security, exchange, freq, start_date.strftime(_DATE_FORMAT), end_date.strftime(_DATE_FORMAT)))
+            con.executemany('INSERT OR REPLACE INTO time_series VALUES (%s)' % placeholders, values)
+            row = con.execute('SELECT date_from, date_to FROM coverage WHERE security=? AND exchange=? AND frequency=?',
+                              (security, exchange, freq)).fetchone()
+            if row is not None:
+                start_date = min(start_date, pd.Timestamp(row[0]))
+                covered_to = max(covered_to, pd.Timestamp(row[1]))
+            if covered_to >= start_date:
+                con.execute('INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?, ?)',
+                            (security, exchange, freq, start_date.strftime(_DATE_FORMAT),
+                             covered_to.strftime(_DATE_FORMAT)))
+
+    def invalidate(self, security=None, exchange=None, freq=None):
+        '''Drop every cached key matching the given filters (all keys if none given).'''
+        where, params = [], []
+        for name, value in (('security', security), ('exchange', exchange), ('frequency', freq)):
+            if value is not None:
+                where.append('%s=?' % name)
+                params.append(value)
+        clause = ' WHERE ' + ' AND '.join(where) if where else ''
+        with self._lock, self._connect() as con:
+            con.execute('DELETE FROM time_series' + clause, params)
+            con.execute('DELETE FROM coverage' + clause, params)
+
+    def fetch(self, fetch, security, exchange, freq, start_date, end_date):
+        '''
+        Return the rows of the key between start_date and end_date, calling
+        fetch(start, end) only for the ranges not yet held.
+        '''
+        start_date, end_date = _day(start_date), _day(end_date)
+        held = self.coverage(security, exchange, freq)
+        if held is None:
+            self.put(security, exchange, freq, fetch(start_date, end_date), start_date, end_date)
+            return self.get(security, exchange, freq, start_date, end_date)
+
+        held_from, held_to = held
+        if start_date < held_from:
+            head_to = held_from - pd.DateOffset(1, 'D')
+            self.put(security, exchange, freq, fetch(start_date, head_to), start_date, head_to)
+        if end_date > held_to:
+            cached = self.get(security, exchange, freq, held_from, held_to)
+            # Overlap the top-up with the last cached row to spot restatements
+            tail_from = cached.index.max() if len(cached) else held_to + pd.DateOffset(1, 'D')
+            tail = fetch(tail_from, end_date)
+            if self._restated(cached, tail):
+                self.invalidate(security, exchange, freq)
+                return self.fetch(fetch, security, exchange, freq, start_date, end_date)
+            self.put(security, exchange, freq, tail, tail_from, end_date)
+        return self.get(security, exchange, freq, start_date, end_date)
+
+    @staticmethod
+    def _restated(cached, tail):
+        if len(cached) == 0 or len(tail) == 0 or 'AdjustmentFactor' not in tail:
+            return False
+        factor = cached.AdjustmentFactor.iloc[-1]
+        new_factors = tail.AdjustmentFactor.astype(float)
+        if pd.isnull(factor):
+            return bool(new_factors.notna().any())
+        return bool((new_factors.fillna(factor) != factor).any())
+
+
+class _Flight(object):
+    '''A request in progress that identical requests wait on.'''
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache(object):
+    '''
+    In-memory cache of Iress responses (DataFrames), keyed by operation and
+    request parameters, shared by every call of one or more Iress objects.
+
+    max_bytes - memory held by the cached frames before the least recently
+                used ones are evicted
+    ttl - seconds a response stays fresh, per operation; merged over
+          RESPONSE_TTL. An operation with a ttl of 0 is not cached.
+    default_ttl - ttl of operations not listed
+
+    Identical requests made while one is in flight wait for it and share
+    its result (or its error) instead of calling Iress again. Errors are not
+    cached. metrics() reports hits, misses, coalesced requests, evictions and
+    expirations.
+
+        iress = Iress(companyname, username, password, response_cache=ResponseCache(ttl={'PricingQuoteGet': 5}))
+    '''
+    def __init__(self, max_bytes=256 * 2 ** 20, ttl=None, default_ttl=60):
+        self.max_bytes = max_bytes
+        self.ttl = dict(RESPONSE_TTL, **(ttl or {}))
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()    # key -> (expires, nbytes, frame), least recently used first
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(operation, parameters):
+        '''Cache key of a request. The session header is not part of it.'''
+        parameters = dict((k, v) for k, v in parameters.items() if k != 'Header')
+        return operation, json.dumps(parameters, sort_keys=True, default=str)
+
+    def fetch(self, operation, parameters, fetch):
+        '''Return the cached response of the request, or call fetch() for it.'''
+        ttl = self.ttl.get(operation, self.default_ttl)
+        if not ttl:
+            return fetch()
+        key = self.key(operation, parameters)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[2].copy()
+                self._remove(key)
+                self.expirations += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result.copy()
+        try:
+            flight.result = fetch()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None:
+                    self._store(key, time.monotonic() + ttl, flight.result)
+            flight.done.set()
+        return flight.result.copy()
+
+    def _store(self, key, expires, df):
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        if nbytes > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (expires, nbytes, df)
+        self.bytes += nbytes
+        while self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        self.bytes -= self._entries.pop(key)[1]
+
+    def invalidate(self, operation=None):
+        '''Drop the cached responses of operation (of all operations if None).'''
+        with self._lock:
+            for key in [k for k in self._entries if operation is None or k[0] == operation]:
+                self._remove(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def metrics(self):
+        '''Entries and bytes held, hits, misses, coalesced requests, evictions and expirations.'''
+        with self._lock:
+            requests = self.hits + self.misses + self.coalesced
+            return {'entries': len(self._entries),
+                    'bytes': self.bytes,
+                    'max_bytes': self.max_bytes,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'coalesced': self.coalesced,
+                    'evictions': self.evictions,
+                    'expirations': self.expirations,
+                    'hit_rate': (self.hits + self.coalesced) / requests if requests else None}
+
+
+def _day(date):
+    return pd.Timestamp(date).normalize()
@@ -0,0 +1,240 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+INDEX_CHUNK_DAYS = 92     # days of MarketCapitalizationHistorical requested per call
+
+
+class IndexHistory(object):
+    '''
+    Point-in-time membership and weights of one index, held as an interval
+    table: one row per unbroken run of a security in the index
+
+        security  - position in self.securities
+        start     - position in self.dates of the first day of the run
+        end       - position in self.dates of the day after the run
+        offset    - position in self.weight of the weight on the first day
+
+    where the weights of a run are stored back to back. Queries are plain
+    NumPy lookups, no SOAP call is made.
+
+        history = IndexHistory.fetch(iress, 'XJO', start_date, end_date)
+        history.weights('2019-06-28')                    # Series of weight by security
+        history.members('2019-06-28')                    # array of security codes
+        history.changes('2019-01-01', '2019-12-31')      # additions and removals
+
+    Dates are matched as of the last trading date on or before the date
+    asked for, so weekends and holidays give the previous day's index.
+    '''
+    def __init__(self, indexcode, dates, securities, exchanges, security, start, end, offset, weight,
+                 weight_field='MarketWeightEndOfDay'):
+        self.indexcode = indexcode
+        self.dates = dates
+        self.securities = securities
+        self.exchanges = exchanges
+        self.security = security
+        self.start = start
+        self.end = end
+        self.offset = offset
+        self.weight = weight
+        self.weight_field = weight_field
+        self._days = dates.view(np.int64)
+        # object dtype, so that taking members does not re-infer a string dtype
+        self._codes = pd.Index(securities, dtype=object, name='SecurityCode')
+
+    @classmethod
+    def from_frame(cls, df, indexcode=None, weight_field='MarketWeightEndOfDay'):
+        '''Build from MarketCapitalizationHistorical rows (one per security and day).'''
+        if indexcode is None:
+            indexcode = str(df.IndexCode.iloc[0]) if len(df) and 'IndexCode' in df else ''
+        if len(df) == 0:
+            empty = np.empty(0, dtype=np.int32)
+            return cls(indexcode, np.empty(0, dtype='datetime64[ns]'), np.empty(0, dtype=object),
+                       np.empty(0, dtype=object), empty, empty, empty, empty, np.empty(0), weight_field)
+        df = df.drop_duplicates(subset=['MarketCapitalizationDate', 'SecurityCode'], keep='last')
+        day = pd.to_datetime(df.MarketCapitalizationDate).to_numpy(dtype='datetime64[ns]')
+        dates, d = np.unique(day, return_inverse=True)
+        s, securities = pd.factorize(df.SecurityCode.astype(str), sort=True)
+        exchanges = (df.Exchange.astype(str).groupby(s).last().reindex(range(len(securities))).to_numpy(dtype=object)
+                     if 'Exchange' in df else np.full(len(securities), '', dtype=object))
+        w = df[weight_field].to_numpy(dtype=np.float64, na_value=np.nan)
+
+        order = np.lexsort((d, s))
+        s, d, w = s[order], d[order].astype(np.int32), w[order]
+        # A run breaks where the security changes or a trading day is skipped
+        breaks = np.ones(len(s), dtype=bool)
+        breaks[1:] = (s[1:] != s[:-1]) | (d[1:] != d[:-1] + 1)
+        offset = np.flatnonzero(breaks).astype(np.int32)
+        last = np.append(offset[1:] - 1, len(s) - 1)
+        return cls(indexcode, dates, np.asarray(securities, dtype=object), exchanges,
+                   s[offset].astype(np.int32), d[offset], d[last] + 1, offset, w, weight_field)
+
+    @classmethod
+    def fetch(cls, iress, indexcode, start_date, end_date, chunk_days=INDEX_CHUNK_DAYS, workers=4,
+              weight_field='MarketWeightEndOfDay'):
+        '''Fetch the history of indexcode in chunks of chunk_days, `workers` chunks at a time.'''
+        return cls.from_frame(fetch_index_rows(iress, indexcode, start_date, end_date, chunk_days, workers),
+                              indexcode, weight_field)
+
+    def __len__(self):
+        '''Number of membership intervals.'''
+        return len(self.start)
+
+    def __repr__(self):
+        span = '%s to %s' % (pd.Timestamp(self.dates[0]).date(), pd.Timestamp(self.dates[-1]).date()) \
+            if len(self.dates) else 'empty'
+        return '<IndexHistory %s %s, %d securities, %d intervals>' % (
+            self.indexcode, span, len(self.securities), len(self))
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.dates, self.security, self.start, self.end, self.offset, self.weight))
+
+    def _position(self, date):
+        '''Position in self.dates of the last trading date on or before date (-1 if none).'''
+        return int(np.searchsorted(self._days, pd.Timestamp(date).value, 'right')) - 1
+
+    def _active(self, pos):
+        if pos < 0:
+            return np.empty(0, dtype=np.intp)
+        return np.flatnonzero((self.start <= pos) & (self.end > pos))
+
+    def members(self, date):
+        '''Security codes in the index as of date.'''
+        return self.securities[self.security[self._active(self._position(date))]]
+
+    def weights(self, date):
+        '''Weight (weight_field) of every member as of date, indexed by security code.'''
+        pos = self._position(date)
+        active = self._active(pos)
+        weight = self.weight[self.offset[active] + pos - self.start[active]]
+        return pd.Series(weight, index=self._codes.take(self.security[active]), name=self.weight_field)
+
+    def is_member(self, security, date):
+        pos = self._position(date)
+        code = np.searchsorted(self.securities, security)
+        if code >= len(self.securities) or self.securities[code] != security:
+            return False
+        return bool(((self.security == code) & (self.start <= pos) & (self.end > pos)).any())
+
+    def changes(self, start_date, end_date):
+        '''
+        Additions and removals after start_date up to end_date, one row per
+        change: date (first trading day in or out of the index), SecurityCode,
+        change ('added' or 'removed') and the weight on the first day in, or
+        the last day held.
+        '''
+        p1, p2 = self._position(start_date), self._position(end_date)
+        added = np.flatnonzero((self.start > p1) & (self.start <= p2))
+        removed = np.flatnonzero((self.end > p1) & (self.end <= p2) & (self.end < len(self.dates)))
+        rows = np.concatenate([added, removed])
+        day = np.concatenate([self.start[added], self.end[removed]])
+        kind = np.repeat(np.array([0, 1], dtype=np.int8), [len(added), len(removed)])
+        weight = np.concatenate([self.weight[self.offset[added]],
+                                 self.weight[self.offset[removed] + self.end[removed] - self.start[removed] - 1]])
+        order = np.lexsort((self.security[rows], kind, day))
+        return pd.DataFrame({'date': self.dates[day[order]],
+                             'SecurityCode': self.securities[self.security[rows[order]]],
+                             'change': np.array(['added', 'removed'], dtype=object)[kind[order]],
+                             self.weight_field: weight[order]})
+
+    def intervals(self):
+        '''The interval table as a DataFrame (dates inclusive).'''
+        return pd.DataFrame({'SecurityCode': self.securities[self.security],
+                             'Exchange': self.exchanges[self.security],
+                             'from': self.dates[self.start],
+                             'to': self.dates[self.end - 1],
+                             'days': self.end - self.start})
+
+    def to_frame(self):
+        '''Expand back into one row per security and day.'''
+        lengths = self.end - self.start
+        interval = np.repeat(np.arange(len(self)), lengths)
+        day = self.start[interval] + np.arange(len(interval)) - np.repeat(self.offset, lengths)
+        return pd.DataFrame({'MarketCapitalizationDate': self.dates[day],
+                             'SecurityCode': self.securities[self.security[interval]],
+                             'Exchange': self.exchanges[self.security[interval]],
+                             'IndexCode': self.indexcode,
+                             self.weight_field: self.weight})
+
+
+def fetch_index_rows(iress, indexcode, start_date, end_date, chunk_days=INDEX_CHUNK_DAYS, workers=4):
+    '''
+    MarketCapitalizationHistorical rows of indexcode, requested in chunks of
+    chunk_days. A chunk returned partial (raise_on_error=False) raises
+    PyIressException, so a history is never built over the missing dates.
+    '''
+    from .pyiress import PyIressException
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    starts = pd.date_range(start_date, end_date, freq='%dD' % chunk_days)
+    chunks = [(s, min(s + pd.Timedelta(days=chunk_days - 1), end_date)) for s in starts]
+
+    def fetch(chunk):
+        return iress.MarketCapitalizationHistorical(indexcode, None, None, chunk[0], chunk[1])
+
+    if workers > 1 and len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+            data_list = list(executor.map(fetch, chunks))
+    else:
+        data_list = [fetch(chunk) for chunk in chunks]
+    failed = [(chunk, data.attrs['partial']) for chunk, data in zip(chunks, data_list) if data.attrs.get('partial')]
+    if failed:
+        raise PyIressException('%s incomplete for %s: %s' % (
+            indexcode, ', '.join('%s to %s' % (s.date(), e.date()) for (s, e), partial in failed),
+            failed[0][1]['error']))
+    data_list = [data for data in data_list if len(data) > 0]
+    if len(data_list) == 0:
+        return pd.DataFrame()
+    return pd.concat(data_list, ignore_index=True)
+
+
+class IndexConstituents(object):
+    '''
+    IndexHistory objects keyed by IndexCode. load() fetches an index, or
+    only the dates before and after those already held.
+
+        constituents = IndexConstituents(iress)
+        constituents.load('XJO', '2010-01-01', '2020-12-31')
+        constituents['XJO'].weights('2015-03-31')
+
+    If a range fails, load() raises and the history held is left as it was.
+    '''
+    def __init__(self, iress, chunk_days=INDEX_CHUNK_DAYS, workers=4, weight_field='MarketWeightEndOfDay'):
+        self.iress = iress
+        self.chunk_days = chunk_days
+        self.workers = workers
+        self.weight_field = weight_field
+        self._histories = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, indexcode):
+        return self._histories[indexcode]
+
+    def __contains__(self, indexcode):
+        return indexcode in self._histories
+
+    def __iter__(self):
+        return iter(self._histories)
+
+    def load(self, indexcode, start_date, end_date):
+        start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        held = self._histories.get(indexcode)
+        if held is None or len(held.dates) == 0:
+            ranges = [(start_date, end_date)]
+        else:
+            first, last = pd.Timestamp(held.dates[0]), pd.Timestamp(held.dates[-1])
+            ranges = [(s, e) for s, e in ((start_date, first - pd.Timedelta(days=1)),
+                                          (last + pd.Timedelta(days=1), end_date)) if s <= e]
+        if not ranges:
+            return held
+        data_list = [] if held is None else [held.to_frame()]
+        for s, e in ranges:
+            data_list.append(fetch_index_rows(self.iress, indexcode, s, e, self.chunk_days, self.workers))
+        data_list = [data for data in data_list if len(data) > 0]
+        df = pd.concat(data_list, ignore_index=True) if data_list else pd.DataFrame()
+        history = IndexHistory.from_frame(df, indexcode, self.weight_field)
+        with self._lock:
+            self._histories[indexcode] = history
+        return history
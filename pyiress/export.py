@@ -0,0 +1,212 @@
+'''
+Bulk export of history to Parquet files partitioned by exchange and year
+(requires pyarrow), resumable through a checkpoint manifest.
+
+    from pyiress.export import export
+    summary = export(iress, 'history', tickers, start_date, end_date, exchange='JSE',
+                     data_types=('time_series', 'dividends'), workers=8)
+
+or from the command line
+
+    python -m pyiress export --out history --exchange JSE --tickers AGL,BIL --start 2000-01-01 --end 2020-12-31
+
+The files are laid out as
+
+    <path>/<data_type>/exchange=<exchange>/year=<year>/<ticker>.parquet
+
+so the tree reads back as one dataset, e.g. pd.read_parquet('<path>/time_series').
+Every finished (or failed) ticker is appended to <path>/_manifest.jsonl. A new
+run with the same data type, exchange and date range skips the tickers
+recorded as done, so an interrupted export resumes where it stopped.
+
+Fetching and writing run in parallel: `workers` threads fetch tickers and
+hand each result to `writers` threads through a bounded queue, so at most a
+few results are held in memory at any time.
+'''
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+MANIFEST = '_manifest.jsonl'
+EXPORT_DATA_TYPES = ('time_series', 'dividends')
+
+
+class Manifest(object):
+    '''Append-only JSON lines record of the tickers an export has finished.'''
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def records(self):
+        if not os.path.exists(self.path):
+            return []
+        records = []
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by an interrupted run
+                    continue
+        return records
+
+    def done(self, data_type, exchange, start_date, end_date):
+        '''Tickers already exported for the data type, exchange and range.'''
+        key = [data_type, exchange, _date(start_date), _date(end_date)]
+        done = set()
+        for r in self.records():
+            if [r.get('data_type'), r.get('exchange'), r.get('start'), r.get('end')] == key:
+                if r.get('status') == 'done':
+                    done.add(r['ticker'])
+                else:
+                    done.discard(r['ticker'])
+        return done
+
+    def append(self, **record):
+        record['time'] = pd.Timestamp.now().isoformat()
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+
+
+def partition_exchange(ticker, exchange=''):
+    '''Exchange used as partition for a ticker, also for CODE.EXCHANGE / CODE@EXCHANGE tickers.'''
+    if exchange:
+        return exchange
+    for sep in ('.', '@'):
+        if sep in ticker:
+            return ticker.rsplit(sep, 1)[1]
+    return '_'
+
+
+def write_partitions(df, path, data_type, ticker, exchange):
+    '''
+    Write df (indexed on date) as one Parquet file per year under path.
+    Each file is written to a temporary name and renamed, so a file either
+    holds the whole year of the ticker or does not exist. Returns the paths.
+    '''
+    df = df.reset_index()
+    date = df.columns[0]
+    df.insert(1, 'ticker', ticker)
+    exchange = partition_exchange(ticker, exchange)
+    safe = ticker.replace(os.sep, '_')
+    written = []
+    for year, rows in df.groupby(pd.DatetimeIndex(df[date]).year, sort=True):
+        folder = os.path.join(path, data_type, 'exchange=%s' % exchange, 'year=%d' % year)
+        os.makedirs(folder, exist_ok=True)
+        target = os.path.join(folder, '%s.parquet' % safe)
+        tmp = target + '.%d.tmp' % threading.get_ident()
+        rows.to_parquet(tmp, index=False)
+        os.replace(tmp, target)
+        written.append(target)
+    return written
+
+
+def export(iress, path, tickers, start_date, end_date, exchange='', data_types=('time_series',),
+           freq='daily', workers=4, writers=2, resume=True, progress=None):
+    '''
+    Export data_types ('time_series' and/or 'dividends') of tickers between
+    start_date and end_date to Parquet files under path.
+
+    iress - Iress client; give it pool_size >= workers
+    workers - tickers fetched concurrently
+    writers - threads writing Parquet files
+    resume - skip the tickers the manifest records as done for this range
+    progress - optional callable(record) called after every ticker
+
+    Returns a summary {'done', 'skipped', 'rows', 'files', 'failed', 'elapsed'}
+    where failed maps (data_type, ticker) to the error message. Failed tickers
+    are not marked done and are retried by the next run.
+    '''
+    started = time.monotonic()
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    for data_type in data_types:
+        if data_type not in EXPORT_DATA_TYPES:
+            raise ValueError('data_types must be in %s' % (EXPORT_DATA_TYPES,))
+    os.makedirs(path, exist_ok=True)
+    manifest = Manifest(os.path.join(path, MANIFEST))
+    summary = {'done': 0, 'skipped': 0, 'rows': 0, 'files': 0, 'failed': {}, 'elapsed': None}
+
+    jobs = []
+    for data_type in data_types:
+        done = manifest.done(data_type, exchange, start_date, end_date) if resume else set()
+        for ticker in tickers:
+            if ticker in done:
+                summary['skipped'] += 1
+            else:
+                jobs.append((data_type, ticker))
+
+    results = queue.Queue(maxsize=2 * writers)
+    lock = threading.Lock()
+
+    def record(data_type, ticker, status, rows=0, files=0, error=None):
+        entry = dict(data_type=data_type, ticker=ticker, exchange=exchange, start=_date(start_date),
+                     end=_date(end_date), status=status, rows=rows, files=files)
+        if error is not None:
+            entry['error'] = error if isinstance(error, str) else '%s: %s' % (type(error).__name__, error)
+        manifest.append(**entry)
+        with lock:
+            if status == 'done':
+                summary['done'] += 1
+                summary['rows'] += rows
+                summary['files'] += files
+            else:
+                summary['failed'][(data_type, ticker)] = entry['error']
+        if progress is not None:
+            progress(entry)
+
+    def fetch(job):
+        data_type, ticker = job
+        try:
+            if data_type == 'time_series':
+                df = iress.time_series(start_date, end_date, ticker, exchange, freq=freq)
+            else:
+                df = iress.dividends(ticker, exchange, start_date, end_date)
+        except Exception as e:
+            record(data_type, ticker, 'failed', error=e)
+            return
+        if df.attrs.get('partial'):
+            # incomplete (raise_on_error=False): not marked done, so the next run fetches it again
+            record(data_type, ticker, 'failed', error=df.attrs['partial']['error'])
+            return
+        results.put((data_type, ticker, df))
+
+    def write():
+        while True:
+            item = results.get()
+            if item is None:
+                return
+            data_type, ticker, df = item
+            try:
+                files = write_partitions(df, path, data_type, ticker, exchange) if len(df) else []
+            except Exception as e:
+                record(data_type, ticker, 'failed', error=e)
+                continue
+            record(data_type, ticker, 'done', rows=len(df), files=len(files))
+
+    threads = [threading.Thread(target=write, name='pyiress-export-write-%d' % i, daemon=True)
+               for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(fetch, jobs))
+    finally:
+        for thread in threads:
+            results.put(None)
+        for thread in threads:
+            thread.join()
+    summary['elapsed'] = time.monotonic() - started
+    return summary
+
+
+def _date(date):
+    return pd.Timestamp(date).strftime('%Y-%m-%d')
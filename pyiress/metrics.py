@@ -0,0 +1,253 @@
+'''
+Instrumentation of the SOAP calls made by Iress and AsyncIress.
+
+Every data call produces one record (a dict):
+
+    operation       - Iress operation, e.g. 'TimeSeriesGet2'
+    security        - security code / text of the request ('' for arrays)
+    securities      - number of securities in the request
+    start           - time.time() when the call started
+    total           - wall time of the call, seconds
+    network         - time spent in HTTP POSTs (all attempts)
+    parse           - time parsing the response XML
+    build           - time building the DataFrame
+    request_bytes / response_bytes - payload sizes of the last attempt
+    rows            - rows returned
+    retries         - attempts repeated after a re-login or a transient failure
+    error           - 'Type: message' if the call failed, else None
+
+Records are passed to the hooks of the client (iress.add_hook(callable)),
+stored in iress.last_status and aggregated in a MetricsRegistry:
+
+    iress = Iress(companyname, username, password)      # metrics=REGISTRY by default
+    REGISTRY.summary()                  # per operation counts, errors and latency percentiles
+    REGISTRY.top_securities(10)         # securities that took the most time
+    print(REGISTRY.to_prometheus())     # Prometheus text exposition format
+
+serve_prometheus(port) exposes the registry over HTTP, and OpenTelemetryHook
+(requires opentelemetry-api) forwards the records to OpenTelemetry
+instruments.
+'''
+import bisect
+import threading
+import time
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(2 ** k for k in range(8, 31, 2))      # 256 B to 1 GB
+ROWS_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000, 1000000)
+
+PHASES = ('total', 'network', 'parse', 'build')
+
+
+def new_record(operation, inputs):
+    '''Empty record of a call of operation with inputs.'''
+    parameters = inputs.get('Parameters') or {}
+    security = parameters.get('SecurityCode') or parameters.get('SecurityText') or parameters.get('IndexCode') or ''
+    securities = 1 if security else 0
+    for array, item in (('SecurityTextArray', 'SecurityText'), ('SecurityCodeArray', 'SecurityCode')):
+        if parameters.get(array):
+            securities = len(parameters[array].get(item) or [])
+    return {'operation': operation, 'security': security, 'securities': securities, 'start': time.time(),
+            'total': None, 'network': 0.0, 'parse': None, 'build': None, 'request_bytes': None,
+            'response_bytes': None, 'rows': None, 'retries': 0, 'error': None}
+
+
+class Histogram(object):
+    '''Cumulative bucket counts, sum and count, as in a Prometheus histogram.'''
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        '''Upper bound of the bucket holding the q-th percentile (0-100).'''
+        if not self.count:
+            return None
+        rank = q / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (self.max,), self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class MetricsRegistry(object):
+    '''
+    Thread-safe aggregation of call records into histograms per operation
+    (latency per phase, payload bytes and rows), call/error/retry counters
+    and the total time spent per security.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}     # (metric, operation, phase) -> Histogram
+            self.counters = {}       # (metric, operation, label) -> int
+            self.security_time = {}  # (operation, security) -> [calls, seconds]
+
+    def _histogram(self, key, buckets):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram(buckets)
+        return histogram
+
+    def _inc(self, key, n=1):
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    def observe(self, record):
+        operation = record['operation']
+        with self._lock:
+            for phase in PHASES:
+                if record.get(phase) is not None:
+                    self._histogram(('seconds', operation, phase), LATENCY_BUCKETS).observe(record[phase])
+            for name in ('request_bytes', 'response_bytes'):
+                if record.get(name) is not None:
+                    self._histogram((name, operation, ''), BYTES_BUCKETS).observe(record[name])
+            if record.get('rows') is not None:
+                self._histogram(('rows', operation, ''), ROWS_BUCKETS).observe(record['rows'])
+            self._inc(('calls', operation, 'error' if record.get('error') else 'ok'))
+            if record.get('retries'):
+                self._inc(('retries', operation, ''), record['retries'])
+            if record.get('security') and record.get('total') is not None:
+                spent = self.security_time.setdefault((operation, record['security']), [0, 0.0])
+                spent[0] += 1
+                spent[1] += record['total']
+
+    def __call__(self, record):
+        '''A registry can itself be used as a hook.'''
+        self.observe(record)
+
+    def summary(self):
+        '''{operation: calls, errors, retries, time and payload figures}.'''
+        with self._lock:
+            operations = sorted(set(key[1] for key in self.counters))
+            summary = {}
+            for operation in operations:
+                total = self.histograms.get(('seconds', operation, 'total'))
+                row = {'calls': self.counters.get(('calls', operation, 'ok'), 0)
+                       + self.counters.get(('calls', operation, 'error'), 0),
+                       'errors': self.counters.get(('calls', operation, 'error'), 0),
+                       'retries': self.counters.get(('retries', operation, ''), 0)}
+                if total is not None and total.count:
+                    row.update(seconds=total.sum, mean=total.sum / total.count, p50=total.percentile(50),
+                               p95=total.percentile(95), p99=total.percentile(99), max=total.max)
+                for phase in PHASES[1:]:
+                    histogram = self.histograms.get(('seconds', operation, phase))
+                    if histogram is not None and histogram.count:
+                        row[phase + '_seconds'] = histogram.sum
+                for name in ('response_bytes', 'rows'):
+                    histogram = self.histograms.get((name, operation, ''))
+                    if histogram is not None:
+                        row[name] = histogram.sum
+                summary[operation] = row
+            return summary
+
+    def top_securities(self, n=10, operation=None):
+        '''The n (operation, security, calls, seconds) that took the most time.'''
+        with self._lock:
+            rows = [(op, security, calls, seconds) for (op, security), (calls, seconds) in self.security_time.items()
+                    if operation is None or op == operation]
+        return sorted(rows, key=lambda row: -row[3])[:n]
+
+    def to_prometheus(self, prefix='pyiress'):
+        '''The registry in the Prometheus text exposition format.'''
+        lines = []
+        with self._lock:
+            described = set()
+            for (metric, operation, phase), histogram in sorted(self.histograms.items()):
+                name = '%s_%s' % (prefix, {'seconds': 'request_seconds'}.get(metric, metric))
+                if name not in described:
+                    lines.append('# TYPE %s histogram' % name)
+                    described.add(name)
+                labels = 'operation="%s"' % operation + (',phase="%s"' % phase if phase else '')
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                    cumulative += count
+                    lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative))
+                lines.append('%s_sum{%s} %r' % (name, labels, float(histogram.sum)))
+                lines.append('%s_count{%s} %d' % (name, labels, histogram.count))
+            for (metric, operation, label), value in sorted(self.counters.items()):
+                name = '%s_%s_total' % (prefix, metric)
+                if name not in described:
+                    lines.append('# TYPE %s counter' % name)
+                    described.add(name)
+                labels = 'operation="%s"' % operation + (',status="%s"' % label if label else '')
+                lines.append('%s{%s} %d' % (name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def run_hooks(hooks, record):
+    for hook in hooks:
+        try:
+            hook(record)
+        except Exception as e:
+            warnings.warn('pyiress metrics hook %r failed: %s' % (hook, e))
+
+
+def serve_prometheus(port=9464, host='', registry=REGISTRY):
+    '''Serve registry.to_prometheus() on http://host:port/metrics from a daemon thread.'''
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            content = registry.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='pyiress-prometheus', daemon=True).start()
+    return server
+
+
+class OpenTelemetryHook(object):
+    '''
+    Hook recording every call in OpenTelemetry histograms and counters
+    (requires opentelemetry-api; the SDK and exporter are set up by the
+    application).
+
+        iress.add_hook(OpenTelemetryHook())
+    '''
+    def __init__(self, meter=None):
+        if meter is None:
+            from opentelemetry import metrics
+            meter = metrics.get_meter('pyiress')
+        self.duration = meter.create_histogram('pyiress.request.duration', unit='s')
+        self.response_size = meter.create_histogram('pyiress.response.size', unit='By')
+        self.rows = meter.create_histogram('pyiress.response.rows')
+        self.errors = meter.create_counter('pyiress.request.errors')
+        self.retries = meter.create_counter('pyiress.request.retries')
+
+    def __call__(self, record):
+        attributes = {'operation': record['operation']}
+        for phase in PHASES:
+            if record.get(phase) is not None:
+                self.duration.record(record[phase], dict(attributes, phase=phase))
+        if record.get('response_bytes') is not None:
+            self.response_size.record(record['response_bytes'], attributes)
+        if record.get('rows') is not None:
+            self.rows.record(record['rows'], attributes)
+        if record.get('error'):
+            self.errors.add(1, dict(attributes, error=record['error'].split(':')[0]))
+        if record.get('retries'):
+            self.retries.add(record['retries'], attributes)
@@ -0,0 +1,479 @@
+'''
+Offline stand-in for the Iress Pro Desktop web services.
+
+MockIressServer serves a WSDL for the operations used by Iress and answers
+them with deterministic synthetic data, so that pyiress can be exercised and
+benchmarked without Iress credentials:
+
+    from pyiress import Iress
+    from pyiress.mock import MockIressServer
+
+    with MockIressServer(latency=0.01, page_size=500) as server:
+        iress = Iress('company', 'user', 'password', url=server.url, wsdl_cache=False)
+        iress.time_series(start_date, end_date, 'AGL', 'JSE')
+
+It can also be run on its own, by default on the desktop port, so that
+WSDL_URL_GENERIC points at it:
+
+    python -m pyiress.mock --port 51234
+'''
+from __future__ import print_function
+import argparse
+import random
+import threading
+import time
+import uuid
+import zlib
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+import numpy as np
+import pandas as pd
+
+from .decode import SCHEMAS
+
+NAMESPACE = 'http://webservices.iress.com.au/v4/'
+SOAP_NAMESPACE = 'http://schemas.xmlsoap.org/soap/envelope/'
+
+_XSD_TYPES = {'f8': 'xs:double', 'i4': 'xs:int', 'i8': 'xs:long', 'date': 'xs:date',
+              'datetime': 'xs:dateTime', 'bool': 'xs:boolean', 'category': 'xs:string', 'str': 'xs:string'}
+
+# Input parameters of each operation. Scalars are declared as strings (the
+# client sends dates as formatted strings), lists of names become arrays.
+PARAMETERS = {
+    'IRESSSessionStart': ['UserName', 'CompanyName', 'Password', 'ApplicationID'],
+    'TimeSeriesGet2': ['SecurityCode', 'Exchange', 'DataSource', 'Frequency', 'TimeSeriesFromDate',
+                       'TimeSeriesToDate', 'SecurityText'],
+    'TimeSeriesIntraDayGet2': ['SecurityCode', 'Exchange', 'DataSource', 'Frequency', 'TimeSeriesFromDateTime',
+                               'TimeSeriesToDateTime', 'ConsolidationInterval', 'IncludeTradingPeriod',
+                               'SecurityText'],
+    'SecurityDividendGetBySecurity': ['SecurityCode', 'Exchange', 'DataSource', 'PayDateFrom', 'PayDateTo'],
+    'MarketCapitalizationHistoricalGet': ['IndexCode', 'SecurityCode', 'Exchange', 'MarketCapitalizationDateFrom',
+                                          'MarketCapitalizationDateTo'],
+    'PricingQuoteGet': [('SecurityCodeArray', 'SecurityCode'), ('ExchangeArray', 'Exchange'),
+                        ('DataSourceArray', 'DataSource'), 'UserWatchlistProvided',
+                        ('SecurityTextArray', 'SecurityText')],
+}
+
+OUTPUT_COLUMNS = dict(SCHEMAS, IRESSSessionStart=[('IRESSSessionKey', 'str'), ('UserToken', 'str')])
+
+
+def wsdl(address):
+    '''Return the WSDL document of the mock service, bound to `address`.'''
+    types, messages, port_ops, binding_ops = [], [], [], []
+    for op, parameters in PARAMETERS.items():
+        fields = []
+        for p in parameters:
+            if isinstance(p, tuple):
+                fields.append('<xs:element name="%s" minOccurs="0"><xs:complexType><xs:sequence>'
+                              '<xs:element name="%s" type="xs:string" minOccurs="0" maxOccurs="unbounded"/>'
+                              '</xs:sequence></xs:complexType></xs:element>' % p)
+            else:
+                fields.append('<xs:element name="%s" type="xs:string" minOccurs="0" nillable="true"/>' % p)
+        columns = ''.join('<xs:element name="%s" type="%s" minOccurs="0" nillable="true"/>' % (name, _XSD_TYPES[kind])
+                          for name, kind in OUTPUT_COLUMNS[op])
+        types.append('''
+  <xs:complexType name="{op}Parameters"><xs:sequence>{fields}</xs:sequence></xs:complexType>
+  <xs:complexType name="{op}Input"><xs:sequence>
+    <xs:element name="Header" type="tns:InputHeader" minOccurs="0"/>
+    <xs:element name="Parameters" type="tns:{op}Parameters"/>
+  </xs:sequence></xs:complexType>
+  <xs:complexType name="{op}DataRow"><xs:sequence>{columns}</xs:sequence></xs:complexType>
+  <xs:complexType name="{op}DataRows"><xs:sequence>
+    <xs:element name="DataRow" type="tns:{op}DataRow" minOccurs="0" maxOccurs="unbounded"/>
+  </xs:sequence></xs:complexType>
+  <xs:complexType name="{op}Result"><xs:sequence>
+    <xs:element name="DataRows" type="tns:{op}DataRows" minOccurs="0"/>
+  </xs:sequence></xs:complexType>
+  <xs:complexType name="{op}Output"><xs:sequence>
+    <xs:element name="Header" type="tns:OutputHeader" minOccurs="0"/>
+    <xs:element name="Result" type="tns:{op}Result"/>
+  </xs:sequence></xs:complexType>
+  <xs:element name="{op}"><xs:complexType><xs:sequence>
+    <xs:element name="Input" type="tns:{op}Input"/>
+  </xs:sequence></xs:complexType></xs:element>
+  <xs:element name="{op}Response"><xs:complexType><xs:sequence>
+    <xs:element name="Output" type="tns:{op}Output"/>
+  </xs:sequence></xs:complexType></xs:element>'''.format(op=op, fields=''.join(fields), columns=columns))
+        messages.append('<message name="{op}SoapIn"><part name="parameters" element="tns:{op}"/></message>'
+                        '<message name="{op}SoapOut"><part name="parameters" element="tns:{op}Response"/></message>'
+                        .format(op=op))
+        port_ops.append('<operation name="{op}"><input message="tns:{op}SoapIn"/>'
+                        '<output message="tns:{op}SoapOut"/></operation>'.format(op=op))
+        binding_ops.append('<operation name="{op}"><soap:operation soapAction="{ns}{op}" style="document"/>'
+                           '<input><soap:body use="literal"/></input><output><soap:body use="literal"/></output>'
+                           '</operation>'.format(op=op, ns=NAMESPACE))
+    return '''<?xml version="1.0" encoding="utf-8"?>
+<definitions xmlns="http://schemas.xmlsoap.org/wsdl/" xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+    xmlns:xs="http://www.w3.org/2001/XMLSchema" xmlns:tns="{ns}" targetNamespace="{ns}">
+<types>
+ <xs:schema targetNamespace="{ns}" elementFormDefault="qualified">
+  <xs:complexType name="InputHeader"><xs:sequence>
+    <xs:element name="SessionKey" type="xs:string" minOccurs="0"/>
+  </xs:sequence></xs:complexType>
+  <xs:complexType name="OutputHeader"><xs:sequence>
+    <xs:element name="StatusCode" type="xs:int" minOccurs="0"/>
+  </xs:sequence></xs:complexType>{types}
+ </xs:schema>
+</types>
+{messages}
+<portType name="IRESSSoap">{port_ops}</portType>
+<binding name="IRESSSoap" type="tns:IRESSSoap">
+ <soap:binding transport="http://schemas.xmlsoap.org/soap/http"/>{binding_ops}
+</binding>
+<service name="IRESS"><port name="IRESSSoap" binding="tns:IRESSSoap"><soap:address location="{address}"/></port></service>
+</definitions>'''.format(ns=NAMESPACE, types=''.join(types), messages='\n'.join(messages),
+                         port_ops=''.join(port_ops), binding_ops=''.join(binding_ops), address=escape(address))
+
+
+class MockFault(Exception):
+    pass
+
+
+def _seed(*parts):
+    return zlib.crc32('|'.join(str(p) for p in parts).encode('utf-8'))
+
+
+def _parse_date(value):
+    return pd.Timestamp(value.replace('/', '-'))
+
+
+def _security(parameters):
+    text = parameters.get('SecurityText')
+    if text:
+        code = text.split('@')[0].split('|')[0]
+        code, _, exchange = code.partition('.')
+        return code, exchange or parameters.get('Exchange') or 'ASX'
+    return parameters.get('SecurityCode') or 'XXX', parameters.get('Exchange') or 'ASX'
+
+
+def _prices(code, ordinals):
+    '''Deterministic daily price path of a security, evaluated at day ordinals.'''
+    seed = _seed(code)
+    base = 5.0 + seed % 500
+    phase = (seed % 1000) / 100.0
+    noise = np.array([_seed(code, o) % 2000 for o in ordinals]) / 1e5 - 0.01
+    return base * (1.0 + 0.3 * np.sin(np.asarray(ordinals) / 90.0 + phase) + noise)
+
+
+class MockIressServer(object):
+    '''
+    Threaded HTTP server implementing IRESSSessionStart, TimeSeriesGet2,
+    TimeSeriesIntraDayGet2, SecurityDividendGetBySecurity,
+    MarketCapitalizationHistoricalGet and PricingQuoteGet.
+
+    host / port - address to listen on, port 0 picks a free port
+    latency - seconds added to every SOAP response, or a callable(operation)
+              returning the seconds
+    page_size - maximum rows of a TimeSeriesGet2 response, to exercise paging
+    fault_rate - probability that a data request fails with a SOAP fault
+    session_ttl - seconds before a session key expires, None for never
+    index_size - number of constituents of every index
+
+    self.requests counts the requests received per operation.
+    '''
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, page_size=1000, fault_rate=0.0,
+                 session_ttl=None, index_size=50, seed=0):
+        self.latency = latency
+        self.page_size = page_size
+        self.fault_rate = fault_rate
+        self.session_ttl = session_ttl
+        self.index_size = index_size
+        self.requests = {}
+        self._random = random.Random(seed)
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                self._reply(200, server.wsdl().encode('utf-8'))
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, content = server.handle(body)
+                self._reply(status, content)
+
+            def _reply(self, status, content):
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'text/xml; charset=utf-8')
+                    self.send_header('Content-Length', str(len(content)))
+                    self.end_headers()
+                    self.wfile.write(content)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on the request (e.g. it was cancelled)
+                    self.close_connection = True
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.host, self.port = self.httpd.server_address[:2]
+
+    @property
+    def address(self):
+        return 'http://%s:%d/soap.aspx' % (self.host, self.port)
+
+    @property
+    def url(self):
+        '''WSDL url, in the form of WSDL_URL_GENERIC.'''
+        return 'http://%s:%d/wsdl.aspx?un=user&cp=company&svc=IRESS&svr=&pw=password' % (self.host, self.port)
+
+    def wsdl(self):
+        return wsdl(self.address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='MockIressServer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def expire_sessions(self):
+        '''Invalidate every session key handed out so far.'''
+        with self._lock:
+            self._sessions.clear()
+
+    # SOAP handling
+
+    def handle(self, body):
+        '''Answer one SOAP request body with (http status, response bytes).'''
+        try:
+            operation, header, parameters = self._parse(body)
+            with self._lock:
+                self.requests[operation] = self.requests.get(operation, 0) + 1
+            latency = self.latency(operation) if callable(self.latency) else self.latency
+            if latency:
+                time.sleep(latency)
+            if operation == 'IRESSSessionStart':
+                rows = self._session_start(parameters)
+            else:
+                self._check_session(header.get('SessionKey'))
+                if self.fault_rate and self._random.random() < self.fault_rate:
+                    raise MockFault('Server is busy, please try again')
+                rows = getattr(self, '_' + operation)(parameters)
+            return 200, self._response(operation, rows)
+        except MockFault as e:
+            return 500, self._fault(str(e))
+        except Exception as e:
+            return 500, self._fault('%s: %s' % (type(e).__name__, e))
+
+    @staticmethod
+    def _parse(body):
+        root = ET.fromstring(body)
+        request = next(iter(root.find('{%s}Body' % SOAP_NAMESPACE)))
+        operation = request.tag.split('}')[-1]
+        if operation not in PARAMETERS:
+            raise MockFault('Unknown operation %s' % operation)
+        header, parameters = {}, {}
+        for part in request.find('{%s}Input' % NAMESPACE):
+            values = header if part.tag.endswith('}Header') else parameters
+            for child in part:
+                name = child.tag.split('}')[-1]
+                if len(child):
+                    values[name] = [item.text for item in child]
+                else:
+                    values[name] = child.text
+        return operation, header, parameters
+
+    def _check_session(self, key):
+        with self._lock:
+            started = self._sessions.get(key)
+        if started is None or (self.session_ttl is not None and time.monotonic() - started > self.session_ttl):
+            raise MockFault('IRESS session has expired or is invalid')
+
+    def _response(self, operation, rows):
+        columns = [name for name, kind in OUTPUT_COLUMNS[operation]]
+        kinds = dict(OUTPUT_COLUMNS[operation])
+        parts = ['<?xml version="1.0" encoding="utf-8"?><soap:Envelope xmlns:soap="%s" '
+                 'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><soap:Body><%sResponse xmlns="%s">'
+                 '<Output><Header><StatusCode>0</StatusCode></Header><Result><DataRows>'
+                 % (SOAP_NAMESPACE, operation, NAMESPACE)]
+        for row in rows:
+            parts.append('<DataRow>')
+            for name in columns:
+                value = row.get(name)
+                if value is None or (isinstance(value, float) and value != value):
+                    parts.append('<%s xsi:nil="true"/>' % name)
+                else:
+                    parts.append('<%s>%s</%s>' % (name, _format(value, kinds[name]), name))
+            parts.append('</DataRow>')
+        parts.append('</DataRows></Result></Output></%sResponse></soap:Body></soap:Envelope>' % operation)
+        return ''.join(parts).encode('utf-8')
+
+    @staticmethod
+    def _fault(message):
+        return ('<?xml version="1.0" encoding="utf-8"?><soap:Envelope xmlns:soap="%s"><soap:Body><soap:Fault>'
+                '<faultcode>soap:Server</faultcode><faultstring>%s</faultstring></soap:Fault></soap:Body>'
+                '</soap:Envelope>' % (SOAP_NAMESPACE, escape(message))).encode('utf-8')
+
+    # Operations
+
+    def _session_start(self, parameters):
+        key = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[key] = time.monotonic()
+        return [{'IRESSSessionKey': key, 'UserToken': uuid.uuid4().hex}]
+
+    def _TimeSeriesGet2(self, parameters):
+        code, exchange = _security(parameters)
+        if code.startswith('BAD'):
+            raise MockFault('Security %s not found' % code)
+        start, end = _parse_date(parameters['TimeSeriesFromDate']), _parse_date(parameters['TimeSeriesToDate'])
+        days = pd.bdate_range(start, periods=self.page_size)
+        days = days[days <= end]
+        ordinals = [d.toordinal() for d in days]
+        close = _prices(code, ordinals)
+        rows = []
+        for day, ordinal, price in zip(days, ordinals, close):
+            seed = _seed(code, ordinal)
+            volume = float(1000 + seed % 100000)
+            rows.append({'OpenPrice': price * 0.995, 'HighPrice': price * 1.01, 'LowPrice': price * 0.99,
+                         'ClosePrice': price, 'TotalVolume': volume, 'TotalValue': volume * price,
+                         'TradeCount': int(10 + seed % 500), 'AdjustmentFactor': 1.0, 'TimeSeriesDate': day,
+                         'MarketVWAP': price * 1.001, 'ValuationPrice': price})
+        return rows
+
+    def _TimeSeriesIntraDayGet2(self, parameters):
+        code, exchange = _security(parameters)
+        interval = int(parameters.get('ConsolidationInterval') or 1)
+        start = pd.Timestamp(parameters['TimeSeriesFromDateTime'])
+        end = pd.Timestamp(parameters['TimeSeriesToDateTime'])
+        rows = []
+        for day in pd.bdate_range(start.normalize(), end.normalize()):
+            bars = pd.date_range(day + pd.Timedelta(hours=10), day + pd.Timedelta(hours=16),
+                                 freq='%dmin' % interval, inclusive='left')
+            base = _prices(code, [day.toordinal()])[0]
+            for n, bar in enumerate(bars):
+                if bar < start or bar > end:
+                    continue
+                seed = _seed(code, bar.value)
+                price = base * (1 + (seed % 200 - 100) / 1e4)
+                trades = int(1 + seed % 50)
+                volume = float(100 * trades)
+                rows.append({'OpenPrice': price, 'HighPrice': price * 1.002, 'LowPrice': price * 0.998,
+                             'ClosePrice': price, 'TotalVolume': volume, 'TotalValue': volume * price,
+                             'TradeCount': trades, 'TimeSeriesDateTime': bar,
+                             'LastTradeNumberOfTheInterval': day.toordinal() * 100000 + (n + 1) * 50})
+        return rows
+
+    def _SecurityDividendGetBySecurity(self, parameters):
+        code, exchange = _security(parameters)
+        start = _parse_date(parameters['PayDateFrom'])
+        end = _parse_date(parameters['PayDateTo'])
+        seed = _seed(code, 'dividend')
+        rows = []
+        for ex_date in pd.date_range(start, end, freq='182D') + pd.Timedelta(days=seed % 90):
+            if ex_date > end:
+                continue
+            amount = 0.05 + (seed % 100) / 100.0
+            rows.append({'ExDividendDate': ex_date, 'DividendAmount': amount, 'AdjustedDividendAmount': amount,
+                         'FrankedPercent': 100.0, 'PayableDate': ex_date + pd.Timedelta(days=21),
+                         'BooksClosingDate': ex_date + pd.Timedelta(days=2), 'DividendType': 'Final',
+                         'DividendDescription': 'Cash dividend', 'DeclarationDate': ex_date - pd.Timedelta(days=30)})
+        return rows
+
+    def _MarketCapitalizationHistoricalGet(self, parameters):
+        index = parameters.get('IndexCode') or 'XJO'
+        exchange = parameters.get('Exchange') or 'ASX'
+        days = pd.bdate_range(_parse_date(parameters['MarketCapitalizationDateFrom']),
+                              _parse_date(parameters['MarketCapitalizationDateTo']))
+        pool = ['%s%03d' % (index[:2], i) for i in range(int(self.index_size * 1.5))]
+        quarters = {}
+        rows = []
+        for day in days:
+            quarter = day.year * 4 + (day.month - 1) // 3
+            if quarter not in quarters:
+                # Membership rotates every quarter
+                members = [code for code in pool if _seed(index, code, quarter) % 3 != 0][:self.index_size]
+                if parameters.get('SecurityCode'):
+                    members = [code for code in members if code == parameters['SecurityCode']]
+                caps = np.array([1e9 * (1 + _seed(code) % 100) for code in members])
+                quarters[quarter] = members, caps, caps / caps.sum() if len(caps) else caps
+            members, caps, weights = quarters[quarter]
+            for code, cap, weight in zip(members, caps, weights):
+                rows.append({'SecurityCode': code, 'Exchange': exchange, 'GICSCode': 10 + _seed(code) % 50,
+                             'MarketCapitalizationDate': day, 'IndexCode': index, 'IndexFactor': 1.0,
+                             'SharesOnIssue': cap / 10.0, 'MarketCapitalizationStartOfDay': cap,
+                             'MarketCapitalizationEndOfDay': cap, 'MarketWeightStartOfDay': weight,
+                             'MarketWeightEndOfDay': weight})
+        return rows
+
+    def _PricingQuoteGet(self, parameters):
+        texts = parameters.get('SecurityTextArray') or []
+        codes = parameters.get('SecurityCodeArray') or []
+        exchanges = parameters.get('ExchangeArray') or []
+        if parameters.get('UserWatchlistProvided') == 'true':
+            texts = ['W%02d.ASX' % i for i in range(20)]
+        securities = [_security({'SecurityText': text}) for text in texts]
+        securities += [(code, exchanges[i] if i < len(exchanges) else 'ASX') for i, code in enumerate(codes)]
+        if len(securities) > 1000:
+            raise MockFault('Too many securities requested, the maximum is 1000')
+        now = pd.Timestamp.now().floor('s')
+        tick = int(time.time())
+        rows = []
+        for code, exchange in securities:
+            if code.startswith('BAD'):
+                rows.append({'SecurityCode': code, 'Exchange': exchange, 'DataSource': exchange, 'ErrorNumber': 1})
+                continue
+            price = _prices(code, [now.toordinal()])[0] * (1 + (_seed(code, tick) % 100 - 50) / 1e4)
+            rows.append({'SecurityCode': code, 'Exchange': exchange, 'DataSource': exchange, 'ErrorNumber': 0,
+                         'AskCount': 3, 'AskPrice': price * 1.001, 'AskVolume': 1000.0, 'BidCount': 2,
+                         'BidPrice': price * 0.999, 'BidVolume': 1500.0, 'TotalVolume': 1e5, 'TotalValue': 1e5 * price,
+                         'HighPrice': price * 1.01, 'LastPrice': price, 'LowPrice': price * 0.99,
+                         'OpenPrice': price * 0.995, 'Movement': price * 0.005, 'TradingStatus': 'Open',
+                         'TradeCount': 100 + tick % 50, 'TradeDateTime': now, 'UpdateDateTime': now,
+                         'PreviousClosePrice': price * 0.99})
+        return rows
+
+
+def _format(value, kind):
+    if kind == 'date':
+        return pd.Timestamp(value).strftime('%Y-%m-%d')
+    if kind == 'datetime':
+        return pd.Timestamp(value).strftime('%Y-%m-%dT%H:%M:%S')
+    if kind == 'bool':
+        return 'true' if value else 'false'
+    if kind in ('i4', 'i8'):
+        return str(int(value))
+    if kind == 'f8':
+        return repr(float(value))
+    return escape(str(value))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the mock Iress web services.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=51234)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--fault-rate', type=float, default=0.0)
+    parser.add_argument('--session-ttl', type=float, default=None)
+    args = parser.parse_args()
+    server = MockIressServer(args.host, args.port, latency=args.latency, page_size=args.page_size,
+                             fault_rate=args.fault_rate, session_ttl=args.session_ttl)
+    print('Mock Iress web services on', server.url)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
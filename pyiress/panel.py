@@ -0,0 +1,121 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class Panel(object):
+    '''
+    Wide (dates x tickers) float64 arrays, one per field, on the union of the
+    dates of all tickers. Missing values are NaN.
+
+        panel = iress.get_many(start_date, end_date, 'time_series', tickers, 'JSE', layout='panel')
+        close = panel['ClosePrice']          # DataFrame, dates x tickers, no copy
+        panel.values['ClosePrice']           # the ndarray itself
+        panel.to_long()                      # the layout='long' frame
+
+    attrs carries the same metadata as the long frame (attrs['failed']).
+    '''
+    def __init__(self, dates, tickers, values, attrs=None):
+        self.dates = pd.DatetimeIndex(dates, name='date')
+        self.tickers = pd.Index(tickers, name='ticker')
+        self.values = values
+        self.attrs = attrs if attrs is not None else {}
+
+    @property
+    def fields(self):
+        return list(self.values)
+
+    @property
+    def shape(self):
+        return len(self.fields), len(self.dates), len(self.tickers)
+
+    @property
+    def nbytes(self):
+        return sum(v.nbytes for v in self.values.values())
+
+    def __getitem__(self, field):
+        return pd.DataFrame(self.values[field], index=self.dates, columns=self.tickers, copy=False)
+
+    def __contains__(self, field):
+        return field in self.values
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __repr__(self):
+        span = '%s to %s' % (self.dates[0].date(), self.dates[-1].date()) if len(self.dates) else 'no dates'
+        return '<Panel %d fields x %d dates x %d tickers, %s: %s>' % (
+            len(self.fields), len(self.dates), len(self.tickers), span, ', '.join(self.fields))
+
+    def loc(self, start_date=None, end_date=None, tickers=None):
+        '''Sub-panel of the given date range and tickers (views where possible).'''
+        rows = self.dates.slice_indexer(start_date, end_date)
+        cols = slice(None) if tickers is None else self.tickers.get_indexer(tickers)
+        if tickers is not None and (cols < 0).any():
+            raise KeyError([t for t, c in zip(tickers, cols) if c < 0])
+        values = dict((field, v[rows, cols]) for field, v in self.values.items())
+        return Panel(self.dates[rows], self.tickers[cols], values, dict(self.attrs))
+
+    def to_long(self, dropna=True):
+        '''Stack into a frame indexed on (date, ticker), one column per field.'''
+        index = pd.MultiIndex.from_product([self.dates, self.tickers])
+        df = pd.DataFrame(dict((field, v.ravel()) for field, v in self.values.items()), index=index)
+        if dropna:
+            df = df[df.notna().any(axis=1)]
+        df.attrs = dict(self.attrs)
+        return df
+
+
+class PanelBuilder(object):
+    '''
+    Collects per-ticker frames for a Panel. Each frame is reduced to its
+    dates and a float64 block of the requested fields as soon as it is
+    added, so the full frames can be released while other tickers are still
+    being fetched. add() may be called from several threads.
+
+    fields - columns to keep, None for every numeric column of the first
+             frame added
+    '''
+    def __init__(self, fields=None):
+        self.fields = list(fields) if fields else None
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def add(self, ticker, df):
+        if len(df) == 0:
+            return
+        with self._lock:
+            if self.fields is None:
+                self.fields = [c for c in df.columns
+                               if pd.api.types.is_numeric_dtype(df[c]) and not pd.api.types.is_bool_dtype(df[c])]
+        dates = pd.DatetimeIndex(df.index).tz_localize(None).to_numpy(dtype='datetime64[ns]')
+        block = df.reindex(columns=self.fields).to_numpy(dtype=np.float64, na_value=np.nan)
+        with self._lock:
+            self._blocks[ticker] = (dates, block)
+
+    def build(self, tickers=None):
+        '''
+        Return the Panel of the added tickers, in the order of `tickers` if
+        given (tickers never added get all-NaN columns). Where a ticker has
+        several rows on one date, the last one is kept.
+        '''
+        tickers = list(self._blocks) if tickers is None else list(tickers)
+        fields = self.fields or []
+        # The builder hands its blocks over, each one is freed once copied
+        blocks = [self._blocks.pop(t, None) for t in tickers]
+        self._blocks = {}
+        held = [b[0] for b in blocks if b is not None]
+        dates = np.unique(np.concatenate(held)) if held else np.empty(0, dtype='datetime64[ns]')
+        values = dict((field, np.full((len(dates), len(tickers)), np.nan)) for field in fields)
+        for j, block in enumerate(blocks):
+            if block is None:
+                continue
+            rows = np.searchsorted(dates, block[0])
+            for k, field in enumerate(fields):
+                values[field][rows, j] = block[1][:, k]
+            blocks[j] = None
+        return Panel(dates, tickers, values)
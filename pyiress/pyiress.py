@@ -1,28 +1,477 @@
 from __future__ import print_function
+import hashlib
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
 import zeep
-import numpy as np
+from lxml import etree
+from zeep.cache import SqliteCache
+from zeep.transports import Transport
 import pandas as pd
-import warnings
+
+from .cache import ResponseCache, TimeSeriesCache
+from .decode import compact_frame, decode_objects, decode_rows, project
+from .metrics import REGISTRY, new_record, run_hooks
+from .panel import PanelBuilder
+from .retry import CircuitBreaker, RetryPolicy
+from .session import SessionPool, session_expired
+from .stream import QuoteStream
  
 _INFO = """PyIress documentation (GitHub):
 https://github.com/ceaza/pyiress"""
 
 WSDL_URL_GENERIC='http://127.0.0.1:51234/wsdl.aspx?un={username}&cp={companyname}&svc={service}&svr=&pw={password}'
 
+QUOTE_ARRAY_LIMIT = 1000     # entries allowed in a PricingQuoteGet input array
+
+QUOTE_KEY_COLUMNS = ['SecurityCode','Exchange','DataSource','ErrorNumber']     # always decoded by get_quotes
+
+WSDL_CACHE_TIMEOUT = 24 * 3600     # seconds a cached WSDL/XSD document stays valid
+
+# Parsed WSDL documents shared by every Iress object of the process, keyed by url
+_WSDL_DOCUMENTS = {}
+_WSDL_LOCK = threading.Lock()
+
 class PyIressException(Exception):
     pass
 
+
+class CircuitOpenError(PyIressException):
+    '''Raised without calling Iress while the circuit breaker is open.'''
+    pass
+
+
+class _RateLimiter(object):
+    '''
+    Spaces out SOAP requests so that no more than `rate` requests per second
+    are started, however many worker threads share the limiter.
+    '''
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class _PooledTransport(Transport):
+    '''
+    zeep transport backed by one pooled requests.Session, so that concurrent
+    workers reuse keep-alive connections instead of opening a new one per call.
+    Every POST waits on the rate limiter first. The time and payload sizes
+    of the POSTs made by a thread are kept for the metrics of its call
+    (reset_stats / stats), and call_timeout sets the timeout of the POSTs
+    of a thread in place of operation_timeout.
+    '''
+    def __init__(self, pool_size=10, rate_limit=None, proxy=None, **kwargs):
+        self._stats = threading.local()
+        self._timeout = threading.local()
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                                pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if proxy:
+            session.proxies = {'http': proxy, 'https': proxy}
+        super(_PooledTransport, self).__init__(session=session, **kwargs)
+        self.rate_limiter = _RateLimiter(rate_limit)
+
+    @property
+    def operation_timeout(self):
+        timeout = getattr(self._timeout, 'value', None)
+        return timeout if timeout is not None else self._operation_timeout
+
+    @operation_timeout.setter
+    def operation_timeout(self, timeout):
+        self._operation_timeout = timeout
+
+    def call_timeout(self, timeout):
+        '''Timeout in seconds of the POSTs of this thread, None for operation_timeout.'''
+        self._timeout.value = timeout
+
+    def post(self, address, message, headers):
+        self.rate_limiter.wait()
+        start = time.perf_counter()
+        response = super(_PooledTransport, self).post(address, message, headers)
+        stats = getattr(self._stats, 'value', None)
+        if stats is not None:
+            stats[0] += time.perf_counter() - start
+            stats[1] = len(message)
+            stats[2] = len(response.content)
+        return response
+
+    def reset_stats(self):
+        self._stats.value = [0.0, None, None]
+
+    def stats(self):
+        '''(seconds in POSTs, request bytes, response bytes) since reset_stats in this thread.'''
+        return tuple(getattr(self._stats, 'value', None) or (0.0, None, None))
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def intraday_window(freq='minutes',interval=60):
+    '''
+    Longest date range TimeSeriesIntraDayGet2 accepts for freq/interval:
+    under 10 minutes 7 days, 10 to 30 minutes 30 days, over 30 minutes 60
+    days, and for trades twice the consolidation interval in days, at most 60.
+    '''
+    if freq == 'trades':
+        return pd.Timedelta(days=min(2 * int(interval), 60))
+    interval = int(interval)
+    if interval < 10:
+        return pd.Timedelta(days=7)
+    if interval <= 30:
+        return pd.Timedelta(days=30)
+    return pd.Timedelta(days=60)
+
+
+def _split_range(start_date, end_date, window):
+    '''Split [start_date, end_date] into consecutive ranges no longer than window.'''
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    windows = []
+    while True:
+        window_end = min(start_date + window, end_date)
+        windows.append((start_date, window_end))
+        if window_end >= end_date:
+            return windows
+        start_date = window_end
+
+
+class _WsdlCache(SqliteCache):
+    '''
+    zeep SqliteCache of the downloaded WSDL/XSD documents. The Iress WSDL url
+    carries the password, so entries are keyed by a hash of the url.
+    '''
+    def add(self, url, content):
+        super(_WsdlCache, self).add(_url_key(url), content)
+
+    def get(self, url):
+        return super(_WsdlCache, self).get(_url_key(url))
+
+
+def _url_key(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def _wsdl_document(url, transport):
+    '''Return the parsed WSDL of url, parsing it only once per process.'''
+    with _WSDL_LOCK:
+        document = _WSDL_DOCUMENTS.get(url)
+        if document is None:
+            document = _WSDL_DOCUMENTS[url] = zeep.wsdl.Document(url, transport, settings=zeep.Settings())
+    return document
+
+
+# Request parameters and frame post-processing shared by Iress and AsyncIress
+
+MANY_DATE_FIELDS = {'dividends':'ExDividendDate',
+                    'time_series':'TimeSeriesDate'}
+
+
+def _securitytext(ticker):
+    '''Tickers written as CODE.EXCHANGE or CODE@EXCHANGE are sent as SecurityText.'''
+    return ticker if ticker.find('.')>-1 or ticker.find('@')>-1 else ''
+
+
+def _time_series_parameters(start_date, end_date, ticker='', exchange='', securitytext='', freq='daily'):
+    if ticker != '' and exchange!='':
+        return {'Parameters':  {'SecurityCode': ticker,
+                                'Exchange': exchange,
+                                'Frequency':freq,
+                                'TimeSeriesFromDate':start_date.strftime('%Y/%m/%d'),
+                                'TimeSeriesToDate':end_date.strftime('%Y/%m/%d')
+                        } }
+    elif securitytext !='':
+        return {'Parameters':  {'SecurityText':securitytext,
+                                'Frequency':freq,
+                                'TimeSeriesFromDate':start_date.strftime('%Y/%m/%d'),
+                                'TimeSeriesToDate':end_date.strftime('%Y/%m/%d')
+                        }}
+    raise PyIressException('Either ticker and exchange, or securitytext, must be given')
+
+
+def _page_after(df, part_date):
+    '''Rows of a time series page on or after the cursor, None when there are none.'''
+    if len(df)==0:
+        return None
+    df = df[df.index>=part_date]
+    # The server may return nothing past the cursor
+    return df if len(df)>0 else None
+
+
+def _columns(fields, *required):
+    '''Columns to decode for `fields` (None for all when no fields are given).'''
+    if not fields:
+        return None
+    return list(fields) + [name for name in required if name not in fields]
+
+
+def _index_on(df, column):
+    if len(df)==0:
+        return df
+    df[column]=pd.to_datetime(df[column])
+    return df.set_index(column)
+
+
+def _dividend_parameters(ticker, exchange, start_date, end_date):
+    return {'Parameters':  {'SecurityCode': ticker,
+                            'Exchange': exchange,
+                            'PayDateFrom':start_date.strftime('%Y/%m/%d'),
+                            'PayDateTo':end_date.strftime('%Y/%m/%d')
+                    } }
+
+
+def _market_cap_parameters(indexcode, ticker, exchange, start_date, end_date):
+    parameters = {'IndexCode':indexcode,
+                  'SecurityCode': ticker,
+                  'Exchange': exchange,
+                  'MarketCapitalizationDateFrom':start_date.strftime('%Y/%m/%d'),
+                  'MarketCapitalizationDateTo':end_date.strftime('%Y/%m/%d')}
+    return {'Parameters': {k:v for k,v in parameters.items() if v is not None}}
+
+
+def _intraday_parameters(ticker, exchange, start_date, end_date, freq, interval):
+    return {'Parameters':  {'SecurityCode': ticker,
+                            'Exchange': exchange,
+                            'Frequency':freq,
+                            'TimeSeriesFromDateTime':start_date.strftime('%Y-%m-%dT%H:%M:%S%Z'),
+                            'TimeSeriesToDateTime': end_date.strftime('%Y-%m-%dT%H:%M:%S%Z'),
+                            'ConsolidationInterval':str(interval)
+                    } }
+
+
+def _intraday_frame(df):
+    if len(df)==0:
+        return df
+    df['TimeSeriesDate'] = pd.to_datetime(df.TimeSeriesDateTime)
+    df['TimeSeriesDate'] = df.TimeSeriesDate.dt.tz_localize('America/New_York')
+    return df.set_index('TimeSeriesDate')
+
+
+def _stitch_windows(data_list):
+    '''Concatenate intraday windows, dropping the bars repeated on their edges.'''
+    data_list = [data for data in data_list if len(data)>0]
+    if len(data_list)==0:
+        return pd.DataFrame()
+    df = pd.concat(data_list)
+    keys = [c for c in ['TimeSeriesDateTime','LastTradeNumberOfTheInterval'] if c in df.columns]
+    df = df[~df.duplicated(subset=keys)] if keys else df
+    return df.sort_index(kind='stable')
+
+
+def _quote_requests(ticker=[], exchange=[], watchlist=False, tickers=''):
+    '''PricingQuoteGet parameters, split into arrays of at most QUOTE_ARRAY_LIMIT entries.'''
+    if isinstance(tickers,str):
+        tickers = [tickers] if tickers else []
+    if isinstance(ticker,str):
+        ticker = [ticker] if ticker else []
+    if len(tickers)>0:
+        return [{'Parameters':  {'SecurityTextArray':{'SecurityText':chunk}}}
+                for chunk in _chunks(tickers,QUOTE_ARRAY_LIMIT)]
+    elif len(ticker)>0 and not watchlist:
+        if isinstance(exchange,str):
+            exchange = [exchange]*len(ticker) if exchange else []
+        requests_list = []
+        for i in range(0,len(ticker),QUOTE_ARRAY_LIMIT):
+            parameters = {'SecurityCodeArray':{'SecurityCode':ticker[i:i+QUOTE_ARRAY_LIMIT]}}
+            if len(exchange)>0:
+                parameters['ExchangeArray'] = {'Exchange':exchange[i:i+QUOTE_ARRAY_LIMIT]}
+            requests_list.append({'Parameters':parameters})
+        return requests_list
+    elif watchlist:
+        return [{'Parameters':  {'UserWatchlistProvided':watchlist,'SecurityTextArray':{'SecurityText':ticker},
+                        }}]
+    return [{}]
+
+
+def _quote_securities(parameters):
+    '''Securities requested by a PricingQuoteGet parameters dict.'''
+    parameters = parameters.get('Parameters') or {}
+    for array, item in (('SecurityTextArray','SecurityText'), ('SecurityCodeArray','SecurityCode')):
+        if parameters.get(array):
+            return list(parameters[array][item])
+    return []
+
+
+def _quote_frame(data_list):
+    '''
+    Concatenate quote chunks. Rows with a non-zero ErrorNumber are left out
+    and listed in attrs['errors'] as (SecurityCode, Exchange, ErrorNumber).
+    '''
+    data_list = [data for data in data_list if len(data)>0]
+    if len(data_list)==0:
+        df = pd.DataFrame()
+        df.attrs['errors'] = []
+        return df
+    df = pd.concat(data_list,ignore_index=True)
+    errors = []
+    if 'ErrorNumber' in df.columns:
+        failed = df.ErrorNumber.fillna(0)!=0
+        # plain values only, pandas compares attrs when frames are combined
+        errors = [(code, exchange, int(number)) for code, exchange, number in
+                  df[failed].reindex(columns=['SecurityCode','Exchange','ErrorNumber']).astype(object)
+                  .itertuples(index=False)]
+        df = df[~failed]
+    keys = [c for c in ['SecurityCode','Exchange','DataSource'] if c in df.columns]
+    if keys:
+        df = df.set_index(keys)
+    df.attrs['errors'] = errors
+    return df
+
+
+def _error_text(error):
+    return '%s: %s' % (type(error).__name__, error)
+
+
+def _partial(df, error, complete_to=None, missing=None):
+    '''
+    Mark df as incomplete, for calls made with raise_on_error=False:
+    df.attrs['partial'] = {'error': 'Type: message' of the first failure,
+    'complete_to': last date up to which the data is complete (None if
+    nothing was received), 'missing': the ranges or securities not received}.
+    '''
+    df.attrs['partial'] = {'error': _error_text(error), 'complete_to': complete_to, 'missing': missing or []}
+    warnings.warn('Partial result, %s' % df.attrs['partial']['error'])
+    return df
+
+
+def _pages_frame(pages, error, start_date, end_date):
+    '''Time series pages received before `error`, as a partial result.'''
+    df = pd.concat(pages) if pages else pd.DataFrame()
+    complete_to = pages[-1].index.max() if pages else None
+    missing_from = complete_to + pd.DateOffset(1,'D') if pages else pd.Timestamp(start_date)
+    return _partial(df,error,complete_to,[(missing_from,pd.Timestamp(end_date))])
+
+
+def _intraday_result(windows, data_list):
+    '''Stitch the (frame or exception) results of the intraday windows, partial if any failed.'''
+    failed = [i for i, data in enumerate(data_list) if isinstance(data, BaseException)]
+    df = _stitch_windows([data for data in data_list if not isinstance(data, BaseException)])
+    if failed:
+        # windows share their edges, so the data is complete up to the first failed one
+        return _partial(df,data_list[failed[0]],windows[failed[0]][0] if failed[0] else None,
+                        [windows[i] for i in failed])
+    return df
+
+
+def _quote_result(requests_list, data_list):
+    '''Quote frame of the (frame or exception) results of the chunks, partial if any failed.'''
+    failed = [(parameters, data) for parameters, data in zip(requests_list, data_list)
+              if isinstance(data, BaseException)]
+    df = _quote_frame([data for data in data_list if not isinstance(data, BaseException)])
+    if failed:
+        return _partial(df,failed[0][1],missing=[security for parameters, _ in failed
+                                                 for security in _quote_securities(parameters)])
+    return df
+
+
+def _many_failed(results):
+    '''{ticker: error message} of the (ticker, result or exception) results of get_many.'''
+    failed = dict((ticker, _error_text(data)) for ticker, data in results if isinstance(data, BaseException))
+    if failed:
+        warnings.warn('%d of %d tickers failed: %s' % (len(failed), len(results), ', '.join(failed)))
+    return failed
+
+
+def _many_partial(results):
+    '''{ticker: attrs['partial']} of the results of get_many that are incomplete.'''
+    return dict((ticker, data.attrs['partial']) for ticker, data in results
+                if not isinstance(data, BaseException) and data.attrs.get('partial'))
+
+
+def _many_frame(results, data_type, exchange, compact=False):
+    '''
+    Stack the (ticker, frame or exception) results of get_many on a
+    (date, ticker) index. Failed tickers are listed in attrs['failed'] and
+    incomplete ones in attrs['partial'].
+    '''
+    data_list=[]
+    failed = _many_failed(results)
+    for ticker, data in results:
+        if isinstance(data, BaseException):
+            continue
+        if len(data)>0:
+            data=data.reset_index()
+            data['ticker']=ticker
+            data['exchange']=exchange
+            data=data.set_index([MANY_DATE_FIELDS[data_type],'ticker'])
+            data_list.append(data)
+    df_data=pd.concat(data_list) if data_list else pd.DataFrame()
+    if compact and len(df_data)>0:
+        df_data['exchange']=df_data['exchange'].astype('category')
+    df_data.attrs = {'failed': failed, 'partial': _many_partial(results)}
+    return df_data
+
+
 class Iress(object):
     def __init__(self, companyname,username, password, service='IRESS',raise_on_error=True, show_request=False,
-                 proxy=None, **kwargs):
+                 proxy=None, pool_size=10, rate_limit=None, cache=None, fast_decode=True,
+                 wsdl_cache=True, lazy=False, sessions=1, session_max_age=None, response_cache=None,
+                 metrics=True, retry=True, circuit_breaker=None, compact=False, **kwargs):
         """Establish a connection to the IRESS Web Services with Version 4 desktop.
 
            companyname / username / password - credentials for the Iress account.
            service - only service for desktop version is IRESS.
-           raise_on_error - If True then error request will raise a "IressException",
-                            otherwise either empty dataframe or partially
-                            retrieved data will be returned
+           raise_on_error - If True then a request that still fails after its
+                            retries raises, otherwise the data received
+                            so far is returned with the failure described
+                            in df.attrs['partial'] (see _partial)
            show_request - If True, then every time a request string will be printed
+           proxy - optional HTTP proxy url used for all requests
+           pool_size - number of keep-alive HTTP connections shared by the
+                       worker threads of get_many(workers=...)
+           rate_limit - maximum number of SOAP requests per second, None for
+                        no limit
+           cache - a TimeSeriesCache, or the path of its SQLite file, used to
+                   serve time_series history locally and only top it up
+           fast_decode - If True, data rows are decoded from the raw XML
+                         straight into typed columns (see decode_rows),
+                         otherwise through zeep objects (decode_objects).
+                         Both give the same frame.
+           wsdl_cache - True to keep the downloaded WSDL/XSD in zeep's default
+                        SQLite cache, a path for a specific cache file, or
+                        False to always download it. Within a process the
+                        parsed WSDL is shared by all Iress objects.
+           lazy - If True, the WSDL is loaded and the session started on the
+                  first data call (or connect()) rather than here
+           sessions - number of Iress sessions concurrent calls are spread
+                      over; calls share a session and never wait for one. A
+                      call whose session has expired logs in again and is
+                      retried once. See self.sessions.metrics().
+           session_max_age - seconds after which a session is renewed before
+                             use, None to renew only when it expires
+           response_cache - a ResponseCache (or True for a default one)
+                            serving repeated requests from memory and
+                            merging identical concurrent requests into one
+           metrics - MetricsRegistry aggregating a record of every call
+                     (True for pyiress.metrics.REGISTRY, False for none).
+                     Records also go to the hooks (add_hook) and to
+                     last_status. The registry is kept in self.registry.
+           retry - RetryPolicy for transient failures (connection errors,
+                   timeouts, HTTP 5xx, busy faults) with exponential backoff
+                   and per-endpoint timeouts. True for the default policy,
+                   False for a single attempt.
+           circuit_breaker - a CircuitBreaker (or True for a default one)
+                             failing calls at once with CircuitOpenError
+                             after repeated transient failures, until the
+                             gateway recovers
+           compact - If True, frames use float32 prices, nullable integer
+                     counts and categorical SecurityCode / Exchange /
+                     DataSource instead of float64 and object columns
 
            A custom WSDL url (if necessary for some reasons) could be provided
            via "url" parameter.
@@ -60,29 +509,78 @@ class Iress(object):
             })
         self.raise_on_error = raise_on_error
         self.last_status = None     # Will contain status of last request
+        self.registry = REGISTRY if metrics is True else (metrics or None)
+        self.hooks = []
+        self.cache = TimeSeriesCache(cache) if isinstance(cache, str) else cache
+        self.response_cache = ResponseCache() if response_cache is True else response_cache
+        if retry is True:
+            retry = RetryPolicy()
+        self.retry = retry or RetryPolicy(attempts=1)
+        self.circuit_breaker = CircuitBreaker() if circuit_breaker is True else circuit_breaker
+        self.fast_decode = fast_decode
+        self.compact = compact
         WSDL_URL = WSDL_URL_GENERIC.format(companyname=companyname,username=username,password=password,service=service)
         self._url = kwargs.pop('url', WSDL_URL)
-        # Trying to connect
-        try:
-            self.client = zeep.Client(wsdl=WSDL_URL)
-        except:
-            raise PyIressException('Cannot Connect')
-
-#       Create session
-        login_details={'UserName': username,
+        if wsdl_cache:
+            wsdl_cache = _WsdlCache(path=None if wsdl_cache is True else wsdl_cache, timeout=WSDL_CACHE_TIMEOUT)
+        self.pool_size = pool_size
+        self.transport = _PooledTransport(pool_size=pool_size, rate_limit=rate_limit, proxy=proxy,
+                                          cache=wsdl_cache or None)
+        self._login_details={'UserName': username,
                         'CompanyName': companyname,
                         'Password': password,
                         'ApplicationID': 'app'}
-        IRESSSessionStartInputHeader = {"Parameters":login_details}
-        self.session=self.client.service.IRESSSessionStart(Input=IRESSSessionStartInputHeader)
-        self.IRESSSessionKey=self.session.Result.DataRows.DataRow[0].IRESSSessionKey
-        self.UserToken=self.session.Result.DataRows.DataRow[0].UserToken
+        self._client = None
+        self._pool_sessions = sessions
+        self._session_max_age = session_max_age
+        self.sessions = None
+        self._connect_lock = threading.Lock()
         self.last_response = None
-        self.header={'Header':{'SessionKey':self.IRESSSessionKey}}
 
         # Check available data sources
         if 'IRESS' not in self.services:
             warnings.warn("'IRESS' source is not available for given subscription!")
+        if not lazy:
+            self.connect()
+
+    def connect(self):
+        '''
+        Load the WSDL and start an Iress session. Called by the constructor,
+        or by the first data call when the client was created with lazy=True.
+        '''
+        with self._connect_lock:
+            if self.sessions is not None:
+                return
+            # Trying to connect
+            try:
+                self._client = zeep.Client(wsdl=_wsdl_document(self._url, self.transport), transport=self.transport)
+            except:
+                raise PyIressException('Cannot Connect')
+
+            # Create session
+            sessions = SessionPool(self._start_session, size=self._pool_sessions, max_age=self._session_max_age)
+            first = sessions.first()
+            self.IRESSSessionKey=first.key
+            self.UserToken=first.token
+            self.sessions = sessions
+
+    def _start_session(self):
+        IRESSSessionStartInputHeader = {"Parameters":self._login_details}
+        self.session=self._client.service.IRESSSessionStart(Input=IRESSSessionStartInputHeader)
+        row = self.session.Result.DataRows.DataRow[0]
+        return row.IRESSSessionKey, row.UserToken
+
+    @property
+    def client(self):
+        if self.sessions is None:
+            self.connect()
+        return self._client
+
+    @property
+    def header(self):
+        if self.sessions is None:
+            self.connect()
+        return self.sessions.first().header
 
     @staticmethod
     def info():
@@ -99,7 +597,121 @@ class Iress(object):
         return res
 
 
-    def _time_series(self,start_date, end_date, ticker = '',exchange = '',securitytext = '',freq = 'daily'):
+    def _call(self,operation,inputs,columns=None):
+        '''
+        Run a data operation on a pooled session and return its DataRows as
+        a DataFrame, decoding only `columns` (None for all). If the session
+        has expired it is logged in again and the request retried once.
+        Transient failures are retried as set by self.retry. With a
+        response_cache, a fresh cached response is returned instead.
+        '''
+        if self.response_cache is not None:
+            # Whole responses are cached, so that calls for other columns share them
+            df = self.response_cache.fetch(operation,inputs,lambda: self._call_session(operation,inputs))
+            return project(df,columns)
+        return self._call_session(operation,inputs,columns)
+
+    def add_hook(self,hook):
+        '''Call hook(record) after every SOAP call (see pyiress.metrics for the record).'''
+        self.hooks.append(hook)
+
+    def remove_hook(self,hook):
+        self.hooks.remove(hook)
+
+    def _call_session(self,operation,inputs,columns=None):
+        if self.sessions is None:
+            self.connect()
+        record = new_record(operation,inputs)
+        start = time.perf_counter()
+        self.transport.reset_stats()
+        self.transport.call_timeout(self.retry.timeout(operation))
+        breaker = self.circuit_breaker
+        try:
+            attempt = 1
+            while True:
+                if breaker is not None and not breaker.allow():
+                    raise CircuitOpenError('Circuit open after repeated failures, retry in %.1fs'
+                                           % breaker.retry_after())
+                try:
+                    df = self._attempt(operation,inputs,record,columns)
+                except Exception as e:
+                    if not self.retry.retryable(e):
+                        # The gateway answered, the request itself is wrong
+                        if breaker is not None:
+                            breaker.success()
+                        raise
+                    if breaker is not None:
+                        breaker.failure()
+                    if attempt >= self.retry.attempts:
+                        raise
+                    record['retries'] += 1
+                    time.sleep(self.retry.delay(attempt))
+                    attempt += 1
+                    continue
+                if breaker is not None:
+                    breaker.success()
+                return df
+        except Exception as e:
+            record['error'] = _error_text(e)
+            raise
+        finally:
+            self.transport.call_timeout(None)
+            record['total'] = time.perf_counter() - start
+            record['network'], record['request_bytes'], record['response_bytes'] = self.transport.stats()
+            self._observe(record)
+
+    def _attempt(self,operation,inputs,record,columns=None):
+        '''One attempt of a call, on a pooled session released before any backoff.'''
+        session = self.sessions.acquire()
+        try:
+            key = session.key
+            try:
+                return self._request(operation,dict(inputs,**session.header),record,columns)
+            except zeep.exceptions.Fault as e:
+                if not session_expired(e):
+                    raise
+            record['retries'] += 1
+            # Callers sharing the session log in again once
+            self.sessions.relogin(session,key)
+            return self._request(operation,dict(inputs,**session.header),record,columns)
+        finally:
+            self.sessions.release(session)
+
+    def _observe(self,record):
+        self.last_status = record
+        if self.registry is not None:
+            self.registry.observe(record)
+        if self.hooks:
+            run_hooks(self.hooks,record)
+
+    def _request(self,operation,inputs,record=None,columns=None):
+        record = {} if record is None else record
+        service = getattr(self.client.service,operation)
+        if self.fast_decode:
+            with self.client.settings(raw_response=True):
+                response = service(Input=inputs)
+            try:
+                df = decode_rows(response.content,operation,timings=record,columns=columns,compact=self.compact)
+            except etree.XMLSyntaxError:
+                raise zeep.exceptions.TransportError(status_code=response.status_code,content=response.content)
+            record['rows'] = len(df)
+            return df
+        start = time.perf_counter()
+        network = self.transport.stats()[0]
+        res = service(Input=inputs)
+        # zeep parses the XML into objects inside the service call
+        record['parse'] = time.perf_counter() - start - (self.transport.stats()[0] - network)
+        start = time.perf_counter()
+        if res.Result.DataRows is None or not res.Result.DataRows.DataRow:
+            df = pd.DataFrame()
+        else:
+            df = decode_objects(zeep.helpers.serialize_object(res.Result.DataRows.DataRow),operation,
+                                columns=columns,compact=self.compact)
+        record['build'] = time.perf_counter() - start
+        record['rows'] = len(df)
+        return df
+
+    def _time_series(self,start_date, end_date, ticker = '',exchange = '',securitytext = '',freq = 'daily',fields = None):
         '''
         
         Pos Name Type Nullable? Default Value Array? Array Size Description Alias
@@ -151,57 +763,90 @@ class Iress(object):
         15 ValuationPrice double Yes    The valuation price at end of day 
 
         '''
-        if ticker != '' and exchange!='':
-            parameters={'Parameters':  {'SecurityCode': ticker,
-                                      'Exchange': exchange,
-                                      'Frequency':freq,
-                                      'TimeSeriesFromDate':start_date.strftime('%Y/%m/%d'),
-                                      'TimeSeriesToDate':end_date.strftime('%Y/%m/%d')
-                              } } 
-        elif securitytext !='':
-            parameters={'Parameters':  {'SecurityText':securitytext,
-                                        'Frequency':freq,
-                                        'TimeSeriesFromDate':start_date.strftime('%Y/%m/%d'),
-                                        'TimeSeriesToDate':end_date.strftime('%Y/%m/%d')
-                                }}         
+        parameters=_time_series_parameters(start_date,end_date,ticker,exchange,securitytext,freq)
         inputs={**self.header, **parameters}
-        res=self.client.service.TimeSeriesGet2(Input=inputs)
-        data=zeep.helpers.serialize_object(res.Result.DataRows.DataRow)
-        df=pd.DataFrame(data)
-        df['TimeSeriesDate']=pd.to_datetime(df.TimeSeriesDate)
-        df=df.set_index('TimeSeriesDate')
-
-        return df
+        df=self._call('TimeSeriesGet2',inputs,_columns(fields,'TimeSeriesDate'))
+        return _index_on(df,'TimeSeriesDate')
 
 
-    def time_series(self,start_date,end_date,ticker,exchange='',freq='daily',fields=[]):
+    def time_series(self,start_date,end_date,ticker,exchange='',freq='daily',fields=[],use_cache=True):
         '''
 
         Available fields  - ['OpenPrice', 'HighPrice', 'LowPrice', 'ClosePrice', 'TotalVolume',
                            'TotalValue', 'TradeCount', 'AdjustmentFactor', 'MarketVWAP',
                            'ShortSold', 'ShortSoldPercent', 'ShortSellPosition',
-                           'ShortSellPositionPercent', '_value_1', 'exchange']
+                           'ShortSellPositionPercent', 'ValuationPrice']
+
+        fields - columns returned, all if empty. The other columns are not
+                 decoded from the response.
+
+        If the client was created with a cache, only the part of
+        [start_date, end_date] that is not stored locally is requested from
+        Iress (see TimeSeriesCache). use_cache=False bypasses the cache.
+
+        With raise_on_error=False a failure part way returns the pages
+        received (or the cached rows) with attrs['partial']['complete_to']
+        set to the last date held from start_date on and
+        attrs['partial']['missing'] the ranges not received, so that the rest
+        can be requested later.
 
         '''
-        part_date=start_date
-        data=pd.DataFrame()
-        if ticker.find('.')>-1:
-            securitytext = ticker
-        elif ticker.find('@')>-1:
-            securitytext = ticker
-        else:
-            securitytext = ''
-        while part_date < pd.Timestamp(end_date):
+        if self.cache is not None and use_cache:
+            # The cache stores every column
+            fetch = lambda start, end: self._fetch_time_series(start,end,ticker,exchange,freq)
             try:
-                new_data=self._time_series(part_date,end_date,ticker = ticker,exchange = exchange,securitytext = securitytext,freq = 'daily')
-                data=pd.concat([data,new_data])
-                part_date = data.index.max() + pd.DateOffset(1,'D')
-            except:
-                break
-            
-        return data
-    
-    def dividends(self,ticker,exchange,start_date,end_date,freq=None,index_on='ExDividendDate'):
+                df = self.cache.fetch(fetch,ticker,exchange,freq,start_date,end_date)
+            except Exception as e:
+                if self.raise_on_error:
+                    raise
+                # Nothing is stored for a failed fetch, the cache holds complete ranges only
+                df = self.cache.get(ticker,exchange,freq,start_date,end_date)
+                missing = self.cache.missing(ticker,exchange,freq,start_date,end_date)
+                # Complete from start_date up to the first missing day, if the head is held
+                complete_to = None
+                if missing and missing[0][0] > pd.Timestamp(start_date).normalize():
+                    complete_to = missing[0][0] - pd.DateOffset(1,'D')
+                df = _partial(df,e,complete_to,missing)
+            df = project(df,fields or None)
+            return compact_frame(df,'TimeSeriesGet2') if self.compact else df
+        return self._fetch_time_series(start_date,end_date,ticker,exchange,freq,partial=not self.raise_on_error,
+                                       fields=fields)
+
+    def _fetch_time_series(self,start_date,end_date,ticker,exchange='',freq='daily',partial=False,fields=None):
+        pages = []
+        try:
+            for page in self.iter_time_series(start_date,end_date,ticker,exchange,freq,fields):
+                pages.append(page)
+        except Exception as e:
+            if not partial:
+                raise
+            return _pages_frame(pages,e,start_date,end_date)
+        if len(pages)==0:
+            return pd.DataFrame()
+        return pd.concat(pages)
+
+    def iter_time_series(self,start_date,end_date,ticker,exchange='',freq='daily',fields=None):
+        '''
+        Yield the history of time_series() one TimeSeriesGet2 page at a time,
+        as each page arrives, so that long histories can be streamed to disk
+        without holding them in memory.
+
+        The next page is requested from the day after the last date received.
+        Paging stops when a page is empty or makes no progress past the
+        cursor. Request errors are raised, not swallowed.
+        '''
+        securitytext = _securitytext(ticker)
+        part_date = pd.Timestamp(start_date)
+        end_date = pd.Timestamp(end_date)
+        while part_date <= end_date:
+            new_data=self._time_series(part_date,end_date,ticker = ticker,exchange = exchange,securitytext = securitytext,freq = freq,fields = fields)
+            new_data = _page_after(new_data,part_date)
+            if new_data is None:
+                return
+            yield new_data
+            part_date = new_data.index.max() + pd.DateOffset(1,'D')
+
+    def dividends(self,ticker,exchange,start_date,end_date,freq=None,index_on='ExDividendDate',fields=None):
         '''
         SecurityCode string Yes  No  The security code to filter by.  
         Exchange string Yes  No  The exchange to filter by.  
@@ -213,31 +858,26 @@ class Iress(object):
         available fields = ['DividendAmount', 'AdjustedDividendAmount', 'FrankedPercent',
                            'PayableDate', 'BooksClosingDate', 'DividendType', 'ShareRate',
                            'DividendYield', 'DRPPrice', 'DividendDescription', 'DeclarationDate',
-                           'STCCreditsPerShare', '_value_1', 'exchange']
+                           'STCCreditsPerShare']
+
+        fields - columns returned (besides index_on), all if None
         '''
-        parameters={'Parameters':  {'SecurityCode': ticker,
-                          'Exchange': exchange,
-                          'PayDateFrom':start_date.strftime('%Y/%m/%d'),
-                          'PayDateTo':end_date.strftime('%Y/%m/%d')
-                          } } 
-        
+        parameters=_dividend_parameters(ticker,exchange,start_date,end_date)
         inputs={**self.header, **parameters}
-        
         try:
-            res=self.client.service.SecurityDividendGetBySecurity(Input=inputs)
-            data=zeep.helpers.serialize_object(res.Result.DataRows.DataRow)
-            df=pd.DataFrame(data)
-            df[index_on]=pd.to_datetime(df[index_on])
-            df=df.set_index(index_on)
-        except:
-            df=pd.DataFrame()
-        
-        return df
+            df=self._call('SecurityDividendGetBySecurity',inputs,_columns(fields,index_on))
+        except Exception as e:
+            if self.raise_on_error:
+                raise
+            return _partial(pd.DataFrame(),e,missing=[(pd.Timestamp(start_date),pd.Timestamp(end_date))])
+        return _index_on(df,index_on)
 
-    def MarketCapitalizationHistorical(self,indexcode,ticker,exchange,start_date,end_date):
+    def MarketCapitalizationHistorical(self,indexcode,ticker,exchange,start_date,end_date,fields=None):
         '''
         Input Parameters
         For the items that are nullable input None
+
+        fields - output columns returned, all if None
         
         Pos     Name        Type Nullable? DefaultValue Array? ArraySize Description Alias
         1       IndexCode   string Yes  No  The index to filter by.  
@@ -266,52 +906,93 @@ class Iress(object):
         
         '''
         
-        parameters={'Parameters':  {'IndexCode':indexcode,
-                    'SecurityCode': ticker,
-                      'Exchange': exchange,
-                      'MarketCapitalizationDateFrom':start_date.strftime('%Y/%m/%d'),
-                      'MarketCapitalizationDateTo':end_date.strftime('%Y/%m/%d')
-                      } } 
-        remove_key=[]
-        for k,v in  parameters['Parameters'].items():
-            if v==None:
-                remove_key.append(k)
-        for k in remove_key:
-            del parameters['Parameters'][k]
-        
+        parameters=_market_cap_parameters(indexcode,ticker,exchange,start_date,end_date)
         inputs={**self.header, **parameters}
-        res = self.client.service.MarketCapitalizationHistoricalGet(Input=inputs)
-        data=zeep.helpers.serialize_object(res.Result.DataRows.DataRow)
-        df=pd.DataFrame(data)
+        try:
+            df = self._call('MarketCapitalizationHistoricalGet',inputs,_columns(fields))
+        except Exception as e:
+            if self.raise_on_error:
+                raise
+            return _partial(pd.DataFrame(),e,missing=[(pd.Timestamp(start_date),pd.Timestamp(end_date))])
         return df
 
 
-    def get_many(self,start_date,end_date,data_type,tickers,exchange = '',freq='daily'):
+    def get_many(self,start_date,end_date,data_type,tickers,exchange = '',freq='daily',workers=1,
+                 layout='long',fields=None):
         '''
-        
+        Retrieve `data_type` ('time_series' or 'dividends') for every ticker in
+        `tickers` and return one frame indexed on (date, ticker).
+
+        workers - number of tickers fetched concurrently. The threads share the
+                  pooled HTTP connections and the rate limit of this client.
+        layout - 'long' for the (date, ticker) frame, 'panel' for a Panel:
+                 one dates x tickers float64 array per field on the union
+                 of the dates, filled as each ticker arrives. Much lighter
+                 than unstacking the long frame.
+        fields - columns returned, None for all (all numeric columns in a
+                 panel). Only these are decoded from the responses.
+
+        A ticker that fails does not abort the batch. Failures are collected in
+        df.attrs['failed'] (and self.last_status) as {ticker: error message}
+        and reported with a warning. With raise_on_error=False, tickers whose
+        data is incomplete are listed in df.attrs['partial'] as {ticker:
+        partial metadata}. If every ticker fails the frame is empty.
         '''
-        data_list=[]
-        date_field={'dividends':'ExDividendDate',
-        'time_series':'TimeSeriesDate'}
-        if data_type not in ['dividends','time_series']:
+        if data_type not in MANY_DATE_FIELDS:
             warnings.warn("Not available for this data type")
             return
         method_to_call = getattr(self, data_type)
-        for ticker in tickers:
-            data=method_to_call(start_date,end_date,ticker=ticker,exchange=exchange,freq=freq)
-            if len(data)>0:
-                data=data.reset_index()
-                data['ticker']=ticker
-                data['exchange']=exchange
-                data=data.set_index([date_field[data_type],'ticker'])
-                data_list.append(data)
-        df_data=pd.concat(data_list)
+
+        def fetch(ticker):
+            return method_to_call(start_date=start_date,end_date=end_date,ticker=ticker,exchange=exchange,freq=freq,
+                                  fields=fields)
+
+        if layout == 'panel':
+            builder = PanelBuilder(fields)
+            fetch_frame = fetch
+            def fetch(ticker):
+                df = fetch_frame(ticker)
+                builder.add(ticker,df)
+                # only the attrs are kept, the values are in the builder
+                return df.iloc[:0]
+        elif layout != 'long':
+            raise PyIressException("layout must be 'long' or 'panel'")
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [(ticker, executor.submit(fetch, ticker)) for ticker in tickers]
+        else:
+            futures = [(ticker, None) for ticker in tickers]
+
+        results = []
+        for ticker, future in futures:
+            try:
+                results.append((ticker, future.result() if future is not None else fetch(ticker)))
+            except Exception as e:
+                results.append((ticker, e))
+        if layout == 'panel':
+            df_data = builder.build(tickers)
+            df_data.attrs['failed'] = _many_failed(results)
+            df_data.attrs['partial'] = _many_partial(results)
+        else:
+            df_data = _many_frame(results,data_type,exchange,self.compact)
+        self.last_status = {'data_type': data_type, 'requested': len(tickers), 'failed': df_data.attrs['failed'],
+                            'partial': df_data.attrs['partial']}
         return df_data
 
 
 
-    def time_series_intraday(self,ticker,exchange,start_date,end_date,freq='minutes',interval=60):
+    def time_series_intraday(self,ticker,exchange,start_date,end_date,freq='minutes',interval=60,workers=4):
         '''
+        Intraday bars (freq='minutes') or trade consolidations (freq='trades')
+        between start_date and end_date.
+
+        The range is split into windows that respect the server limits listed
+        below for the given freq/interval (see intraday_window). The windows
+        are fetched `workers` at a time (at most pool_size, the connections
+        of the client) and stitched together, dropping rows
+        repeated at the window boundaries. With raise_on_error=False, failed
+        windows are listed in df.attrs['partial']['missing'].
 
         Input Parameters
         
@@ -353,31 +1034,46 @@ class Iress(object):
         
 
         '''
-        parameters={'Parameters':  {'SecurityCode': ticker,
-                          'Exchange': exchange,
-                          'Frequency':freq,
-                          'TimeSeriesFromDateTime':start_date.strftime('%Y-%m-%dT%H:%M:%S%Z'),
-                          'TimeSeriesToDateTime': end_date.strftime('%Y-%m-%dT%H:%M:%S%Z'),
-                          'ConsolidationInterval':str(interval)
-                          } } 
-        
+        windows = _split_range(start_date,end_date,intraday_window(freq,interval))
+
+        def fetch(window):
+            try:
+                return self._time_series_intraday(ticker,exchange,window[0],window[1],freq,interval)
+            except Exception as e:
+                if self.raise_on_error:
+                    raise
+                return e
+
+        workers = min(workers,len(windows),self.pool_size)
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                data_list = list(executor.map(fetch,windows))
+        else:
+            data_list = [fetch(window) for window in windows]
+        return _intraday_result(windows,data_list)
+
+    def _time_series_intraday(self,ticker,exchange,start_date,end_date,freq='minutes',interval=60):
+        parameters=_intraday_parameters(ticker,exchange,start_date,end_date,freq,interval)
         inputs={**self.header, **parameters}
-        res=self.client.service.TimeSeriesIntraDayGet2(Input=inputs)
-      
-        data=zeep.helpers.serialize_object(res.Result.DataRows.DataRow)
-        df=pd.DataFrame(data)
-        df['TimeSeriesDate'] = pd.to_datetime(df.TimeSeriesDateTime)
-        df['TimeSeriesDate'] = df.TimeSeriesDate.dt.tz_localize('America/New_York')
-        df=df.set_index('TimeSeriesDate')
-        return df
+        df=self._call('TimeSeriesIntraDayGet2',inputs)
+        return _intraday_frame(df)
 
-    def get_quotes(self,ticker=[],exchange =[],watchlist=False, tickers = ''):
+    def get_quotes(self,ticker=[],exchange =[],watchlist=False, tickers = '',workers=4,fields=None):
         
         '''
             Retrieves basic quote information for one or more securities.
             A security code must be specified in the SecurityCode or SecurityText parameter.
             If both SecurityCode and SecurityText are given, SecurityCode is used.
 
+            Lists longer than the server cap of 1000 entries are split into
+            chunks, requested `workers` at a time. The result is indexed by
+            (SecurityCode, Exchange, DataSource). Rows with a non-zero
+            ErrorNumber are left out and listed in df.attrs['errors'] as
+            (SecurityCode, Exchange, ErrorNumber) tuples.
+            With raise_on_error=False, the securities of chunks that failed
+            are listed in df.attrs['partial']['missing']. fields selects
+            the output columns besides the index and ErrorNumber.
+
             Input Parameters
             
             
@@ -431,25 +1127,30 @@ class Iress(object):
             
             
         '''
-        if len(tickers)>0:
-            parameters={'Parameters':  {'SecurityTextArray':{'SecurityText':tickers},
-                                           
-                              } } 
-        elif len(ticker)>0 and not watchlist:
-            parameters={'Parameters':  {'SecurityCodeArray':{'SecurityCode':ticker},
-                                }}    
-        elif watchlist:
-            parameters={'Parameters':  {'UserWatchlistProvided':watchlist,'SecurityTextArray':{'SecurityText':ticker},
-                                }}            
+        requests_list = _quote_requests(ticker,exchange,watchlist,tickers)
+
+        def fetch(parameters):
+            inputs = {**self.header, **parameters}
+            try:
+                return self._call('PricingQuoteGet',inputs,_columns(fields,*QUOTE_KEY_COLUMNS))
+            except Exception as e:
+                if self.raise_on_error:
+                    raise
+                return e
+
+        if workers > 1 and len(requests_list) > 1:
+            with ThreadPoolExecutor(max_workers=min(workers,len(requests_list))) as executor:
+                data_list = list(executor.map(fetch,requests_list))
         else:
-            parameters = {}
-        
-        inputs = {**self.header, **parameters}
-        res = self.client.service.PricingQuoteGet(Input=inputs)
-      
-        data = zeep.helpers.serialize_object(res.Result.DataRows.DataRow)
-        df = pd.DataFrame(data)
-        return df
+            data_list = [fetch(parameters) for parameters in requests_list]
+        return _quote_result(requests_list,data_list)
+
+    def stream_quotes(self,tickers,interval=1.0,**kwargs):
+        '''
+        Return a QuoteStream polling get_quotes(tickers=tickers) every
+        `interval` seconds and emitting only the rows that changed.
+        '''
+        return QuoteStream(self,tickers,interval=interval,**kwargs)
 
         
 
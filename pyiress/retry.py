@@ -0,0 +1,130 @@
+import random
+import re
+import threading
+import time
+
+import requests
+import zeep.exceptions
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+# Seconds allowed for one SOAP request, per operation
+ENDPOINT_TIMEOUTS = {'PricingQuoteGet': 30,
+                     'TimeSeriesGet2': 120,
+                     'TimeSeriesIntraDayGet2': 120,
+                     'SecurityDividendGetBySecurity': 60,
+                     'MarketCapitalizationHistoricalGet': 300}
+
+# Faults that say the gateway is overloaded or timed out, rather than that the request is wrong
+TRANSIENT_FAULT_PATTERN = re.compile(r'busy|try again|timed? ?out|too many|overload|unavailable|temporar',
+                                     re.IGNORECASE)
+
+RETRY_STATUS = (408, 429, 500, 502, 503, 504)
+
+RETRYABLE_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, TimeoutError)
+if httpx is not None:
+    RETRYABLE_ERRORS += (httpx.TransportError,)
+
+
+def transient(error):
+    '''True if error is worth retrying: a connection problem, timeout, overload or 5xx.'''
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    if isinstance(error, zeep.exceptions.Fault):
+        return TRANSIENT_FAULT_PATTERN.search(str(error)) is not None
+    if isinstance(error, zeep.exceptions.TransportError):
+        return error.status_code in RETRY_STATUS
+    return False
+
+
+class RetryPolicy(object):
+    '''
+    How often and after how long a failed SOAP request is repeated.
+
+    attempts - requests made at most, 1 for no retries
+    backoff - delay before the first retry in seconds, doubled for every
+              further retry up to max_backoff
+    jitter - fraction of each delay drawn at random, so that workers that
+             failed together do not retry together
+    timeouts - seconds allowed per request, per operation; merged over
+               ENDPOINT_TIMEOUTS. default_timeout applies to the others.
+    retryable - callable(error) deciding whether an error is retried
+                (transient by default: connection errors, timeouts, HTTP
+                408/429/5xx and faults saying the server is busy)
+    '''
+    def __init__(self, attempts=3, backoff=0.5, max_backoff=30.0, jitter=0.5, timeouts=None,
+                 default_timeout=None, retryable=transient):
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.timeouts = dict(ENDPOINT_TIMEOUTS, **(timeouts or {}))
+        self.default_timeout = default_timeout
+        self.retryable = retryable
+        self._random = random.Random()
+
+    def delay(self, retry):
+        '''Seconds to wait before retry number `retry` (1 for the first retry).'''
+        delay = min(self.max_backoff, self.backoff * 2 ** (retry - 1))
+        return delay * (1.0 - self.jitter * self._random.random())
+
+    def timeout(self, operation):
+        return self.timeouts.get(operation, self.default_timeout)
+
+
+class CircuitBreaker(object):
+    '''
+    Stops sending requests to a gateway that keeps failing.
+
+    After `failures` consecutive transient failures the circuit opens and
+    requests fail at once (allow() is False) for reset_timeout seconds.
+    Then a single trial request is let through: if it succeeds the circuit
+    closes, otherwise it opens again.
+    '''
+    def __init__(self, failures=5, reset_timeout=30.0):
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.consecutive = 0
+        self.trips = 0
+        self.rejected = 0
+        self._opened = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self._opened >= self.reset_timeout:
+                self.state = 'half-open'
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.consecutive = 0
+
+    def failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.state == 'half-open' or (self.state == 'closed' and self.consecutive >= self.failures):
+                self.state = 'open'
+                self._opened = time.monotonic()
+                self.trips += 1
+
+    def retry_after(self):
+        '''Seconds until a trial request is allowed (0 unless open).'''
+        with self._lock:
+            if self.state != 'open':
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened))
+
+    def metrics(self):
+        with self._lock:
+            return {'state': self.state, 'consecutive_failures': self.consecutive,
+                    'trips': self.trips, 'rejected': self.rejected}
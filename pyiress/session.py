@@ -0,0 +1,153 @@
+import re
+import threading
+import time
+
+# Fault messages that mean the session key is no longer valid
+SESSION_EXPIRED_PATTERN = re.compile(r'session.*(expired|invalid|not (found|valid)|timed? ?out|ended)|invalid session',
+                                     re.IGNORECASE | re.DOTALL)
+
+
+def session_expired(error):
+    '''True if error (usually a zeep Fault) says the Iress session is gone.'''
+    return SESSION_EXPIRED_PATTERN.search(str(error)) is not None
+
+
+class IressSession(object):
+    '''One logged-in Iress session, used by `users` calls at the moment.'''
+    def __init__(self, key, token=None):
+        self.key = key
+        self.token = token
+        self.started = time.monotonic()
+        self.users = 0
+        self.lock = threading.Lock()
+
+    @property
+    def header(self):
+        return {'Header': {'SessionKey': self.key}}
+
+
+class SessionPool(object):
+    '''
+    Holds up to `size` logged-in Iress sessions shared by concurrent
+    callers. An Iress session serves concurrent requests, so a caller is
+    given an unused session, a new one while the pool has fewer than `size`,
+    or else the session with the fewest users. Callers never wait for each
+    other; `size` only spreads the calls over more sessions.
+
+    start_session - callable running IRESSSessionStart, returning (key, token)
+    size - maximum number of sessions
+    max_age - seconds after which a session is re-logged before being handed
+              out again, to stay ahead of server side expiry. None to keep
+              sessions until a call reports them expired.
+
+        session = pool.acquire()
+        key = session.key
+        try:
+            ... session.header ...
+        except Fault as e:
+            if session_expired(e):
+                pool.relogin(session, key)
+        finally:
+            pool.release(session)
+    '''
+    def __init__(self, start_session, size=1, max_age=None):
+        self._start_session = start_session
+        self.size = max(1, size)
+        self.max_age = max_age
+        self._sessions = []      # None for a slot whose session is being started
+        self._cond = threading.Condition()
+        self._active = 0
+        self.relogins = 0
+        self.relogin_time = 0.0
+        self.relogin_time_max = 0.0
+        self.relogin_time_last = None
+
+    def _new_session(self):
+        key, token = self._start_session()
+        return IressSession(key, token)
+
+    def acquire(self):
+        '''Return a session to use, starting one if all are in use and the pool is not full.'''
+        with self._cond:
+            while True:
+                started = [s for s in self._sessions if s is not None]
+                session = min(started, key=lambda s: s.users) if started else None
+                if session is not None and (session.users == 0 or len(self._sessions) >= self.size):
+                    break
+                if len(self._sessions) < self.size:
+                    # Reserve the slot before logging in outside the lock
+                    self._sessions.append(None)
+                    session = None
+                    break
+                # Every slot is still logging in
+                self._cond.wait()
+            self._active += 1
+            if session is not None:
+                session.users += 1
+        if session is None:
+            try:
+                session = self._new_session()
+            except Exception:
+                with self._cond:
+                    self._sessions.remove(None)
+                    self._active -= 1
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                session.users += 1
+                self._sessions[self._sessions.index(None)] = session
+                self._cond.notify_all()
+        elif self.max_age is not None and time.monotonic() - session.started > self.max_age:
+            try:
+                self.relogin(session, session.key)
+            except Exception:
+                # Hand the (still old) session back, its next use will try again
+                self.release(session)
+                raise
+        return session
+
+    def release(self, session):
+        with self._cond:
+            session.users -= 1
+            self._active -= 1
+            self._cond.notify_all()
+
+    def relogin(self, session, expired_key=None):
+        '''
+        Start a new Iress session in place of the expired `session`. With
+        expired_key, nothing is done if another caller has already replaced
+        that key, so callers sharing the session log in once.
+        '''
+        with session.lock:
+            if expired_key is not None and session.key != expired_key:
+                return session
+            start = time.monotonic()
+            session.key, session.token = self._start_session()
+            session.started = time.monotonic()
+            elapsed = session.started - start
+        with self._cond:
+            self.relogins += 1
+            self.relogin_time += elapsed
+            self.relogin_time_max = max(self.relogin_time_max, elapsed)
+            self.relogin_time_last = elapsed
+        return session
+
+    def first(self):
+        '''Return the first session, starting it if needed.'''
+        with self._cond:
+            if self._sessions and self._sessions[0] is not None:
+                return self._sessions[0]
+        self.release(self.acquire())
+        with self._cond:
+            return self._sessions[0]
+
+    def metrics(self):
+        '''Pool counters: sessions logged in, sessions in use and re-logins with their latency.'''
+        with self._cond:
+            return {'size': self.size,
+                    'sessions': len([s for s in self._sessions if s is not None]),
+                    'active': self._active,
+                    'relogins': self.relogins,
+                    'relogin_time_mean': self.relogin_time / self.relogins if self.relogins else None,
+                    'relogin_time_max': self.relogin_time_max if self.relogins else None,
+                    'relogin_time_last': self.relogin_time_last}
@@ -0,0 +1,188 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+QUOTE_FIELDS = ['BidPrice', 'BidVolume', 'AskPrice', 'AskVolume', 'LastPrice', 'OpenPrice',
+                'HighPrice', 'LowPrice', 'TotalVolume', 'TotalValue']
+
+
+class QuoteStream(object):
+    '''
+    Polls PricingQuoteGet for a watchlist every `interval` seconds and emits
+    only the rows whose UpdateDateTime or price fields changed since the
+    last poll.
+
+    iress - connected Iress client
+    tickers - security texts passed to Iress.get_quotes(tickers=...)
+    interval - seconds between the start of two polls
+    fields - numeric columns compared between polls
+
+    The last state per security is kept in NumPy arrays, one row per
+    security. If the consumer falls behind, pending changes are coalesced so
+    that only the latest row of each security is delivered, and the
+    superseded rows are counted in metrics()['coalesced'].
+
+    Iterate over the stream:
+
+        with QuoteStream(iress, ['BHP.ASX', 'CBA.ASX']) as stream:
+            for delta in stream:
+                ...
+
+    or hand it a callback, called from a background thread:
+
+        stream = QuoteStream(iress, tickers, interval=0.5)
+        stream.start(callback=print)
+        ...
+        stream.stop()
+    '''
+    def __init__(self, iress, tickers, interval=1.0, fields=QUOTE_FIELDS):
+        self.iress = iress
+        self.tickers = list(tickers)
+        self.interval = interval
+        self.fields = list(fields)
+        self._rows = {}
+        self._values = np.empty((0, len(self.fields)))
+        self._updated = np.empty(0, dtype=np.int64)
+        self._pending = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self.polls = 0
+        self.errors = 0
+        self.last_error = None
+        self.emitted = 0
+        self.coalesced = 0
+        self.poll_time = 0.0
+        self.poll_time_max = 0.0
+        self.poll_time_last = None
+
+    def start(self, callback=None):
+        '''Start polling. If callback is given it receives every delta frame.'''
+        if self._threads:
+            return self
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._poll_loop, name='QuoteStream-poll', daemon=True)]
+        if callback is not None:
+            self._threads.append(threading.Thread(target=self._dispatch_loop, args=(callback,),
+                                                  name='QuoteStream-dispatch', daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join()
+        self._threads = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def __iter__(self):
+        self.start()
+        while True:
+            delta = self.get()
+            if delta is None:
+                return
+            yield delta
+
+    def get(self, timeout=None):
+        '''Return the next delta frame, or None once stopped (or on timeout).'''
+        with self._cond:
+            while self._pending is None and not self._stop.is_set():
+                if not self._cond.wait(timeout) and timeout is not None:
+                    break
+            delta, self._pending = self._pending, None
+            if delta is not None:
+                self.emitted += len(delta)
+        return delta
+
+    def poll(self):
+        '''Poll once and return the changed rows (without queueing them).'''
+        start = time.monotonic()
+        df = self.iress.get_quotes(tickers=self.tickers)
+        elapsed = time.monotonic() - start
+        self.polls += 1
+        self.poll_time += elapsed
+        self.poll_time_max = max(self.poll_time_max, elapsed)
+        self.poll_time_last = elapsed
+        return self._changes(df)
+
+    def _changes(self, df):
+        if len(df) == 0:
+            return df
+        rows = np.empty(len(df), dtype=np.intp)
+        for i, key in enumerate(df.index):
+            row = self._rows.get(key)
+            if row is None:
+                row = self._rows[key] = len(self._rows)
+            rows[i] = row
+        if len(self._rows) > len(self._updated):
+            grow = len(self._rows) - len(self._updated)
+            self._values = np.vstack([self._values, np.full((grow, len(self.fields)), np.nan)])
+            self._updated = np.concatenate([self._updated, np.full(grow, np.iinfo(np.int64).min)])
+
+        values = df.reindex(columns=self.fields).to_numpy(dtype=np.float64, na_value=np.nan)
+        if 'UpdateDateTime' in df.columns:
+            updated = pd.to_datetime(df.UpdateDateTime).to_numpy(dtype='datetime64[ns]').view(np.int64)
+        else:
+            updated = np.full(len(df), np.iinfo(np.int64).min)
+        old = self._values[rows]
+        same = (values == old) | (np.isnan(values) & np.isnan(old))
+        changed = (updated != self._updated[rows]) | ~same.all(axis=1)
+        self._values[rows] = values
+        self._updated[rows] = updated
+        return df[changed]
+
+    def _poll_loop(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                delta = self.poll()
+                if len(delta) > 0:
+                    self._queue(delta)
+            except Exception as e:
+                with self._cond:
+                    self.errors += 1
+                    self.last_error = e
+                    self._cond.notify_all()
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def _queue(self, delta):
+        with self._cond:
+            if self._pending is not None:
+                # The merged rows carry the attrs of the latest poll. pandas
+                # would compare the attrs of both frames in concat.
+                attrs = delta.attrs
+                self._pending.attrs, delta.attrs = {}, {}
+                merged = pd.concat([self._pending, delta])
+                keep = ~merged.index.duplicated(keep='last')
+                self.coalesced += int((~keep).sum())
+                delta = merged[keep]
+                delta.attrs = attrs
+            self._pending = delta
+            self._cond.notify_all()
+
+    def _dispatch_loop(self, callback):
+        while not self._stop.is_set():
+            delta = self.get()
+            if delta is not None:
+                callback(delta)
+
+    def metrics(self):
+        '''Poll count and latency, errors, rows emitted and updates coalesced away.'''
+        return {'polls': self.polls,
+                'poll_time_mean': self.poll_time / self.polls if self.polls else None,
+                'poll_time_max': self.poll_time_max if self.polls else None,
+                'poll_time_last': self.poll_time_last,
+                'errors': self.errors,
+                'emitted': self.emitted,
+                'coalesced': self.coalesced}
@@ -0,0 +1,62 @@
+import threading
+import time
+import warnings
+
+import pytest
+
+from pyiress import Iress
+from pyiress.mock import MockIressServer
+
+
+@pytest.fixture
+def server():
+    '''MockIressServer for the test. latency, page_size and fault_rate can be changed while it runs.'''
+    with MockIressServer() as server:
+        yield server
+
+
+class _InFlight(object):
+    '''Mock server latency counting the requests of `operation` served at the same time.'''
+    def __init__(self, operation, seconds):
+        self.operation = operation
+        self.seconds = seconds
+        self.current = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, operation):
+        if operation != self.operation:
+            return 0
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+        time.sleep(self.seconds)
+        with self.lock:
+            self.current -= 1
+        return 0
+
+
+@pytest.fixture
+def in_flight(server):
+    '''in_flight(operation, seconds) delays the requests of operation and counts those overlapping (.peak).'''
+    def in_flight(operation, seconds=0.2):
+        server.latency = _InFlight(operation, seconds)
+        return server.latency
+    return in_flight
+
+
+@pytest.fixture
+def connect(server):
+    '''connect(**kwargs) returns an Iress client of the mock server.'''
+    def connect(**kwargs):
+        kwargs.setdefault('metrics', False)
+        return Iress('company', 'user', 'password', url=server.url, wsdl_cache=False, **kwargs)
+    return connect
+
+
+@pytest.fixture(autouse=True)
+def _quiet():
+    # partial results and failed tickers warn
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        yield
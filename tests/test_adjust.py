@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyiress import AdjustmentEngine, PanelBuilder
+
+DATES = pd.bdate_range('2019-01-07', periods=30).as_unit('ns')
+TICKERS = ['AAA', 'BBB', 'CCC']
+
+
+def _data():
+    '''
+    Random prices for three tickers with splits, dividends (one on a
+    weekend) and gaps: BBB starts late and misses a week, CCC stops early.
+    Returns the long price frame, with per event and cumulative factors,
+    and the dividends frame.
+    '''
+    rng = np.random.default_rng(7)
+    close = pd.DataFrame(np.cumprod(1 + rng.normal(0, 0.02, (len(DATES), 3)), axis=0) * 10, DATES, TICKERS)
+    events = pd.DataFrame(np.nan, DATES, TICKERS)
+    events.loc[DATES[8], 'AAA'] = 0.5
+    events.loc[DATES[20], 'AAA'] = 0.25
+    events.loc[DATES[15], 'BBB'] = 2.0
+    close = close.where(events.isna(), close.shift(1) / events)
+    close.loc[:DATES[3], 'BBB'] = np.nan
+    close.loc[DATES[10]:DATES[14], 'BBB'] = np.nan
+    close.loc[DATES[25]:, 'CCC'] = np.nan
+    # prices times the factor of their row are comparable across the history
+    cumulative = events.fillna(1.0)[::-1].cumprod().shift(1, fill_value=1.0)[::-1]
+
+    held = close.stack().index
+    prices = pd.DataFrame({'ClosePrice': close.stack(),
+                           'AdjustmentFactor': events.stack(future_stack=True).reindex(held),
+                           'Cumulative': cumulative.stack().reindex(held)})
+    prices.index.names = ['TimeSeriesDate', 'ticker']
+    dividends = pd.DataFrame({'DividendAmount': [0.3, 0.2, 0.4, 0.1, 0.5]},
+                             index=pd.MultiIndex.from_tuples([(DATES[5], 'AAA'), (DATES[12], 'BBB'),
+                                                              (DATES[25] - pd.Timedelta(days=1), 'AAA'),
+                                                              (DATES[8], 'AAA'), (DATES[27], 'CCC')],
+                                                             names=['ExDividendDate', 'ticker']))
+    return prices, dividends
+
+
+def _reference(prices, dividends, factor_field='AdjustmentFactor', cumulative=False):
+    '''Per ticker, row by row: (adjusted close, total return) frames.'''
+    close = prices.ClosePrice.unstack(1)
+    factors = prices[factor_field].unstack(1).reindex(close.index)
+    adjusted, total = close * np.nan, close * np.nan
+    for ticker in close.columns:
+        F, CD, V, CDV, TR, A = 1.0, 0.0, np.nan, 0.0, np.nan, np.nan
+        shares = []
+        for i, date in enumerate(close.index):
+            a = factors[ticker].iloc[i]
+            if cumulative:
+                a = a if a > 0 else np.nan
+                filled = A if np.isnan(a) else a
+                r = 1.0 if np.isnan(A) or np.isnan(filled) else A / filled
+                A = filled
+            else:
+                r = a if a > 0 else 1.0
+            F /= r
+            previous = close.index[i - 1] if i else pd.Timestamp.min
+            for (ex, code), row in dividends.iterrows():
+                if code == ticker and previous < ex <= date:
+                    CD += row.DividendAmount * F
+            shares.append(F)
+            price = close[ticker].iloc[i]
+            if np.isnan(price):
+                continue
+            TR = 1.0 if np.isnan(V) else TR * (price * F + CD - CDV) / V
+            V, CDV = price * F, CD
+            total.loc[date, ticker] = TR
+        adjusted[ticker] = close[ticker] * np.array(shares) / F
+    return adjusted, total
+
+
+def _batches(prices, cuts):
+    dates = prices.index.get_level_values(0)
+    bounds = [DATES[0]] + [DATES[c] for c in cuts] + [DATES[-1] + pd.Timedelta(days=1)]
+    return [prices[(dates >= start) & (dates < end)] for start, end in zip(bounds, bounds[1:])]
+
+
+@pytest.mark.parametrize('factor, field', [('event', 'AdjustmentFactor'), ('cumulative', 'Cumulative')])
+def test_matches_reference_loop(factor, field):
+    prices, dividends = _data()
+    adjusted, total = _reference(prices, dividends, field, cumulative=factor == 'cumulative')
+    full = AdjustmentEngine(factor=factor, factor_field=field).update(prices, dividends)
+    pd.testing.assert_frame_equal(full.adjusted_close(), adjusted, check_names=False, check_freq=False)
+    pd.testing.assert_frame_equal(full.total_return(), total, check_names=False, check_freq=False)
+
+    # in three batches, the Sunday dividend waiting for the next update
+    engine = AdjustmentEngine(factor=factor, factor_field=field)
+    for batch in _batches(prices, [9, 25]):
+        engine.update(batch, dividends)
+    for name in ('close', 'adjusted_close', 'total_return', 'total_return_close'):
+        pd.testing.assert_frame_equal(getattr(engine, name)(), getattr(full, name)())
+
+
+def test_split_and_dividend_by_hand():
+    index = pd.MultiIndex.from_product([pd.bdate_range('2019-01-07', periods=4), ['AAA']])
+    prices = pd.DataFrame({'ClosePrice': [10.0, 11.0, 5.5, 5.5], 'AdjustmentFactor': [np.nan, np.nan, 0.5, np.nan]},
+                          index=index)
+    dividends = pd.DataFrame({'DividendAmount': [1.1]}, index=index[3:])
+    engine = AdjustmentEngine().update(prices, dividends)
+    np.testing.assert_allclose(engine.adjusted_close().AAA, [5.0, 5.5, 5.5, 5.5])
+    np.testing.assert_allclose(engine.shares().AAA, [1.0, 1.0, 2.0, 2.0])
+    np.testing.assert_allclose(engine.total_return().AAA, [1.0, 1.1, 1.1, 1.1 * 6.6 / 5.5])
+    assert engine.total_return_close().AAA.iloc[-1] == pytest.approx(5.5)
+
+
+def test_panel_input_and_new_tickers():
+    prices, dividends = _data()
+    builder = PanelBuilder(['ClosePrice', 'AdjustmentFactor'])
+    for ticker in TICKERS:
+        builder.add(ticker, prices.xs(ticker, level=1))
+    full = AdjustmentEngine().update(prices, dividends)
+    panel = AdjustmentEngine().update(builder.build(TICKERS), dividends)
+    pd.testing.assert_frame_equal(panel.total_return(), full.total_return(), check_freq=False)
+
+    # a ticker first seen in a later update
+    first, second = _batches(prices, [15])
+    engine = AdjustmentEngine().update(first[first.index.get_level_values(1) != 'CCC'], dividends)
+    engine.update(second, dividends)
+    assert list(engine.tickers) == ['AAA', 'BBB', 'CCC']
+    assert engine.close().CCC.iloc[:15].isna().all()
+    pd.testing.assert_series_equal(engine.total_return().AAA, full.total_return().AAA)
+
+
+def test_bad_factor():
+    with pytest.raises(ValueError):
+        AdjustmentEngine(factor='daily')
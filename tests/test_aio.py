@@ -0,0 +1,70 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from pyiress.aio import AsyncIress, _gather
+from pyiress.pyiress import _split_range, intraday_window
+
+START, END = pd.Timestamp('2019-03-04 09:00'), pd.Timestamp('2019-03-29 17:00')
+
+
+def _run(server, method, *args, **kwargs):
+    '''Call AsyncIress.method against the mock server, with client options in `client`.'''
+    options = dict(url=server.url, wsdl_cache=False, metrics=False)
+    options.update(kwargs.pop('client', {}))
+
+    async def main():
+        async with AsyncIress('company', 'user', 'password', **options) as iress:
+            return await getattr(iress, method)(*args, **kwargs)
+    return asyncio.run(main())
+
+
+def test_get_many_matches_sync(server, connect):
+    tickers = ['S001', 'S002', 'S003']
+    df = _run(server, 'get_many', '2019-01-01', '2019-06-30', 'time_series', tickers, 'ASX')
+    expected = connect().get_many('2019-01-01', '2019-06-30', 'time_series', tickers, 'ASX')
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_first_error_cancels_siblings():
+    cancelled = []
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError('window failed')
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        with pytest.raises(RuntimeError):
+            await _gather([slow(), fail(), slow()])
+    asyncio.run(main())
+    assert cancelled == [True, True]
+
+
+def test_failed_windows_raise(server):
+    server.fault_rate = 1.0
+    with pytest.raises(Exception):
+        _run(server, 'time_series_intraday', 'S001', 'ASX', START, END, interval=5, client={'retry': False})
+
+
+def test_failed_windows_are_partial(server):
+    server.fault_rate = 1.0
+    client = {'retry': False, 'raise_on_error': False}
+    df = _run(server, 'time_series_intraday', 'S001', 'ASX', START, END, interval=5, client=client)
+    assert len(df) == 0
+    assert df.attrs['partial']['missing'] == _split_range(START, END, intraday_window('minutes', 5))
+
+
+def test_failed_quotes_are_partial(server):
+    server.fault_rate = 1.0
+    tickers = ['S%04d.ASX' % i for i in range(1500)]
+    df = _run(server, 'get_quotes', tickers=tickers, client={'retry': False, 'raise_on_error': False})
+    assert len(df) == 0
+    assert len(df.attrs['partial']['missing']) == 1500
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from pyiress.bars import INT_NULL, BarStore
+
+
+def _bars(start, n, cursor=100, close=10.0):
+    index = pd.date_range(start, periods=n, freq='1min', tz='America/New_York', name='TimeSeriesDate')
+    return pd.DataFrame({'OpenPrice': close, 'HighPrice': close, 'LowPrice': close,
+                         'ClosePrice': close + np.arange(n), 'TotalVolume': 100.0,
+                         'TotalValue': 1000.0, 'TradeCount': pd.array([5] * (n - 1) + [None], dtype='Int32'),
+                         'LastTradeNumberOfTheInterval': cursor + 10 * np.arange(n)}, index=index)
+
+
+def test_round_trip(tmp_path):
+    store = BarStore(str(tmp_path))
+    df = _bars('2020-03-02 10:00', 5)
+    assert store.append('BHP', 'ASX', df) == 5
+    read = store.read('BHP', 'ASX')
+    pd.testing.assert_index_equal(read.index, df.index.as_unit('ns'))
+    assert read.ClosePrice.dtype == np.float32
+    np.testing.assert_array_equal(read.ClosePrice, df.ClosePrice)
+    assert read.TradeCount.isna().tolist() == [False] * 4 + [True]
+    assert store.columns('BHP', 'ASX')['TradeCount'][-1] == INT_NULL
+    assert store.securities() == [('BHP', 'ASX')]
+    assert store.coverage('BHP', 'ASX') == (df.index[0], df.index[-1])
+    assert store.nbytes('BHP', 'ASX') == 5 * 56
+    # a store opened again reads the same files
+    pd.testing.assert_frame_equal(BarStore(str(tmp_path)).read('BHP', 'ASX'), read)
+
+
+def test_field_projection_and_range(tmp_path):
+    store = BarStore(str(tmp_path))
+    store.append('BHP', 'ASX', _bars('2020-03-02 23:58', 5))
+    columns = store.columns('BHP', 'ASX', '2020-03-02', '2020-03-02', fields=['ClosePrice'])
+    assert list(columns) == ['time', 'ClosePrice']
+    # a date alone takes the whole day
+    assert len(columns['time']) == 2
+    read = store.read('BHP', 'ASX', '2020-03-03 00:00', fields=['ClosePrice', 'TradeCount'])
+    assert list(read.columns) == ['ClosePrice', 'TradeCount'] and len(read) == 3
+    assert store.columns('RIO', 'ASX') == {} and len(store.read('RIO', 'ASX')) == 0
+
+
+def test_grown_last_bar_replaced(tmp_path):
+    store = BarStore(str(tmp_path))
+    first = _bars('2020-03-02 10:00', 3)
+    store.append('BHP', 'ASX', first)
+    assert store.append('BHP', 'ASX', first) == 0
+    held = store.columns('BHP', 'ASX')
+    before = store.columns('BHP', 'ASX', end_date='2020-03-02 10:01')
+    assert isinstance(before['ClosePrice'], np.memmap)
+
+    # the top-up starts at the last bar, which has had more trades since
+    grown = _bars('2020-03-02 10:02', 3, cursor=125, close=20.0)
+    assert store.append('BHP', 'ASX', grown) == 3
+    assert store.rows('BHP', 'ASX') == 5
+    np.testing.assert_array_equal(store.read('BHP', 'ASX').ClosePrice, [10, 11, 20, 21, 22])
+    # arrays returned before are not changed by the append
+    np.testing.assert_array_equal(held['ClosePrice'], [10, 11, 12])
+    np.testing.assert_array_equal(held['LastTradeNumberOfTheInterval'], [100, 110, 120])
+    np.testing.assert_array_equal(before['ClosePrice'], [10, 11])
+
+
+def test_top_up_matches_full_fetch(tmp_path, server, connect):
+    iress = connect()
+    store = BarStore(str(tmp_path), interval=5)
+    first = store.update(iress, 'S001', 'ASX', '2019-03-04 09:00', '2019-03-06 12:00')
+    requests = server.requests['TimeSeriesIntraDayGet2']
+    added = store.update(iress, 'S001', 'ASX', '2019-03-04 09:00', '2019-03-08 17:00')
+    assert server.requests['TimeSeriesIntraDayGet2'] == requests + 1
+    full = iress.time_series_intraday('S001', 'ASX', '2019-03-04 09:00', '2019-03-08 17:00', interval=5)
+    read = store.read('S001', 'ASX')
+    assert len(read) == len(full) and first + added >= len(full)
+    pd.testing.assert_index_equal(read.index, full.index.as_unit('ns'))
+    np.testing.assert_allclose(read.ClosePrice, full.ClosePrice, rtol=1e-6)
+    np.testing.assert_array_equal(read.LastTradeNumberOfTheInterval, full.LastTradeNumberOfTheInterval)
+    assert store.update_many(iress, ['S001', 'BAD1'], 'ASX', '2019-03-04', '2019-03-08 17:00')['S001'] == 0
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from pyiress import IndexConstituents, IndexHistory
+
+DAYS = pd.bdate_range('2019-01-07', periods=5)     # Monday to Friday
+
+
+def _rows():
+    '''AAA in all week, BBB out on Wednesday only, CCC joins on Thursday.'''
+    held = {'AAA': range(5), 'BBB': [0, 1, 3, 4], 'CCC': [3, 4]}
+    rows = [(DAYS[d], code, 'ASX', 'XJO', float(10 * (i + 1) + d))
+            for i, (code, days) in enumerate(sorted(held.items())) for d in days]
+    return pd.DataFrame(rows, columns=['MarketCapitalizationDate', 'SecurityCode', 'Exchange', 'IndexCode',
+                                       'MarketWeightEndOfDay'])
+
+
+def test_interval_table():
+    history = IndexHistory.from_frame(_rows())
+    assert history.indexcode == 'XJO'
+    intervals = history.intervals()
+    assert list(intervals.SecurityCode) == ['AAA', 'BBB', 'BBB', 'CCC']
+    assert list(intervals.days) == [5, 2, 2, 2]
+    pd.testing.assert_frame_equal(history.to_frame(), _rows().sort_values(['SecurityCode', 'MarketCapitalizationDate'])
+                                  .reset_index(drop=True), check_dtype=False)
+
+
+def test_point_in_time_queries():
+    history = IndexHistory.from_frame(_rows())
+    assert list(history.members(DAYS[2])) == ['AAA']
+    weights = history.weights(DAYS[4])
+    assert weights.to_dict() == {'AAA': 14.0, 'BBB': 24.0, 'CCC': 34.0}
+    # the weekend gives Friday's index, before the first day nothing
+    pd.testing.assert_series_equal(history.weights(DAYS[4] + pd.Timedelta(days=2)), weights)
+    assert len(history.members('2019-01-01')) == 0
+    assert history.is_member('BBB', DAYS[1]) and not history.is_member('BBB', DAYS[2])
+    assert not history.is_member('ZZZ', DAYS[1])
+
+
+def test_changes():
+    changes = IndexHistory.from_frame(_rows()).changes(DAYS[0], DAYS[4])
+    assert list(zip(changes.date, changes.SecurityCode, changes.change, changes.MarketWeightEndOfDay)) == [
+        (DAYS[2], 'BBB', 'removed', 21.0), (DAYS[3], 'BBB', 'added', 23.0), (DAYS[3], 'CCC', 'added', 33.0)]
+
+
+def test_empty():
+    history = IndexHistory.from_frame(pd.DataFrame(), 'XJO')
+    assert len(history) == 0 and len(history.members('2019-01-01')) == 0
+    assert len(history.weights('2019-01-01')) == 0
+
+
+def test_load_extends_held_history(server, connect):
+    constituents = IndexConstituents(connect())
+    constituents.load('XJO', '2019-04-01', '2019-06-30')
+    requests = server.requests['MarketCapitalizationHistoricalGet']
+    history = constituents.load('XJO', '2019-01-01', '2019-08-31')
+    # only the head and the tail are requested, one chunk each
+    assert server.requests['MarketCapitalizationHistoricalGet'] - requests == 2
+    full = IndexHistory.fetch(connect(), 'XJO', '2019-01-01', '2019-08-31')
+    np.testing.assert_array_equal(history.dates, full.dates)
+    pd.testing.assert_frame_equal(history.intervals(), full.intervals())
+    np.testing.assert_array_equal(history.weight, full.weight)
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+import zeep.exceptions
+
+from pyiress.decode import compact_frame, decode_rows
+
+START, END = pd.Timestamp('2019-01-01'), pd.Timestamp('2019-03-31')
+
+
+def _response(operation, rows):
+    cells = ''.join('<DataRow>%s</DataRow>' % ''.join(
+        '<%s xsi:nil="true"/>' % name if value is None else '<%s>%s</%s>' % (name, value, name)
+        for name, value in row) for row in rows)
+    return ('<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" '
+            'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"><soap:Body>'
+            '<%sResponse xmlns="http://webservices.iress.com.au/v4/"><Output><Result><DataRows>%s'
+            '</DataRows></Result></Output></%sResponse></soap:Body></soap:Envelope>'
+            % (operation, cells, operation)).encode('utf-8')
+
+
+ROWS = [[('ClosePrice', '1.5'), ('TradeCount', '10'), ('TimeSeriesDate', '2019-01-02+10:00'), ('Extra', 'a')],
+        [('ClosePrice', None), ('TradeCount', '12'), ('TimeSeriesDate', '2019-01-03'), ('Extra', None)]]
+
+
+def test_schema_types():
+    df = decode_rows(_response('TimeSeriesGet2', ROWS), 'TimeSeriesGet2')
+    assert df.ClosePrice.dtype == np.float64 and np.isnan(df.ClosePrice[1])
+    assert df.TradeCount.dtype == np.int32
+    assert list(df.TimeSeriesDate) == [pd.Timestamp('2019-01-02'), pd.Timestamp('2019-01-03')]
+    assert df.TimeSeriesDate.dtype == 'datetime64[ns]'
+    # columns of the schema missing from the response are still there, unknown ones are strings
+    assert df.OpenPrice.isna().all()
+    assert df.Extra[0] == 'a' and pd.isna(df.Extra[1])
+
+
+def test_integer_nulls_and_compact():
+    rows = [[('TradeCount', '10')], [('TradeCount', None)]]
+    df = decode_rows(_response('TimeSeriesGet2', rows), 'TimeSeriesGet2')
+    assert df.TradeCount.dtype == np.float64
+    compact = decode_rows(_response('TimeSeriesGet2', rows), 'TimeSeriesGet2', compact=True)
+    assert str(compact.TradeCount.dtype) == 'Int32'
+    assert compact.ClosePrice.dtype == np.float32
+    pd.testing.assert_frame_equal(compact_frame(df, 'TimeSeriesGet2'), compact)
+
+
+def test_columns():
+    df = decode_rows(_response('TimeSeriesGet2', ROWS), 'TimeSeriesGet2', columns=['ClosePrice'])
+    assert list(df.columns) == ['ClosePrice']
+
+
+def test_empty_and_fault():
+    assert len(decode_rows(_response('TimeSeriesGet2', []), 'TimeSeriesGet2')) == 0
+    fault = (b'<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/"><soap:Body><soap:Fault>'
+             b'<faultcode>soap:Server</faultcode><faultstring>Security X not found</faultstring>'
+             b'</soap:Fault></soap:Body></soap:Envelope>')
+    with pytest.raises(zeep.exceptions.Fault, match='Security X not found'):
+        decode_rows(fault, 'TimeSeriesGet2')
+
+
+CALLS = [
+    lambda iress: iress.time_series(START, END, 'S001', 'ASX'),
+    lambda iress: iress.time_series_intraday('S001', 'ASX', pd.Timestamp('2019-03-04'), pd.Timestamp('2019-03-05')),
+    lambda iress: iress.dividends('S001', 'ASX', pd.Timestamp('2015-01-01'), END),
+    lambda iress: iress.MarketCapitalizationHistorical('XJO', None, None, START, pd.Timestamp('2019-01-10')),
+    lambda iress: iress.get_quotes(tickers=['S001.ASX', 'S002.ASX', 'BAD1.ASX']),
+]
+
+
+@pytest.mark.parametrize('compact', [False, True])
+@pytest.mark.parametrize('call', CALLS)
+def test_zeep_path_gives_the_same_frame(connect, call, compact):
+    fast = call(connect(compact=compact))
+    slow = call(connect(compact=compact, fast_decode=False))
+    assert len(fast) > 0
+    pd.testing.assert_frame_equal(slow, fast, check_freq=False)
@@ -0,0 +1,54 @@
+import os
+
+import pandas as pd
+import pytest
+
+from pyiress.export import MANIFEST, Manifest, export, partition_exchange
+
+pytest.importorskip('pyarrow')
+
+TICKERS = ['S001', 'S002', 'BAD1']
+
+
+def test_export_and_resume(tmp_path, server, connect):
+    iress = connect()
+    path = str(tmp_path)
+    summary = export(iress, path, TICKERS, '2018-06-01', '2019-06-30', exchange='ASX', workers=2)
+    assert summary['done'] == 2 and summary['skipped'] == 0
+    assert list(summary['failed']) == [('time_series', 'BAD1')]
+    # one file per ticker and year
+    assert summary['files'] == 4
+    assert sorted(os.listdir(os.path.join(path, 'time_series', 'exchange=ASX'))) == ['year=2018', 'year=2019']
+
+    df = pd.read_parquet(os.path.join(path, 'time_series'))
+    assert len(df) == summary['rows']
+    expected = iress.time_series('2018-06-01', '2019-06-30', 'S002', 'ASX')
+    assert (df.ticker == 'S002').sum() == len(expected)
+
+    requests = server.requests['TimeSeriesGet2']
+    summary = export(iress, path, TICKERS, '2018-06-01', '2019-06-30', exchange='ASX')
+    # only the failed ticker is fetched again
+    assert summary['skipped'] == 2 and summary['done'] == 0
+    assert server.requests['TimeSeriesGet2'] == requests + 1
+
+    summary = export(iress, path, TICKERS[:1], '2018-06-01', '2019-06-30', exchange='ASX', resume=False)
+    assert summary['done'] == 1 and summary['skipped'] == 0
+
+
+def test_interrupted_manifest(tmp_path):
+    manifest = Manifest(str(tmp_path / MANIFEST))
+    key = dict(data_type='time_series', exchange='ASX', start='2019-01-01', end='2019-12-31')
+    manifest.append(ticker='AAA', status='done', **key)
+    manifest.append(ticker='BBB', status='done', **key)
+    manifest.append(ticker='BBB', status='failed', **key)
+    manifest.append(ticker='CCC', status='done', **dict(key, end='2019-06-30'))
+    with open(manifest.path, 'a') as f:
+        f.write('{"data_type": "time_series", "tick')
+    assert manifest.done('time_series', 'ASX', '2019-01-01', '2019-12-31') == {'AAA'}
+
+
+def test_partition_exchange():
+    assert partition_exchange('AGL', 'JSE') == 'JSE'
+    assert partition_exchange('BHP.ASX') == 'ASX'
+    assert partition_exchange('BHP@ASX') == 'ASX'
+    assert partition_exchange('BHP') == '_'
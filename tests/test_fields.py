@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyiress import TimeSeriesCache
+
+T = pd.Timestamp
+
+CALLS = {
+    'time_series': (lambda iress, fields: iress.time_series('2019-01-01', '2019-03-31', 'S001', 'ASX',
+                                                            fields=fields),
+                    ['ClosePrice', 'TradeCount']),
+    'dividends': (lambda iress, fields: iress.dividends('S001', 'ASX', T('2015-01-01'), T('2019-12-31'),
+                                                        fields=fields),
+                  ['DividendAmount', 'DRPPrice']),
+    'market_cap': (lambda iress, fields: iress.MarketCapitalizationHistorical('XJO', None, None, T('2019-01-01'),
+                                                                              T('2019-01-31'), fields=fields),
+                   ['SecurityCode', 'MarketCapitalizationDate', 'IndexPriceEndOfDay']),
+    'get_many': (lambda iress, fields: iress.get_many('2019-01-01', '2019-03-31', 'time_series', ['S001', 'S002'],
+                                                      'ASX', fields=fields),
+                 ['ClosePrice', 'TotalVolume']),
+}
+
+
+@pytest.mark.parametrize('call', sorted(CALLS))
+def test_fields_are_a_projection(connect, call):
+    fetch, fields = CALLS[call]
+    iress = connect()
+    full, projected = fetch(iress, None), fetch(iress, fields)
+    assert [name for name in projected.columns if name != 'exchange'] == fields
+    pd.testing.assert_frame_equal(projected, full[list(projected.columns)])
+
+
+def test_quote_fields_keep_the_key(connect):
+    iress = connect()
+    df = iress.get_quotes(tickers=['S001.ASX', 'BAD1.ASX'], fields=['LastPrice'])
+    assert list(df.columns) == ['ErrorNumber', 'LastPrice']
+    assert df.index.names == ['SecurityCode', 'Exchange', 'DataSource']
+    assert df.attrs['errors'] == [('BAD1', 'ASX', 1)]
+
+
+@pytest.mark.parametrize('call', sorted(CALLS))
+def test_compact_frames(connect, call):
+    fetch = CALLS[call][0]
+    full, compact = fetch(connect(), None), fetch(connect(compact=True), None)
+    assert list(compact.columns) == list(full.columns)
+    assert compact.memory_usage(deep=True).sum() < full.memory_usage(deep=True).sum()
+    for name in full.columns:
+        if name.endswith('Price'):
+            assert compact[name].dtype == np.float32
+            np.testing.assert_allclose(compact[name], full[name], rtol=1e-6)
+        elif name in ('SecurityCode', 'Exchange', 'DataSource', 'exchange'):
+            assert isinstance(compact[name].dtype, pd.CategoricalDtype)
+        else:
+            pd.testing.assert_series_equal(compact[name], full[name], check_dtype=False, check_categorical=False)
+
+
+def test_compact_cached_time_series(tmp_path, connect):
+    iress = connect(compact=True, cache=str(tmp_path / 'cache.sqlite'))
+    fresh = iress.time_series('2019-01-01', '2019-03-31', 'S001', 'ASX', fields=['ClosePrice', 'TradeCount'])
+    cached = iress.time_series('2019-01-01', '2019-03-31', 'S001', 'ASX', fields=['ClosePrice', 'TradeCount'])
+    assert isinstance(iress.cache, TimeSeriesCache)
+    pd.testing.assert_frame_equal(cached, fresh)
+    assert cached.ClosePrice.dtype == np.float32
@@ -0,0 +1,36 @@
+import pandas as pd
+
+START, END = pd.Timestamp('2019-01-01'), pd.Timestamp('2019-03-31')
+TICKERS = ['S%03d' % i for i in range(8)]
+
+
+def test_long_frame(connect):
+    iress = connect()
+    df = iress.get_many(START, END, 'time_series', TICKERS[:3], 'ASX')
+    assert df.index.names == ['TimeSeriesDate', 'ticker']
+    assert list(df.index.get_level_values('ticker').unique()) == TICKERS[:3]
+    pd.testing.assert_series_equal(df.xs('S001', level='ticker').ClosePrice,
+                                   iress.time_series(START, END, 'S001', 'ASX').ClosePrice)
+    assert df.attrs == {'failed': {}, 'partial': {}}
+
+
+def test_workers_overlap(in_flight, connect):
+    requests = in_flight('TimeSeriesGet2')
+    df = connect(pool_size=8).get_many(START, END, 'time_series', TICKERS, 'ASX', workers=8)
+    assert len(df) == len(TICKERS) * len(pd.bdate_range(START, END))
+    assert requests.peak > 1
+
+
+def test_failed_tickers_do_not_abort(connect):
+    iress = connect()
+    df = iress.get_many(START, END, 'time_series', ['S001', 'BAD1', 'S002'], 'ASX', workers=3)
+    assert list(df.attrs['failed']) == ['BAD1']
+    assert 'not found' in df.attrs['failed']['BAD1']
+    assert set(df.index.get_level_values('ticker')) == {'S001', 'S002'}
+    assert iress.last_status['failed'] == df.attrs['failed']
+
+
+def test_every_ticker_failed(connect):
+    df = connect().get_many(START, END, 'time_series', ['BAD1', 'BAD2'], 'ASX', workers=2)
+    assert len(df) == 0
+    assert sorted(df.attrs['failed']) == ['BAD1', 'BAD2']
@@ -0,0 +1,36 @@
+import pandas as pd
+
+from pyiress.pyiress import _split_range, intraday_window
+
+START, END = pd.Timestamp('2019-03-04 09:00'), pd.Timestamp('2019-03-29 17:00')
+
+
+def test_windows():
+    assert intraday_window('minutes', 1) == pd.Timedelta(days=7)
+    assert intraday_window('minutes', 15) == pd.Timedelta(days=30)
+    assert intraday_window('minutes', 60) == pd.Timedelta(days=60)
+    assert intraday_window('trades', 10) == pd.Timedelta(days=20)
+    windows = _split_range(START, END, pd.Timedelta(days=7))
+    assert windows[0][0] == START and windows[-1][1] == END
+    assert all(a[1] == b[0] for a, b in zip(windows, windows[1:]))
+    assert all(end - start <= pd.Timedelta(days=7) for start, end in windows)
+
+
+def test_windows_fetched_concurrently(in_flight, connect):
+    requests = in_flight('TimeSeriesIntraDayGet2', 0.1)
+    iress = connect()
+    df = iress.time_series_intraday('S001', 'ASX', START, END, interval=5)
+    assert requests.peak > 1
+    serial = iress.time_series_intraday('S001', 'ASX', START, END, interval=5, workers=1)
+    pd.testing.assert_frame_equal(df, serial)
+    # bars on the edges of the windows are not repeated
+    assert df.index.is_unique and df.index.is_monotonic_increasing
+    assert len(df) == 20 * 6 * 12
+
+
+def test_failed_windows_are_partial(server, connect):
+    server.fault_rate = 1.0
+    df = connect(raise_on_error=False, retry=False).time_series_intraday('S001', 'ASX', START, END, interval=5)
+    partial = df.attrs['partial']
+    assert len(df) == 0 and partial['complete_to'] is None
+    assert partial['missing'] == _split_range(START, END, intraday_window('minutes', 5))
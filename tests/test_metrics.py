@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from pyiress.aio import AsyncIress
+from pyiress.metrics import REGISTRY, MetricsRegistry
+
+
+def test_records_and_registry(connect):
+    registry, records = MetricsRegistry(), []
+    iress = connect(metrics=registry)
+    iress.add_hook(records.append)
+    iress.time_series('2019-01-01', '2019-03-31', 'S001', 'ASX')
+    with pytest.raises(Exception):
+        iress.time_series('2019-01-01', '2019-03-31', 'BAD1', 'ASX')
+    assert iress.registry is registry
+
+    ok, failed = records[0], records[-1]
+    assert ok['operation'] == 'TimeSeriesGet2' and ok['security'] == 'S001' and ok['securities'] == 1
+    assert ok['rows'] > 0 and ok['response_bytes'] > 0 and ok['error'] is None
+    assert ok['total'] >= ok['network'] > 0
+    assert failed['security'] == 'BAD1' and failed['error']
+    assert iress.last_status is failed
+
+    summary = registry.summary()['TimeSeriesGet2']
+    assert summary['calls'] == len(records) and summary['errors'] == 1
+    assert summary['rows'] == sum(r['rows'] or 0 for r in records)
+    assert registry.top_securities(1)[0][:2] in [('TimeSeriesGet2', 'S001'), ('TimeSeriesGet2', 'BAD1')]
+    text = registry.to_prometheus()
+    assert 'pyiress_calls_total{operation="TimeSeriesGet2",status="error"} 1' in text
+    assert 'pyiress_request_seconds_count{operation="TimeSeriesGet2",phase="total"} %d' % len(records) in text
+
+
+def test_default_registry_and_failing_hook(connect):
+    calls = REGISTRY.summary().get('PricingQuoteGet', {}).get('calls', 0)
+    iress = connect(metrics=True)
+
+    def broken(record):
+        raise RuntimeError('hook failed')
+    iress.add_hook(broken)
+    with pytest.warns(UserWarning, match='hook failed'):
+        iress.get_quotes(tickers=['S001.ASX'])
+    assert REGISTRY.summary()['PricingQuoteGet']['calls'] == calls + 1
+    iress.remove_hook(broken)
+    assert connect(metrics=False).registry is None
+
+
+def test_async_registry_and_pool_metrics(server):
+    registry, records = MetricsRegistry(), []
+
+    async def main():
+        async with AsyncIress('company', 'user', 'password', url=server.url, wsdl_cache=False,
+                              metrics=registry, circuit_breaker=True) as iress:
+            iress.add_hook(records.append)
+            await iress.get_many('2019-01-01', '2019-03-31', 'time_series', ['S001', 'S002'], 'ASX')
+            return iress.registry, iress.metrics()
+
+    held, metrics = asyncio.run(main())
+    assert held is registry
+    assert registry.summary()['TimeSeriesGet2']['calls'] == len(records) > 0
+    assert metrics['active'] == 0 and metrics['relogins'] == 0
+    assert metrics['circuit'] is not None
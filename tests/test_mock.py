@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from pyiress import IndexConstituents, PyIressException
+
+START, END = pd.Timestamp('2019-01-01'), pd.Timestamp('2019-06-30')
+TICKERS = ['S%03d' % i for i in range(8)]
+
+
+def test_expired_session_logs_in_once(server, connect):
+    iress = connect(pool_size=8)
+    logins = server.requests['IRESSSessionStart']
+    server.expire_sessions()
+    df = iress.get_many(START, END, 'time_series', TICKERS, 'ASX', workers=8)
+    assert df.attrs['failed'] == {}
+    assert server.requests['IRESSSessionStart'] == logins + 1
+    assert iress.sessions.metrics()['relogins'] == 1
+
+
+def test_paging_cursor_terminates(server, connect):
+    server.page_size = 20
+    df = connect().time_series(START, END, 'S001', 'ASX')
+    days = pd.bdate_range(START, END)
+    assert list(df.index) == list(days)
+    # one request per full page, and one ending on an empty page
+    assert server.requests['TimeSeriesGet2'] <= len(days) // 20 + 2
+
+
+def test_cached_dtypes_match(tmp_path, connect):
+    fetched = connect().time_series(START, END, 'S001', 'ASX')
+    iress = connect(cache=str(tmp_path / 'cache.sqlite'))
+    iress.time_series(START, END, 'S001', 'ASX')
+    cached = iress.time_series(START, END, 'S001', 'ASX')
+    pd.testing.assert_frame_equal(cached, fetched, check_freq=False)
+
+
+def test_cached_top_up_failure_reports_missing_range(tmp_path, server, connect):
+    iress = connect(cache=str(tmp_path / 'cache.sqlite'), raise_on_error=False, retry=False)
+    iress.time_series('2019-03-01', END, 'S001', 'ASX')
+    server.fault_rate = 1.0
+    partial = iress.time_series(START, '2019-09-30', 'S001', 'ASX').attrs['partial']
+    assert partial['complete_to'] is None
+    assert partial['missing'] == [(START, pd.Timestamp('2019-02-28')),
+                                  (pd.Timestamp('2019-07-01'), pd.Timestamp('2019-09-30'))]
+
+
+def test_constituents_do_not_cover_failed_chunks(server, connect):
+    constituents = IndexConstituents(connect(raise_on_error=False, retry=False))
+    held = constituents.load('XJO', '2015-01-01', '2015-12-31')
+    server.fault_rate = 1.0
+    with pytest.raises(PyIressException):
+        constituents.load('XJO', '2014-01-01', '2016-06-30')
+    assert constituents['XJO'] is held
@@ -0,0 +1,76 @@
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pyiress import Panel, PanelBuilder
+
+
+def _frame(dates, close, code='x'):
+    return pd.DataFrame({'ClosePrice': close, 'TotalVolume': np.arange(len(dates), dtype=np.int64),
+                         'Code': code}, index=pd.DatetimeIndex(dates, name='TimeSeriesDate'))
+
+
+def test_build_on_the_union_of_dates():
+    builder = PanelBuilder()
+    builder.add('AAA', _frame(['2019-01-02', '2019-01-03'], [1.0, 2.0]))
+    builder.add('BBB', _frame(['2019-01-03', '2019-01-04'], [3.0, 4.0]))
+    builder.add('EMPTY', _frame([], []))
+    panel = builder.build(['BBB', 'AAA', 'NONE'])
+    # numeric columns of the first frame only
+    assert panel.fields == ['ClosePrice', 'TotalVolume']
+    assert panel.shape == (2, 3, 3)
+    assert list(panel.tickers) == ['BBB', 'AAA', 'NONE']
+    close = panel['ClosePrice']
+    np.testing.assert_array_equal(close.AAA, [1.0, 2.0, np.nan])
+    np.testing.assert_array_equal(close.BBB, [np.nan, 3.0, 4.0])
+    assert close.NONE.isna().all()
+    assert panel.values['TotalVolume'].dtype == np.float64
+    # the frame is a view on the panel array
+    assert np.shares_memory(close.to_numpy(), panel.values['ClosePrice'])
+
+
+def test_concurrent_adds():
+    builder = PanelBuilder(['ClosePrice'])
+    dates = pd.date_range('2019-01-01', periods=50)
+    threads = [threading.Thread(target=builder.add, args=('T%02d' % i, _frame(dates, np.full(50, float(i)))))
+               for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    panel = builder.build()
+    assert sorted(panel.tickers) == ['T%02d' % i for i in range(20)]
+    assert (panel['ClosePrice'].T02 == 2.0).all()
+
+
+def test_loc_and_to_long():
+    builder = PanelBuilder(['ClosePrice'])
+    builder.add('AAA', _frame(['2019-01-02', '2019-01-03', '2019-01-04'], [1.0, 2.0, 3.0]))
+    builder.add('BBB', _frame(['2019-01-04'], [4.0]))
+    panel = builder.build()
+    panel.attrs['failed'] = {'CCC': 'error'}
+    sub = panel.loc('2019-01-03', None, tickers=['BBB'])
+    assert sub.shape == (1, 2, 1) and sub.attrs == panel.attrs
+    with pytest.raises(KeyError):
+        panel.loc(tickers=['CCC'])
+    long = panel.to_long()
+    assert list(long.ClosePrice) == [1.0, 2.0, 3.0, 4.0]
+    assert long.index[-1] == (pd.Timestamp('2019-01-04'), 'BBB')
+    assert long.attrs['failed'] == {'CCC': 'error'}
+    assert len(panel.to_long(dropna=False)) == 6
+
+
+def test_get_many_panel_matches_long(connect):
+    iress = connect()
+    tickers = ['S001', 'S002', 'BAD1']
+    long = iress.get_many('2019-01-01', '2019-06-30', 'time_series', tickers, 'ASX', fields=['ClosePrice'])
+    panel = iress.get_many('2019-01-01', '2019-06-30', 'time_series', tickers, 'ASX', layout='panel',
+                           fields=['ClosePrice'])
+    assert isinstance(panel, Panel)
+    assert list(panel.attrs['failed']) == ['BAD1']
+    close = panel['ClosePrice']
+    for ticker in ('S001', 'S002'):
+        expected = long.xs(ticker, level=1).ClosePrice.astype(float)
+        np.testing.assert_array_equal(close[ticker].dropna().to_numpy(), expected.to_numpy())
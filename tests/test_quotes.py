@@ -0,0 +1,53 @@
+import pandas as pd
+
+from pyiress.pyiress import QUOTE_ARRAY_LIMIT, _quote_requests
+
+
+def test_requests_are_chunked():
+    tickers = ['S%04d.ASX' % i for i in range(2500)]
+    chunks = [r['Parameters']['SecurityTextArray']['SecurityText'] for r in _quote_requests(tickers=tickers)]
+    assert [len(chunk) for chunk in chunks] == [QUOTE_ARRAY_LIMIT, QUOTE_ARRAY_LIMIT, 500]
+    assert sum(chunks, []) == tickers
+    codes = _quote_requests(ticker=['S%04d' % i for i in range(1200)], exchange='ASX')
+    assert [len(r['Parameters']['ExchangeArray']['Exchange']) for r in codes] == [1000, 200]
+
+
+def test_chunks_over_the_server_cap(server, connect):
+    tickers = ['S%04d.ASX' % i for i in range(2100)]
+    df = connect().get_quotes(tickers=tickers)
+    assert server.requests['PricingQuoteGet'] == 3
+    assert len(df) == 2100 and df.index.is_unique
+    assert df.index.names == ['SecurityCode', 'Exchange', 'DataSource']
+
+
+def test_error_rows(connect):
+    df = connect().get_quotes(tickers=['S001.ASX', 'BAD1.ASX', 'BAD2.ASX'])
+    assert list(df.index.get_level_values('SecurityCode')) == ['S001']
+    assert df.attrs['errors'] == [('BAD1', 'ASX', 1), ('BAD2', 'ASX', 1)]
+
+
+def _fail_after_first(server):
+    '''Mock server latency letting the first PricingQuoteGet through and failing the others.'''
+    calls = []
+
+    def latency(operation):
+        if operation == 'PricingQuoteGet':
+            calls.append(operation)
+            server.fault_rate = 0.0 if len(calls) == 1 else 1.0
+        return 0
+    return latency
+
+
+def test_partial_results_concatenate(server, connect):
+    iress = connect(raise_on_error=False, retry=False)
+    results = []
+    for first in ('S', 'T'):
+        server.latency = _fail_after_first(server)
+        tickers = ['BAD1.ASX'] + ['%s%04d.ASX' % (first, i) for i in range(1500)]
+        results.append(iress.get_quotes(tickers=tickers, workers=1))
+    for df in results:
+        assert len(df) == QUOTE_ARRAY_LIMIT - 1
+        assert df.attrs['errors'] == [('BAD1', 'ASX', 1)]
+        assert len(df.attrs['partial']['missing']) == 501
+    df = pd.concat(results)
+    assert len(df) == 2 * (QUOTE_ARRAY_LIMIT - 1)
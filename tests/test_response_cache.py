@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from pyiress.cache import ResponseCache
+
+PARAMETERS = {'Header': {'SessionKey': 'a'}, 'Parameters': {'SecurityCode': 'S001'}}
+
+
+class _Fetch(object):
+    '''Counts the calls of a fetch function, which returns a new frame each time.'''
+    def __init__(self, seconds=0.0, error=None):
+        self.calls = 0
+        self.seconds = seconds
+        self.error = error
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.seconds)
+        if self.error is not None:
+            raise self.error
+        return pd.DataFrame({'LastPrice': [float(self.calls)] * 3})
+
+
+def test_hits_return_copies():
+    cache, fetch = ResponseCache(), _Fetch()
+    df = cache.fetch('TimeSeriesGet2', PARAMETERS, fetch)
+    df.loc[0, 'LastPrice'] = -1.0
+    # another session key is the same request
+    again = cache.fetch('TimeSeriesGet2', dict(PARAMETERS, Header={'SessionKey': 'b'}), fetch)
+    again.loc[1, 'LastPrice'] = -1.0
+    assert fetch.calls == 1
+    assert list(cache.fetch('TimeSeriesGet2', PARAMETERS, fetch).LastPrice) == [1.0] * 3
+    assert cache.metrics()['hits'] == 2 and cache.metrics()['misses'] == 1
+
+
+def test_ttl():
+    cache, fetch = ResponseCache(ttl={'PricingQuoteGet': 0.05, 'TimeSeriesIntraDayGet2': 0}), _Fetch()
+    cache.fetch('PricingQuoteGet', PARAMETERS, fetch)
+    cache.fetch('PricingQuoteGet', PARAMETERS, fetch)
+    assert fetch.calls == 1
+    time.sleep(0.06)
+    assert cache.fetch('PricingQuoteGet', PARAMETERS, fetch).LastPrice[0] == 2.0
+    assert cache.metrics()['expirations'] == 1
+    # a ttl of 0 is not cached
+    cache.fetch('TimeSeriesIntraDayGet2', PARAMETERS, fetch)
+    cache.fetch('TimeSeriesIntraDayGet2', PARAMETERS, fetch)
+    assert fetch.calls == 4 and len(cache) == 1
+
+
+def test_identical_requests_coalesce():
+    cache, fetch = ResponseCache(), _Fetch(seconds=0.1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.fetch('TimeSeriesGet2', PARAMETERS, fetch)))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fetch.calls == 1 and len(results) == 4
+    assert cache.metrics()['coalesced'] == 3
+    assert len(set(id(df) for df in results)) == 4
+
+
+def test_errors_are_not_cached():
+    cache, fetch = ResponseCache(), _Fetch(error=RuntimeError('fault'))
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            cache.fetch('TimeSeriesGet2', PARAMETERS, fetch)
+    assert fetch.calls == 2 and len(cache) == 0
+
+
+def test_least_recently_used_evicted():
+    fetch = _Fetch()
+    nbytes = int(fetch().memory_usage(index=True, deep=True).sum())
+    cache = ResponseCache(max_bytes=2 * nbytes)
+    for code in ('S001', 'S002', 'S001', 'S003'):
+        cache.fetch('TimeSeriesGet2', {'Parameters': {'SecurityCode': code}}, fetch)
+    assert cache.metrics()['evictions'] == 1
+    assert sorted(key[1] for key in cache._entries) == [
+        '{"Parameters": {"SecurityCode": "S001"}}', '{"Parameters": {"SecurityCode": "S003"}}']
+
+
+def test_client_shares_responses(server, connect):
+    iress = connect(response_cache=True)
+    df = iress.time_series('2019-01-01', '2019-03-31', 'S001', 'ASX')
+    requests = server.requests['TimeSeriesGet2']
+    closes = iress.time_series('2019-01-01', '2019-03-31', 'S001', 'ASX', fields=['ClosePrice'])
+    # the pages are cached whole and projected to the fields asked for
+    assert server.requests['TimeSeriesGet2'] == requests
+    assert list(closes.columns) == ['ClosePrice']
+    pd.testing.assert_series_equal(closes.ClosePrice, df.ClosePrice)
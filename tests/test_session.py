@@ -0,0 +1,85 @@
+import itertools
+import threading
+
+import pytest
+
+from pyiress.session import SessionPool, session_expired
+
+
+class _Logins(object):
+    '''start_session for SessionPool counting the logins, failing those listed in fail.'''
+    def __init__(self, fail=()):
+        self.count = itertools.count(1)
+        self.fail = set(fail)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls = next(self.count)
+        if self.calls in self.fail:
+            raise RuntimeError('login %d failed' % self.calls)
+        return 'k%d' % self.calls, 't%d' % self.calls
+
+
+def test_session_expired():
+    assert session_expired('IRESS session has expired or is invalid')
+    assert not session_expired('Security BAD not found')
+
+
+def test_concurrent_callers_share_a_session():
+    logins = _Logins()
+    pool = SessionPool(logins, size=1)
+    sessions = [pool.acquire() for _ in range(4)]
+    assert len(set(map(id, sessions))) == 1
+    assert pool.metrics()['active'] == 4
+    for session in sessions:
+        pool.release(session)
+    assert logins.calls == 1
+    assert pool.metrics()['active'] == 0
+
+
+def test_callers_are_spread_over_the_pool():
+    pool = SessionPool(_Logins(), size=2)
+    sessions = [pool.acquire() for _ in range(4)]
+    assert sorted(session.users for session in set(sessions)) == [2, 2]
+
+
+def test_expired_session_logs_in_once():
+    logins = _Logins()
+    pool = SessionPool(logins, size=1)
+    sessions = [pool.acquire() for _ in range(8)]
+    key = sessions[0].key
+    barrier = threading.Barrier(len(sessions))
+
+    def relogin(session):
+        barrier.wait()
+        pool.relogin(session, key)
+
+    threads = [threading.Thread(target=relogin, args=(session,)) for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert logins.calls == 2
+    assert pool.relogins == 1
+    assert sessions[0].key == 'k2'
+
+
+def test_failed_relogin_does_not_wedge_the_pool():
+    logins = _Logins(fail=[2])
+    pool = SessionPool(logins, size=1, max_age=0)
+    pool.release(pool.acquire())
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+    assert pool.metrics()['active'] == 0
+    session = pool.acquire()
+    assert session.key == 'k3'
+    pool.release(session)
+
+
+def test_failed_login_frees_the_slot():
+    pool = SessionPool(_Logins(fail=[1]), size=1)
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+    session = pool.acquire()
+    assert session.key == 'k2'
+    assert pool.metrics()['sessions'] == 1
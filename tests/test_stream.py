@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pandas as pd
+
+from pyiress.stream import QuoteStream
+
+TICKERS = ['AAA.ASX', 'BBB.ASX', 'CCC.ASX']
+
+
+class _Quotes(object):
+    '''Stands in for Iress.get_quotes: every poll moves LastPrice, `fail` lists the polls that raise.'''
+    def __init__(self, fail=()):
+        self.calls = 0
+        self.fail = set(fail)
+        self.polled = threading.Event()
+
+    def get_quotes(self, tickers):
+        self.calls += 1
+        if self.calls >= 3:
+            self.polled.set()
+        if self.calls in self.fail:
+            raise RuntimeError('poll %d failed' % self.calls)
+        index = pd.MultiIndex.from_tuples([(t.split('.')[0], 'ASX', 'ASX') for t in tickers],
+                                          names=['SecurityCode', 'Exchange', 'DataSource'])
+        df = pd.DataFrame({'LastPrice': [float(self.calls)] * len(tickers)}, index=index)
+        # as get_quotes did before its errors became tuples
+        df.attrs['errors'] = pd.DataFrame({'ErrorNumber': [1]})
+        return df
+
+
+def _wait(stream, quotes):
+    assert quotes.polled.wait(5)
+    while stream.polls < 3:
+        time.sleep(0.01)
+
+
+def test_polls_coalesce_when_not_consumed():
+    quotes = _Quotes()
+    stream = QuoteStream(quotes, TICKERS, interval=0.01).start()
+    try:
+        _wait(stream, quotes)
+        assert stream._threads[0].is_alive()
+        delta = stream.get(timeout=1)
+        assert stream.errors == 0
+        assert len(delta) == len(TICKERS)
+        assert (delta.LastPrice > 1).all()
+        assert stream.coalesced >= len(TICKERS)
+    finally:
+        stream.stop()
+
+
+def test_failed_poll_keeps_polling():
+    quotes = _Quotes(fail=[2])
+    stream = QuoteStream(quotes, TICKERS, interval=0.01).start()
+    try:
+        _wait(stream, quotes)
+        assert stream.errors == 1
+        assert 'poll 2 failed' in str(stream.last_error)
+        assert stream._threads[0].is_alive()
+        assert stream.get(timeout=1) is not None
+    finally:
+        stream.stop()
+
+
+def test_only_changed_rows():
+    quotes = _Quotes()
+    stream = QuoteStream(quotes, TICKERS)
+    assert len(stream.poll()) == 3
+    quotes.calls -= 1
+    assert len(stream.poll()) == 0
+
+
+def test_stream_from_mock(connect):
+    iress = connect()
+    received = []
+    with iress.stream_quotes(['S001.ASX', 'S002.ASX', 'BAD1.ASX'], interval=0.05) as stream:
+        for delta in stream:
+            received.append(delta)
+            break
+    assert list(received[0].index.get_level_values('SecurityCode')) == ['S001', 'S002']
+    assert received[0].attrs['errors'] == [('BAD1', 'ASX', 1)]
+    assert stream.metrics()['emitted'] == 2